@@ -0,0 +1,55 @@
+import random
+
+# Synthetic court decisions
+# Shaped after the documents submitted to the API: numbered paragraphs,
+# a few headings and lists, light emphasis and `---X---` page markers.
+
+WORDS = (
+    "le tribunal la cour partie requérante défenderesse recours moyen article "
+    "loi arrêt décision appel jugement considérant que attendu dès lors en "
+    "l'espèce il y a lieu de déclarer fondé recevable non à titre subsidiaire "
+    "het hof de verzoekende partij beroep middel wet vonnis overwegende dat "
+    "gelet op ontvankelijk gegrond der die das Gericht Urteil"
+).split()
+
+SPECIAL = ['p. 12', 'c. Belgique', 'art. 5', '50%', '« oui »', '*premier*', '**définitif**', 'n° 3', 'M. X']
+
+
+def sentence(rnd):
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(6, 20))]
+    if rnd.random() < 0.3:
+        words.insert(rnd.randint(0, len(words)), rnd.choice(SPECIAL))
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(rnd, number):
+    lines = [sentence(rnd) for _ in range(rnd.randint(1, 5))]
+    if number and rnd.random() < 0.5:
+        lines[0] = f'{number}. {lines[0]}'
+    return '\n'.join(lines)
+
+
+def decision(size, seed=0):
+    """
+    Build a decision of about `size` characters
+    """
+    rnd = random.Random(seed)
+    blocks = ['# Arrêt']
+    page = 1
+    number = 1
+    length = 0
+    while length < size:
+        r = rnd.random()
+        if r < 0.03:
+            block = f"## {rnd.choice(['Faits', 'En droit', 'Dispositif', 'Procédure'])}"
+        elif r < 0.08:
+            block = '\n'.join(f'- {sentence(rnd)}' for _ in range(rnd.randint(2, 5)))
+        elif r < 0.15:
+            page += 1
+            block = f'---{page}---'
+        else:
+            block = paragraph(rnd, number)
+            number += 1
+        blocks.append(block)
+        length += len(block) + 2
+    return '\n\n'.join(blocks)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Fill a local database with synthetic decisions, for load tests
+
+    python -m bench.load_corpus [--config file] [--init] [--count 10000]
+
+Documents are stored like `bulk` does (derived html, pages, stats, labels
+and links), from 2 KB to 200 KB by default with most of them small, spread
+over a few courts and years. A share of them is made public, so the public
+views have something to serve. `--init` creates the tables first and is
+meant for an empty database. Ark jobs are not queued unless `--jobs` is set.
+"""
+import asyncio
+import math
+import random
+
+from bench.corpus import decision
+from data_api.cli import get_parser, get_pool
+from data_api.deps import logger
+from data_api.lib_bulk import ingest
+from data_api.lib_cfg import load
+from data_api.models import SubmitModel, User
+
+SCHEMAS = (
+    'ressources/ecli_document_schema.sql',
+    'ressources/tags_schema.sql',
+    'ressources/jobs_schema.sql',
+)
+COURTS = ('RSCE', 'CASS', 'GHCC', 'CABRL', 'CTLIE', 'TPIBRL')
+LABELS = ('COVID-19', 'anatocisme', 'bail', 'responsabilité', 'marchés publics', 'droit des étrangers', 'fiscal')
+LANGS = ('FR', 'FR', 'NL', 'NL', 'DE')
+LOADER = User(email='loader@loadtest.local', username='loader', valid=True, admin=False)
+
+
+def record(rnd, num, min_size, max_size):
+    # Log-uniform sizes: many short decisions, a few long ones
+    size = int(math.exp(rnd.uniform(math.log(min_size), math.log(max_size))))
+    court = rnd.choice(COURTS)
+    year = rnd.randint(2000, 2022)
+    return SubmitModel(**{
+        '_v': 1,
+        '_timestamp': 1239120938,
+        'country': 'BE',
+        'court': court,
+        'year': year,
+        'identifier': f'LT.{num}',
+        'text': decision(size, seed=num),
+        'lang': rnd.choice(LANGS),
+        'appeal': rnd.choice(('yes', 'no', 'nodata')),
+        'user_key': 'loader',
+        'doc_links': [
+            {'kind': 'ecli', 'link': f'ECLI:BE:{court}:{year}:LT.{rnd.randint(1, num)}', 'label': f'Arrêt {i}'}
+            for i in range(rnd.randint(0, 4))
+        ],
+        'labels': rnd.sample(LABELS, rnd.randint(0, 3)),
+        'terms': [],
+    })
+
+
+async def run_load(count, batch, min_size, max_size, public, init, jobs, seed):
+    pool = await get_pool()
+    rnd = random.Random(seed)
+    async with pool.acquire() as db:
+        if init:
+            for schema in SCHEMAS:
+                with open(schema, encoding='utf8') as f:
+                    await db.execute(f.read())
+            logger.info('Tables created')
+
+        # Follow the LT. identifiers of previous loads: internal ids also count
+        # documents created otherwise, and would not rule out a duplicate
+        start = await db.fetchval("""
+        SELECT COALESCE(MAX(substring(identifier from 'LT\\.(\\d+)')::int), 0)
+        FROM ecli_document
+        WHERE identifier LIKE 'LT.%'
+        """)
+        total = 0
+        for first in range(start + 1, start + count + 1, batch):
+            records = [
+                (num, record(rnd, num, min_size, max_size))
+                for num in range(first, min(first + batch, start + count + 1))
+            ]
+            created, errors = await ingest(db, records, LOADER, jobs=jobs)
+            for error in errors:
+                logger.warning('Document %s: %s', error['line'], error['error'])
+            ids = [doc['id'] for doc in created if rnd.random() < public]
+            await db.execute("""
+            UPDATE ecli_document SET status = 'public' WHERE id_internal = ANY($1::int[])
+            """, ids)
+            total += len(created)
+            logger.info('%s documents stored', total)
+
+        await db.execute("ANALYZE ecli_document")
+        await db.execute("ANALYZE ecli_links")
+
+    await pool.close()
+
+
+def main():
+    parser = get_parser('Fill the database with synthetic decisions')
+    parser.add_argument('--count', dest='count', type=int, default=10000, help='Documents to add')
+    parser.add_argument('--batch', dest='batch', type=int, default=200, help='Documents stored at once')
+    parser.add_argument('--min-size', dest='min_size', type=int, default=2000, help='Smallest text, in characters')
+    parser.add_argument('--max-size', dest='max_size', type=int, default=200000, help='Largest text, in characters')
+    parser.add_argument('--public', dest='public', type=float, default=0.9, help='Share of public documents')
+    parser.add_argument('--init', dest='init', action='store_true', default=False,
+                        help='Create the tables first (drops existing ones)')
+    parser.add_argument('--jobs', dest='jobs', action='store_true', default=False,
+                        help='Queue ark minting jobs for the documents')
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    args = parser.parse_args()
+    load(args.config)
+
+    asyncio.run(run_load(
+        args.count, args.batch, args.min_size, args.max_size, args.public, args.init, args.jobs, args.seed
+    ))
+
+
+if __name__ == "__main__":
+    main()
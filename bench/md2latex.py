@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Compare the in-process latex converter with pandoc
+
+    python -m bench.md2latex
+"""
+import asyncio
+import shutil
+import time
+
+from bench.corpus import decision
+from data_api import lib_md
+from data_api.lib_parse import pandoc2latex
+
+SIZES = [5000, 50000, 500000]
+ROUNDS = 10
+
+
+async def main():
+    has_pandoc = shutil.which('pandoc')
+    print(f"{'size':>8} {'native ms':>10} {'pandoc ms':>10}")
+    for size in SIZES:
+        text = decision(size)
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            lib_md.md2latex(text)
+        native = (time.perf_counter() - start) / ROUNDS * 1000
+
+        pandoc = float('nan')
+        if has_pandoc:
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                await pandoc2latex(text)
+            pandoc = (time.perf_counter() - start) / ROUNDS * 1000
+
+        print(f'{size:>8} {native:>10.2f} {pandoc:>10.2f}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Per request latency of the document page query, against the configured
+database (view counters of the sampled documents are restored afterwards)
+
+    python -m bench.page_query [--config file] [--rounds 200]
+
+"before" is the former path: document row, then its links, then the view
+counter update, as the handler ran them. "after" is the single query of the views.
+"""
+import asyncio
+import statistics
+import time
+
+from data_api.cli import get_parser, get_pool
+from data_api.lib_cfg import load
+from data_api.lib_sql import STATEMENTS
+
+SQL_ROW = """
+SELECT id_internal, ecli, html, CASE WHEN html IS NULL THEN text END AS text,
+    appeal, meta->'labels' AS labels, hash, date_created, date_updated
+FROM ecli_document
+WHERE ecli = $1
+AND status = 'public'
+"""
+
+SQL_LINKS = """
+SELECT target_type, target_identifier, target_label
+FROM ecli_links
+WHERE id_internal = $1
+"""
+
+SQL_VIEWS = """
+UPDATE ecli_document SET views_public = views_public + 1 WHERE id_internal = $1
+"""
+
+SQL_RESET = """
+UPDATE ecli_document SET views_public = $2 WHERE id_internal = $1
+"""
+
+
+async def before(db, ecli):
+    res = await db.fetchrow(SQL_ROW, ecli)
+    await db.fetch(SQL_LINKS, res['id_internal'])
+    await db.execute(SQL_VIEWS, res['id_internal'])
+
+
+async def after(db, ecli):
+    await db.fetchrow(STATEMENTS['page_by_ecli'], ecli)
+
+
+async def measure(db, func, eclis):
+    timings = []
+    for ecli in eclis:
+        start = time.perf_counter()
+        await func(db, ecli)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return (
+        statistics.mean(timings),
+        timings[len(timings) // 2],
+        timings[int(len(timings) * 0.95)],
+    )
+
+
+async def main(rounds):
+    pool = await get_pool()
+    async with pool.acquire() as db:
+        rows = await db.fetch("""
+        SELECT id_internal, ecli, views_public FROM ecli_document
+        WHERE status = 'public' ORDER BY random() LIMIT $1
+        """, rounds)
+        eclis = [r['ecli'] for r in rows]
+        if not eclis:
+            print('No public documents')
+            return
+
+        try:
+            # Warm up connection and caches
+            await measure(db, before, eclis[:10])
+            await measure(db, after, eclis[:10])
+
+            print(f"{'path':>8} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+            for name, func in (('before', before), ('after', after)):
+                mean, p50, p95 = await measure(db, func, eclis)
+                print(f'{name:>8} {mean:>8.2f} {p50:>8.2f} {p95:>8.2f}')
+        finally:
+            # Outside of the timings: put back the counters "before" bumped
+            await db.executemany(SQL_RESET, [(r['id_internal'], r['views_public']) for r in rows])
+    await pool.close()
+
+
+if __name__ == "__main__":
+    parser = get_parser('Benchmark the document page query')
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    load(args.config)
+    asyncio.run(main(args.rounds))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the services the api calls: auth (`/u/by/*`, `/token`),
+ark minter (`/mint`, `/update`) and vocabulary (`/link`), with injected
+latency and errors, so the api can be load tested offline.
+
+    python -m bench.standins [--port 5020] [--latency ark=0.2] [--errors voc=0.05]
+
+Then run the api against them:
+
+    AUTH_URI=http://127.0.0.1:5020 ARK_URL=http://127.0.0.1:5020 \\
+    VOC_URI=http://127.0.0.1:5020 poetry run api
+
+Every user key and token is valid, those starting with `admin` belong to an
+admin and those starting with `invalid` are refused. Latencies are in
+seconds, spread by `--jitter` around the given value. Errors are 503
+responses, sent at the given rate. `GET /_stats` counts the calls.
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+import uvicorn
+from cryptography.fernet import InvalidToken
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from data_api.deps import get_fernet
+from data_api.lib_cfg import config
+
+SERVICES = ('auth', 'ark', 'voc')
+LATENCY = dict.fromkeys(SERVICES, 0.0)
+ERRORS = dict.fromkeys(SERVICES, 0.0)
+JITTER = 0.5
+CALLS = Counter()
+ARKS = {'next': 1}
+
+
+async def inject(service, name):
+    """
+    Wait like the real service would, return an error response when one is due
+    """
+    CALLS[name] += 1
+    latency = LATENCY[service]
+    if latency:
+        await asyncio.sleep(latency * random.uniform(1 - JITTER, 1 + JITTER))
+    if random.random() < ERRORS[service]:
+        CALLS[f'{name} error'] += 1
+        return JSONResponse({'detail': 'Injected error'}, status_code=503)
+    return None
+
+
+def user(value):
+    name = value.split('@')[0] or 'user'
+    return {
+        'email': value if '@' in value else f'{name}@loadtest.local',
+        'username': name,
+        'valid': True,
+        'admin': name.startswith('admin'),
+    }
+
+
+# ##################################################################### AUTH
+async def user_by(request):
+    field = request.path_params['field']
+    error = await inject('auth', f'auth /u/by/{field}')
+    if error:
+        return error
+    payload = await request.json()
+    try:
+        value = get_fernet(config.key('oj_key')).decrypt(payload[field].encode()).decode()
+    except (KeyError, InvalidToken):
+        return JSONResponse({'detail': 'Bad payload'}, status_code=400)
+    if value.startswith('invalid'):
+        return JSONResponse({'detail': 'Unknown user'}, status_code=401)
+    return JSONResponse(user(value))
+
+
+async def token(request):
+    error = await inject('auth', 'auth /token')
+    return error or JSONResponse({'access_token': 'loadtest', 'token_type': 'bearer', 'expires_in': 600})
+
+
+# ###################################################################### ARK
+async def mint(request):
+    error = await inject('ark', 'ark /mint')
+    if error:
+        return error
+    payload = await request.json()
+    ark = f"ark:/{payload.get('naan')}{payload.get('shoulder')}{ARKS['next']:08d}"
+    ARKS['next'] += 1
+    return JSONResponse({'ark': ark})
+
+
+async def update(request):
+    error = await inject('ark', 'ark /update')
+    return error or JSONResponse({'result': 'ok'})
+
+
+# ###################################################################### VOC
+async def link(request):
+    name = 'voc /link get' if request.method == 'GET' else 'voc /link set'
+    error = await inject('voc', name)
+    if error:
+        return error
+    if request.method == 'GET':
+        return JSONResponse({'data': []})
+    return JSONResponse({'result': 'ok'})
+
+
+async def stats(request):
+    return JSONResponse(dict(CALLS))
+
+
+app = Starlette(routes=[
+    Route('/u/by/{field}', user_by, methods=['POST']),
+    Route('/token', token, methods=['POST']),
+    Route('/mint', mint, methods=['POST']),
+    Route('/update', update, methods=['PUT']),
+    Route('/link', link, methods=['GET', 'POST']),
+    Route('/_stats', stats),
+])
+
+
+def service_values(parser, items):
+    """
+    Parse `service=value` (or `all=value`) options
+    """
+    values = {}
+    for item in items:
+        service, _, value = item.partition('=')
+        services = SERVICES if service == 'all' else (service,)
+        try:
+            value = float(value)
+        except ValueError:
+            parser.error(f'Bad value in {item}')
+        for name in services:
+            if name not in SERVICES:
+                parser.error(f"Unknown service {name}, use one of {', '.join(SERVICES)} or all")
+            values[name] = value
+    return values
+
+
+def main():
+    global JITTER  # pylint:disable=global-statement
+    parser = argparse.ArgumentParser(description='Stand-ins for the auth, ark and vocabulary services')
+    parser.add_argument('--host', dest='host', default='127.0.0.1')
+    parser.add_argument('--port', dest='port', type=int, default=5020)
+    parser.add_argument('--latency', dest='latency', action='append', default=[],
+                        help='Response time of a service in seconds, as service=0.05 (repeatable)')
+    parser.add_argument('--errors', dest='errors', action='append', default=[],
+                        help='Rate of 503 responses of a service, as service=0.01 (repeatable)')
+    parser.add_argument('--jitter', dest='jitter', type=float, default=JITTER,
+                        help='Latencies vary by this fraction around their value')
+    args = parser.parse_args()
+
+    LATENCY.update(service_values(parser, args.latency))
+    ERRORS.update(service_values(parser, args.errors))
+    JITTER = args.jitter
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the document conversion pipeline, on synthetic decisions
+
+    python -m bench.suite [--sizes 5000,50000] [--only txt2html,md2latex]
+                          [--output results.json] [--compare previous.json]
+
+Results are written as JSON so runs can be compared over time: `--compare`
+prints the change against a previous run, and with `--threshold 1.2` exits
+with an error when a benchmark got more than 20% slower.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from bench.corpus import decision
+from data_api import lib_md, lib_parse
+from data_api.deps import templates
+from data_api.lib_cfg import config
+from data_api.models import SubmitModel, UpdateModel
+
+SIZES = [5000, 50000, 500000, 2000000]
+# Rounds stop after this many seconds (at least MIN_ROUNDS are run)
+BUDGET = 2.0
+MIN_ROUNDS = 3
+MAX_ROUNDS = 100
+
+
+async def fixtures(size):
+    text = decision(size)
+    html = lib_parse.markdowner().convert(text.replace('_', '\\_'))
+    payload = {
+        '_v': 1,
+        '_timestamp': 1239120938,
+        'country': 'BE',
+        'court': 'RSCE',
+        'year': 2010,
+        'identifier': '999.999',
+        'text': text,
+        'lang': 'FR',
+        'appeal': 'nodata',
+        'user_key': 'OIJAS-OIQWE',
+        'doc_links': [{'kind': 'ecli', 'link': 'ECLI:BE:RSCE:2009:1', 'label': 'Arrêt 1'}] * 5,
+        'labels': ['COVID-19', 'anatocisme'],
+        'terms': [],
+    }
+    update = {k: v for k, v in payload.items() if k not in ('user_key', 'terms')}
+    update['status'] = 'public'
+    data = {'body': text, 'title': 'ECLI:BE:RSCE:2010:999.999'}
+    latex = None
+    if size <= 500000:
+        latex = await lib_parse.md2latex(data)
+    return {
+        'text': text,
+        'html': html,
+        'page': lib_parse.txt2html(text),
+        'data': data,
+        'latex': latex,
+        'submit': payload,
+        'update': update,
+    }
+
+
+def render_share(f):
+    return templates.get_template('share.html').render({
+        'request': None,
+        'ecli': f['data']['title'],
+        'text': f['page'],
+        'labels': f['submit']['labels'],
+        'appeal': 'nodata',
+        'elis': [],
+        'eclis': [{'name': 'Arrêt 1', 'id': 'ECLI:BE:RSCE:2009:1'}] * 5,
+        'hash': 'abcdef',
+        'ishash': False,
+    })
+
+
+# name: (function of the fixtures, largest size, required executable)
+BENCHES = {
+    'txt2html': (lambda f: lib_parse.txt2html(f['text']), None, None),
+    'page_breaks': (lambda f: lib_parse.page_breaks(f['html']), None, None),
+    'derive': (lambda f: lib_parse.derive(f['text']), None, None),
+    'md2latex': (lambda f: lib_parse.md2latex(f['data']), None, None),
+    'native_md2latex': (lambda f: lib_md.md2latex(f['text']), None, None),
+    'pandoc2latex': (lambda f: lib_parse.pandoc2latex(f['text']), None, 'pandoc'),
+    'latex2pdf': (lambda f: lib_parse.latex2pdf(f['latex']), 500000, 'pdflatex'),
+    'render_share': (render_share, None, None),
+    'submit_model': (lambda f: SubmitModel(**f['submit']), None, None),
+    'update_model': (lambda f: UpdateModel(**f['update']), None, None),
+}
+
+
+async def call(func, f):
+    res = func(f)
+    if inspect.isawaitable(res):
+        await res
+
+
+async def measure(func, f):
+    # Warm up caches (templates, regexes) outside of the timings
+    await call(func, f)
+    timings = []
+    total = 0
+    while len(timings) < MAX_ROUNDS and (len(timings) < MIN_ROUNDS or total < BUDGET):
+        start = time.perf_counter()
+        await call(func, f)
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed * 1000)
+        total += elapsed
+        # Slow enough: the spread says little, do not wait for minutes
+        if total > BUDGET * 5:
+            break
+    return timings
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(sizes, only):
+    # The in-process converter, pandoc is measured on its own
+    config.set(['render', 'latex'], 'native')
+    results = []
+    for size in sizes:
+        f = await fixtures(size)
+        for name, (func, max_size, needs) in BENCHES.items():
+            if only and name not in only:
+                continue
+            entry = {'bench': name, 'size': size}
+            if max_size and size > max_size:
+                continue
+            if needs and not shutil.which(needs):
+                results.append({**entry, 'skipped': f'{needs} not installed'})
+                continue
+            timings = await measure(func, f)
+            mean = statistics.mean(timings)
+            results.append({
+                **entry,
+                'rounds': len(timings),
+                'mean_ms': round(mean, 3),
+                'median_ms': round(statistics.median(timings), 3),
+                'min_ms': round(min(timings), 3),
+                'stdev_ms': round(statistics.stdev(timings), 3) if len(timings) > 1 else 0,
+                'mb_per_s': round(size / 1e6 / (mean / 1000), 2),
+            })
+            print(f"{name:>15} {size:>8} {mean:>10.2f} ms  ({len(timings)} rounds)", file=sys.stderr)
+    return results
+
+
+def compare(results, previous, threshold):
+    before = {(r['bench'], r['size']): r for r in previous['results'] if 'mean_ms' in r}
+    slower = []
+    print(f"{'bench':>15} {'size':>8} {'before ms':>10} {'after ms':>10} {'ratio':>6}", file=sys.stderr)
+    for r in results:
+        old = before.get((r['bench'], r['size']))
+        if old is None or 'mean_ms' not in r:
+            continue
+        ratio = r['mean_ms'] / old['mean_ms'] if old['mean_ms'] else float('inf')
+        flag = ''
+        if threshold and ratio > threshold:
+            flag = ' slower'
+            slower.append(r)
+        print(f"{r['bench']:>15} {r['size']:>8} {old['mean_ms']:>10.2f} {r['mean_ms']:>10.2f} {ratio:>6.2f}{flag}",
+              file=sys.stderr)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the document conversion pipeline')
+    parser.add_argument('--sizes', dest='sizes', default=','.join(map(str, SIZES)),
+                        help='Comma separated document sizes, in characters')
+    parser.add_argument('--only', dest='only', default='', help='Comma separated benchmarks to run')
+    parser.add_argument('--output', dest='output', default='-', help='Results file, stdout by default')
+    parser.add_argument('--compare', dest='compare', default=None, help='Previous results file')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=None,
+                        help='With --compare, fail when a mean time grows by more than this ratio')
+    args = parser.parse_args()
+
+    only = {name for name in args.only.split(',') if name}
+    if only - set(BENCHES):
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(only - set(BENCHES)))}")
+
+    results = asyncio.run(run([int(s) for s in args.sizes.split(',')], only))
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'pandoc': bool(shutil.which('pandoc')),
+            'pdflatex': bool(shutil.which('pdflatex')),
+        },
+        'results': results,
+    }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf8') as f:
+            previous = json.load(f)
+        if compare(results, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
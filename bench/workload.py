@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Scripted load against a running api, reporting throughput and latency
+percentiles by kind of request
+
+    python -m bench.workload [--url http://127.0.0.1:5000] [--duration 60]
+                             [--concurrency 20] [--mix browse=40,html=35,pdf=10,create=10,update=5]
+                             [--output results.json]
+
+Meant to run against an api backed by `bench.load_corpus` data and the
+`bench.standins` services: the admin token and user key are accepted by the
+stand-in auth service. Documents are picked among the public ones, listed
+from `/c/public` first.
+
+- browse: a level of the `/list` navigation (courts, years, documents)
+- html: a public document page, `/html/{ecli}`
+- pdf: a public document pdf, `/pdf/{ecli}`
+- create: a new document of 2 KB to 50 KB, `/create`
+- update: an editor round, `/d/read/{id}` then `/d/update/{id}`
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+from bench.corpus import decision
+
+MIX = {'browse': 40, 'html': 35, 'pdf': 10, 'create': 10, 'update': 5}
+
+
+class Workload:
+    def __init__(self, client, targets, user_key, admin_token, seed):
+        self.client = client
+        self.targets = targets
+        self.user_key = user_key
+        self.admin = {'Authorization': f'Bearer {admin_token}'}
+        self.rnd = random.Random(seed)
+        self.run_id = f'{int(time.time())}{seed}'
+        self.created = 0
+
+    async def browse(self):
+        country, court, year, _ = self.rnd.choice(self.targets)['ecli'].split(':')[1:]
+        level, data = self.rnd.choice((
+            ('court', {'country': country}),
+            ('year', {'country': country, 'court': court}),
+            ('document', {'country': country, 'court': court, 'year': year}),
+        ))
+        return await self.client.get('/list', params={'level': level, 'data': json.dumps(data)})
+
+    async def html(self):
+        return await self.client.get(f"/html/{self.rnd.choice(self.targets)['ecli']}")
+
+    async def pdf(self):
+        return await self.client.get(f"/pdf/{self.rnd.choice(self.targets)['ecli']}")
+
+    async def create(self):
+        self.created += 1
+        size = int(math.exp(self.rnd.uniform(math.log(2000), math.log(50000))))
+        return await self.client.post('/create', json={
+            '_v': 1,
+            '_timestamp': int(time.time()),
+            'country': 'BE',
+            'court': self.rnd.choice(('RSCE', 'CASS', 'GHCC')),
+            'year': self.rnd.randint(2000, 2022),
+            'identifier': f'WL.{self.run_id}.{self.created}',
+            'text': decision(size, seed=self.created),
+            'lang': 'FR',
+            'appeal': 'nodata',
+            'user_key': self.user_key,
+            'doc_links': [],
+            'labels': ['COVID-19'],
+            'terms': [],
+        })
+
+    async def update(self):
+        doc_id = self.rnd.choice(self.targets)['id']
+        r = await self.client.get(f'/d/read/{doc_id}', headers=self.admin)
+        if r.status_code != 200:
+            return r
+        doc = r.json()
+        return await self.client.post(f'/d/update/{doc_id}', headers=self.admin, json={
+            '_v': 1,
+            '_timestamp': int(time.time()),
+            'country': doc['country'],
+            'court': doc['court'],
+            'year': doc['year'],
+            'identifier': doc['identifier'],
+            'text': doc['text'],
+            'lang': doc['lang'],
+            'appeal': doc['appeal'],
+            'status': doc['status'],
+            'doc_links': [
+                {'kind': link['target_type'], 'link': link['target_identifier'], 'label': link['target_label']}
+                for link in doc['links']
+            ],
+            'labels': doc['labels'],
+        })
+
+
+async def find_targets(client, admin_token, limit):
+    """
+    Public documents to request, as {'id', 'ecli'}
+    """
+    targets = []
+    params = {'fields': 'ecli', 'limit': min(limit, 1000)}
+    while len(targets) < limit:
+        r = await client.get('/c/public', params=params, headers={'Authorization': f'Bearer {admin_token}'})
+        r.raise_for_status()
+        targets += r.json()
+        cursor = r.headers.get('x-next-cursor')
+        if not cursor:
+            break
+        params['cursor'] = cursor
+    return targets[:limit]
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile of sorted values
+    """
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summary(timings, statuses, errors, elapsed):
+    report = {}
+    for kind in sorted(set(timings) | set(errors)):
+        values = sorted(timings[kind])
+        entry = {
+            'requests': len(values),
+            'errors': errors[kind],
+            'per_second': round(len(values) / elapsed, 2),
+            'statuses': {str(k): v for k, v in sorted(statuses[kind].items())},
+        }
+        if values:
+            entry.update({
+                'mean_ms': round(statistics.mean(values) * 1000, 2),
+                **{f'p{p}_ms': round(percentile(values, p) * 1000, 2) for p in (50, 90, 95, 99)},
+                'max_ms': round(values[-1] * 1000, 2),
+            })
+        report[kind] = entry
+    return report
+
+
+async def run(args):
+    mix = MIX
+    if args.mix:
+        mix = {}
+        for item in args.mix.split(','):
+            kind, _, weight = item.partition('=')
+            if kind not in MIX:
+                raise SystemExit(f"Unknown request kind {kind}, use {', '.join(MIX)}")
+            mix[kind] = float(weight)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+
+    timings = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = Counter()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        targets = await find_targets(client, args.admin_token, args.targets)
+        if not targets and set(kinds) - {'create'}:
+            raise SystemExit('No public document to request, load a corpus first (python -m bench.load_corpus)')
+        print(f'{len(targets)} documents, {args.concurrency} clients, {args.duration}s', file=sys.stderr)
+
+        start = time.perf_counter()
+        end = start + args.duration
+
+        async def client_loop(num):
+            workload = Workload(client, targets, args.user_key, args.admin_token, args.seed * 1000 + num)
+            while time.perf_counter() < end:
+                kind = workload.rnd.choices(kinds, weights)[0]
+                began = time.perf_counter()
+                try:
+                    r = await getattr(workload, kind)()
+                except httpx.HTTPError as e:
+                    errors[kind] += 1
+                    statuses[kind][type(e).__name__] += 1
+                    continue
+                timings[kind].append(time.perf_counter() - began)
+                statuses[kind][r.status_code] += 1
+                if r.status_code >= 400:
+                    errors[kind] += 1
+
+        await asyncio.gather(*(client_loop(num) for num in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in timings.values())
+    return {
+        'meta': {
+            'url': args.url,
+            'duration': round(elapsed, 2),
+            'concurrency': args.concurrency,
+            'mix': mix,
+            'documents': len(targets),
+        },
+        'total': {
+            'requests': total,
+            'errors': sum(errors.values()),
+            'per_second': round(total / elapsed, 2),
+        },
+        'requests': summary(timings, statuses, errors, elapsed),
+    }
+
+
+def print_report(report):
+    print(f"{'kind':>8} {'reqs':>7} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+          file=sys.stderr)
+    for kind, r in report['requests'].items():
+        print(f"{kind:>8} {r['requests']:>7} {r['per_second']:>8.1f} {r['errors']:>7} "
+              f"{r.get('p50_ms', 0):>9.1f} {r.get('p90_ms', 0):>9.1f} {r.get('p99_ms', 0):>9.1f} {r.get('max_ms', 0):>9.1f}",
+              file=sys.stderr)
+    total = report['total']
+    print(f"{'total':>8} {total['requests']:>7} {total['per_second']:>8.1f} {total['errors']:>7}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load a running api with a mix of requests')
+    parser.add_argument('--url', dest='url', default='http://127.0.0.1:5000', help='Api base url')
+    parser.add_argument('--duration', dest='duration', type=float, default=60, help='Seconds of load')
+    parser.add_argument('--concurrency', dest='concurrency', type=int, default=20, help='Simultaneous clients')
+    parser.add_argument('--mix', dest='mix', default=None,
+                        help='Request weights, as browse=40,html=35,pdf=10,create=10,update=5')
+    parser.add_argument('--targets', dest='targets', type=int, default=1000, help='Public documents to pick from')
+    parser.add_argument('--user-key', dest='user_key', default='loadtest', help='User key of created documents')
+    parser.add_argument('--admin-token', dest='admin_token', default='admin', help='Token of an admin user')
+    parser.add_argument('--timeout', dest='timeout', type=float, default=60, help='Request timeout in seconds')
+    parser.add_argument('--output', dest='output', default=None, help='JSON report file')
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
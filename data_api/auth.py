@@ -1,14 +1,17 @@
 import asyncio
+import time
 from typing import Optional
 
-import requests
+import httpx
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from data_api.models import User
 
 from .deps import logger, oj_code
+from .lib_cache import TTLCache
 from .lib_cfg import config
+from .lib_metrics import UPSTREAM, UPSTREAM_ERRORS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=(config.key('token')), auto_error=False)
 
@@ -19,24 +22,73 @@ credentials_exception = HTTPException(
 )
 
 
-async def get_user_by_key(user_key: str):
-    logger.debug('Getting user from API, by key')
-    url = '{host}/u/by/key'.format(host=(config.key(['oj', 'api', 'auth'])))
+# Auth service client
+# Users are resolved by the auth service over a pooled connection, and kept
+# in a bounded TTL cache. Rejected credentials are cached too (for a shorter
+# time), so a bad token does not cost a round trip on every request.
+_CLIENT = None
+_USERS = None
+
+
+class AuthUnavailable(RuntimeError):
+    pass
+
+
+def get_client():
+    global _CLIENT  # pylint:disable=global-statement
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(
+            base_url=config.key(['oj', 'api', 'auth']),
+            timeout=config.key(['auth', 'timeout']),
+        )
+    return _CLIENT
+
+
+async def close_client():
+    global _CLIENT  # pylint:disable=global-statement
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def user_cache():
+    global _USERS  # pylint:disable=global-statement
+    if _USERS is None:
+        _USERS = TTLCache(
+            maxsize=config.key(['auth', 'cache_size']),
+            ttl=config.key(['auth', 'cache_ttl']),
+            negative_ttl=config.key(['auth', 'cache_negative_ttl']),
+            negative=(HTTPException,),
+        )
+    return _USERS
+
+
+async def fetch_user(field: str, value: str):
+    url = f'/u/by/{field}'
+    payload = {
+        field: oj_code(value),
+        'env': config.key('oj_env')
+    }
     t = 0
     while True:
-        r = requests.post(url, json={
-            'key': oj_code(user_key),
-            'env': config.key('oj_env')
-        })
-        if r.status_code == 200:
-            break
-        if r.status_code == 401:
-            raise credentials_exception
-        else:
-            await asyncio.sleep(1)
-            t += 1
+        start = time.perf_counter()
+        try:
+            r = await get_client().post(url, json=payload)
+            UPSTREAM.observe(time.perf_counter() - start, 'auth', url)
+            if r.status_code == 200:
+                break
+            if r.status_code == 401:
+                raise credentials_exception
+            UPSTREAM_ERRORS.inc('auth', url)
+        except httpx.HTTPError as e:
+            UPSTREAM.observe(time.perf_counter() - start, 'auth', url)
+            UPSTREAM_ERRORS.inc('auth', url)
+            logger.warning('Auth service error: %s', e)
+        t += 1
         if t > 4:
-            raise credentials_exception
+            # Not cached: the credentials may well be valid
+            raise AuthUnavailable('Auth service unavailable')
+        await asyncio.sleep(1)
 
     user = r.json()
     if user.get('valid') is not True:
@@ -44,29 +96,21 @@ async def get_user_by_key(user_key: str):
     return User(**user)
 
 
+async def get_user(field: str, value: str):
+    try:
+        return await user_cache().get((field, value), fetch_user, field, value)
+    except AuthUnavailable:
+        raise credentials_exception
+
+
+async def get_user_by_key(user_key: str):
+    logger.debug('Getting user from API, by key')
+    return await get_user('key', user_key)
+
+
 async def get_user_by_email(user_email: str):
     logger.debug('Getting user from API, by email')
-    url = '{host}/u/by/email'.format(host=(config.key(['oj', 'api', 'auth'])))
-    t = 0
-    while True:
-        r = requests.post(url, json={
-            'email': oj_code(user_email),
-            'env': config.key('oj_env')
-        })
-        if r.status_code == 200:
-            break
-        if r.status_code == 401:
-            raise credentials_exception
-        else:
-            await asyncio.sleep(1)
-            t += 1
-        if t > 4:
-            raise credentials_exception
-
-    user = r.json()
-    if user.get('valid') is not True:
-        raise credentials_exception
-    return User(**user)
+    return await get_user('email', user_email)
 
 
 async def get_current_user(token: Optional[str] = Depends(oauth2_scheme)):
@@ -77,27 +121,7 @@ async def get_current_user(token: Optional[str] = Depends(oauth2_scheme)):
 
 async def token_get_user(token):
     logger.debug('Getting user data from API')
-    url = '{host}/u/by/token'.format(host=(config.key(['oj', 'api', 'auth'])))
-    t = 0
-    while True:
-        r = requests.post(url, json={
-            'token': oj_code(token),
-            'env': config.key('oj_env')
-        })
-        if r.status_code == 200:
-            break
-        if r.status_code == 401:
-            raise credentials_exception
-        else:
-            await asyncio.sleep(1)
-            t += 1
-        if t > 4:
-            raise credentials_exception
-
-    user = r.json()
-    if user.get('valid') is not True:
-        raise credentials_exception
-    return User(**user)
+    return await get_user('token', token)
 
 
 def decode_token(token):
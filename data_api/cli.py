@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+import data_api.deps as deps
+
+from . import lib_voc
+from .auth import close_client, get_user_by_key
+from .deps import logger
+from .lib_bulk import ingest_lines
+from .lib_cfg import config, load
+from .lib_export import export as export_rows
+from .lib_jobs import requeue, work
+from .lib_mail import close_smtp
+from .lib_parse import derive
+from .lib_sql import create_pool
+from .routers.documents import notifyBulk
+
+# ############################################################## COMMAND TOOLS
+# #############################################################################
+
+
+def get_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--config', dest='config', help='config file', default=None)
+    return parser
+
+
+async def get_pool():
+    deps.DB_POOL = await create_pool(**config.key('postgresql'))
+    return deps.DB_POOL
+
+
+# ################################################################### BACKFILL
+# #############################################################################
+async def run_backfill(batch, everything):
+    pool = await get_pool()
+
+    sql = """
+    SELECT id_internal, text
+    FROM ecli_document
+    WHERE id_internal > $1
+    AND ($2 OR html IS NULL)
+    ORDER BY id_internal
+    LIMIT $3
+    """
+
+    sql_update = """
+    UPDATE ecli_document
+    SET html = $2, pages = $3, stats = $4
+    WHERE id_internal = $1
+    """
+
+    last = 0
+    total = 0
+    async with pool.acquire() as db:
+        while True:
+            rows = await db.fetch(sql, last, everything, batch)
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                derived = derive(row['text'] or '')
+                updates.append((
+                    row['id_internal'],
+                    derived['html'],
+                    derived['pages'],
+                    derived['stats'],
+                ))
+            await db.executemany(sql_update, updates)
+            last = rows[-1]['id_internal']
+            total += len(rows)
+            logger.info('Derived artifacts stored for %s documents', total)
+
+    await pool.close()
+
+
+def backfill():
+    parser = get_parser('Compute derived artifacts (html, page index, stats) of stored documents')
+    parser.add_argument('--batch', dest='batch', type=int, default=100, help='Documents per batch')
+    parser.add_argument('--all', dest='everything', action='store_true', default=False,
+                        help='Recompute every document, not only the missing ones')
+    args = parser.parse_args()
+    load(args.config)
+    asyncio.run(run_backfill(args.batch, args.everything))
+
+
+# ##################################################################### EXPORT
+# #############################################################################
+async def run_export(output, court, year, since):
+    pool = await get_pool()
+    count = 0
+    async for line in export_rows(court=court, year=year, since=since):
+        output.write(line)
+        count += 1
+    logger.info('Exported %s documents', count)
+    await pool.close()
+
+
+def export():
+    parser = get_parser('Export public documents as newline delimited json')
+    parser.add_argument('--court', dest='court', default=None, help='Only this court')
+    parser.add_argument('--year', dest='year', type=int, default=None, help='Only this year')
+    parser.add_argument('--since', dest='since', type=datetime.fromisoformat, default=None,
+                        help='Only documents updated since (ISO date)')
+    parser.add_argument('--output', dest='output', default='-', help='Output file, stdout by default')
+    args = parser.parse_args()
+    load(args.config)
+
+    if args.output == '-':
+        asyncio.run(run_export(sys.stdout, args.court, args.year, args.since))
+    else:
+        with open(args.output, 'w', encoding='utf8') as f:
+            asyncio.run(run_export(f, args.court, args.year, args.since))
+
+
+# ####################################################################### BULK
+# #############################################################################
+async def file_lines(f):
+    for line in f:
+        yield line
+
+
+async def run_bulk(f, user_key, background):
+    pool = await get_pool()
+    user = await get_user_by_key(user_key)
+    async with pool.acquire() as db:
+        created, errors = await ingest_lines(db, file_lines(f), user, jobs=background)
+        if created and background:
+            await notifyBulk(db, user, created, errors)
+
+    for error in errors:
+        logger.warning('Line %s: %s', error['line'], error['error'])
+    logger.info('%s documents stored, %s errors', len(created), len(errors))
+
+    await close_client()
+    await pool.close()
+
+
+def bulk():
+    parser = get_parser('Submit documents from a newline delimited json file')
+    parser.add_argument('file', help='Input file, - for stdin')
+    parser.add_argument('--user-key', dest='user_key', required=True, help='Submitting user key')
+    parser.add_argument('--no-ark', dest='background', action='store_false', default=True,
+                        help='Do not queue ark minting and vocabulary links, skip notification')
+    args = parser.parse_args()
+    load(args.config)
+
+    if args.file == '-':
+        asyncio.run(run_bulk(sys.stdin, args.user_key, args.background))
+    else:
+        with open(args.file, encoding='utf8') as f:
+            asyncio.run(run_bulk(f, args.user_key, args.background))
+
+
+# ##################################################################### WORKER
+# #############################################################################
+async def run_worker(concurrency, batch, once, requeue_dead):
+    pool = await get_pool()
+    if requeue_dead:
+        async with pool.acquire() as db:
+            logger.info('%s dead jobs requeued', await requeue(db))
+    try:
+        await work(concurrency, batch, once)
+    finally:
+        await lib_voc.close_client()
+        await asyncio.get_running_loop().run_in_executor(None, close_smtp)
+        await pool.close()
+
+
+def worker():
+    parser = get_parser('Run queued jobs (ark minting, vocabulary links, notification mails)')
+    parser.add_argument('--concurrency', dest='concurrency', type=int, default=None,
+                        help='Jobs run at the same time (JOBS_CONCURRENCY)')
+    parser.add_argument('--batch', dest='batch', type=int, default=None,
+                        help='Jobs claimed at once (JOBS_BATCH)')
+    parser.add_argument('--once', dest='once', action='store_true', default=False,
+                        help='Stop when no job is left to run')
+    parser.add_argument('--requeue-dead', dest='requeue_dead', action='store_true', default=False,
+                        help='Retry dead jobs first')
+    args = parser.parse_args()
+    load(args.config)
+    asyncio.run(run_worker(args.concurrency, args.batch, args.once, args.requeue_dead))
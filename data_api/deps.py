@@ -1,14 +1,17 @@
 import logging
 import os
 import random
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
 
 from cryptography.fernet import Fernet
 from fastapi import Header, HTTPException
 from fastapi.templating import Jinja2Templates
 from jinja2 import Environment, FileSystemLoader
 
+from . import lib_metrics
 from .lib_cfg import config
 
 logger = logging.getLogger(__name__)
@@ -21,9 +24,31 @@ jinjaEnv = Environment(
 
 DB_POOL = False
 
+POOL_ACQUIRE = lib_metrics.histogram(
+    'db_pool_acquire_seconds',
+    'Time waiting for a pooled database connection')
+POOL_CONNECTIONS = lib_metrics.gauge(
+    'db_pool_connections',
+    'Pooled database connections, by state',
+    ('state',))
+
+
+@lib_metrics.collector
+async def pool_metrics():
+    if DB_POOL:
+        idle = DB_POOL.get_idle_size()
+        POOL_CONNECTIONS.set(DB_POOL.get_size() - idle, 'busy')
+        POOL_CONNECTIONS.set(idle, 'idle')
+        POOL_CONNECTIONS.set(DB_POOL.get_max_size(), 'max')
+
+
+@lru_cache(maxsize=4)
+def get_fernet(key):
+    return Fernet(key)
+
 
 def oj_code(payload: str):
-    f = Fernet(config.key('oj_key'))
+    f = get_fernet(config.key('oj_key'))
     return f.encrypt(payload.encode()).decode()
 
 
@@ -39,7 +64,9 @@ async def get_query_token(token: str):
 
 async def get_db():
     global DB_POOL  # pylint:disable=global-statement
+    start = time.perf_counter()
     conn = await DB_POOL.acquire()
+    POOL_ACQUIRE.observe(time.perf_counter() - start)
     try:
         yield conn
     finally:
@@ -52,7 +79,9 @@ async def oj_db():
     # Improve with this : (single context manager)
     # https://fastapi.tiangolo.com/tutorial/dependencies/dependencies-with-yield/#context-managers
     global DB_POOL  # pylint:disable=global-statement
+    start = time.perf_counter()
     conn = await DB_POOL.acquire()
+    POOL_ACQUIRE.observe(time.perf_counter() - start)
     try:
         yield conn
     finally:
@@ -0,0 +1,187 @@
+import asyncio
+import json
+
+from . import lib_labels
+from .deps import doc_hash, logger
+from .lib_cfg import config
+from .lib_db import upsert_labels
+from .lib_jobs import enqueue_many
+from .lib_parse import derive
+from .models import SubmitModel
+
+# Bulk ingestion
+# Documents come in as newline delimited json (one SubmitModel per line),
+# are validated one by one and stored by batches: each batch is copied to
+# staging tables, then merged in a single transaction. Invalid lines and
+# already known ECLIs are reported, and do not stop the batch.
+DOC_COLUMNS = (
+    'id_internal',
+    'ecli',
+    'country',
+    'court',
+    'year',
+    'identifier',
+    'text',
+    'meta',
+    'ukey',
+    'lang',
+    'appeal',
+    'hash',
+    'html',
+    'pages',
+    'stats',
+)
+LINK_COLUMNS = (
+    'id_internal',
+    'target_type',
+    'target_identifier',
+    'target_label',
+)
+
+
+async def split_lines(chunks):
+    """
+    Lines of a stream of bytes
+    """
+    rest = b''
+    async for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+async def read_records(lines):
+    """
+    Yield (line number, record, error) for every non empty line
+    """
+    num = 0
+    async for line in lines:
+        num += 1
+        if not line.strip():
+            continue
+        try:
+            yield num, SubmitModel(**json.loads(line)), None
+        except (ValueError, TypeError) as e:
+            yield num, None, str(e)
+
+
+async def ingest(db, batch, user, jobs=True):
+    """
+    Store a batch of (line number, record), return created documents and errors
+    Ark minting jobs are queued for the created documents, unless `jobs` is false
+    """
+    ids = await db.fetchval("""
+    SELECT array_agg(nextval(pg_get_serial_sequence('ecli_document', 'id_internal')))
+    FROM generate_series(1, $1)
+    """, len(batch))
+
+    docs = []
+    links = []
+    staged = {}
+    for id_internal, (num, record) in zip(ids, batch):
+        ecli = f"ECLI:{record.country}:{record.court}:{record.year}:{record.identifier}"
+        meta = record.meta if record.meta is not None else {}
+        meta['labels'] = record.labels
+        docHash = doc_hash(ecli)
+        # Parsing a large decision takes a while, keep it off the event loop.
+        # Not through the render queue: a busy queue must not stop the ingestion
+        derived = await asyncio.get_running_loop().run_in_executor(None, derive, record.text)
+        docs.append((
+            id_internal,
+            ecli,
+            record.country,
+            record.court,
+            record.year,
+            record.identifier,
+            record.text,
+            meta,
+            user.email,
+            record.lang,
+            record.appeal,
+            docHash,
+            derived['html'],
+            derived['pages'],
+            derived['stats'],
+        ))
+        links += [(id_internal, doc.kind, doc.link, doc.label) for doc in record.doc_links]
+        staged[id_internal] = (num, ecli, docHash, record)
+
+    columns = ', '.join(DOC_COLUMNS)
+    link_columns = ', '.join(LINK_COLUMNS)
+    async with db.transaction():
+        await db.execute("""
+        CREATE TEMP TABLE ecli_document_staging (LIKE ecli_document) ON COMMIT DROP;
+        CREATE TEMP TABLE ecli_links_staging (LIKE ecli_links) ON COMMIT DROP;
+        """)
+        await db.copy_records_to_table('ecli_document_staging', records=docs, columns=DOC_COLUMNS)
+        if links:
+            await db.copy_records_to_table('ecli_links_staging', records=links, columns=LINK_COLUMNS)
+
+        # Known ECLIs are skipped, the first occurence wins within the batch
+        rows = await db.fetch(f"""
+        INSERT INTO ecli_document ({columns})
+        SELECT DISTINCT ON (ecli) {columns}
+        FROM ecli_document_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM ecli_document d WHERE d.ecli = s.ecli)
+        ORDER BY ecli, id_internal
+        RETURNING id_internal
+        """)
+        inserted = sorted(r['id_internal'] for r in rows)
+
+        await db.execute(f"""
+        INSERT INTO ecli_links ({link_columns})
+        SELECT {link_columns}
+        FROM ecli_links_staging
+        WHERE id_internal = ANY($1::int[])
+        ON CONFLICT DO NOTHING
+        """, inserted)
+
+        await upsert_labels(db, {label for i in inserted for label in staged[i][3].labels})
+
+        if jobs:
+            await enqueue_many(db, 'ark', [{'id_internal': i, 'terms': staged[i][3].terms} for i in inserted])
+
+    created = []
+    for id_internal in inserted:
+        num, ecli, docHash, record = staged.pop(id_internal)
+        lib_labels.add(record.labels)
+        created.append({
+            'line': num,
+            'id': id_internal,
+            'ecli': ecli,
+            'hash': docHash,
+            'terms': record.terms,
+        })
+    errors = [{'line': num, 'error': f'{ecli} already exists'} for num, ecli, _, _ in staged.values()]
+    return created, errors
+
+
+async def ingest_lines(db, lines, user, jobs=True):
+    """
+    Validate and store ndjson lines by batches
+    """
+    size = config.key(['bulk', 'batch'])
+    created = []
+    errors = []
+    batch = []
+    async for num, record, error in read_records(lines):
+        if error:
+            errors.append({'line': num, 'error': error})
+            continue
+        batch.append((num, record))
+        if len(batch) >= size:
+            res = await ingest(db, batch, user, jobs)
+            created += res[0]
+            errors += res[1]
+            batch = []
+            logger.info('Bulk ingestion: %s documents stored', len(created))
+    if batch:
+        res = await ingest(db, batch, user, jobs)
+        created += res[0]
+        errors += res[1]
+
+    errors.sort(key=lambda e: e['line'])
+    return created, errors
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# In-process TTL / LRU cache
+# Values expire after `ttl` seconds, failures (exceptions raised by the
+# loader and flagged as cacheable) after `negative_ttl` seconds. When the
+# cache is full the least recently used entry is evicted. Concurrent lookups
+# of a missing key share a single call to the loader.
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60, negative_ttl=10, negative=(), clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative = tuple(negative)
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._loading = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _set(self, key, value, failed=False):
+        ttl = self.negative_ttl if failed else self.ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (self.clock() + ttl, value, failed)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def drop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    async def get(self, key, loader, *args):
+        """
+        Return the cached value of key, or await loader(*args) to get it
+        """
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            _, value, failed = entry
+            if failed:
+                raise value
+            return value
+
+        self.misses += 1
+        if key not in self._loading:
+            self._loading[key] = asyncio.ensure_future(self._load(key, loader, *args))
+        return await asyncio.shield(self._loading[key])
+
+    async def _load(self, key, loader, *args):
+        try:
+            value = await loader(*args)
+        except self.negative as e:
+            self._set(key, e, failed=True)
+            raise
+        else:
+            self._set(key, value)
+            return value
+        finally:
+            del self._loading[key]
@@ -3,6 +3,7 @@ import operator
 import os
 from functools import reduce
 
+import toml
 import yaml
 
 
@@ -38,6 +39,7 @@ class ConfigClass:
             'user': os.getenv('SMTP_USER', 'user'),
             'port': os.getenv('SMTP_PORT', 'port'),
             'password': os.getenv('SMTP_PASSWORD', 'password'),
+            'timeout': int(os.getenv('SMTP_TIMEOUT', '30')),
         },
         'log_level': 'info',
         'oj_doc_domain': os.getenv('DOC_URI', 'http://localhost:5010'),
@@ -56,9 +58,68 @@ class ConfigClass:
                 'auth': os.getenv('AUTH_URI', 'http://localhost:5015')
             },
         },
+        'auth': {
+            'timeout': int(os.getenv('AUTH_TIMEOUT', '10')),
+            'cache_size': int(os.getenv('AUTH_CACHE_SIZE', '1024')),
+            'cache_ttl': int(os.getenv('AUTH_CACHE_TTL', '60')),
+            'cache_negative_ttl': int(os.getenv('AUTH_CACHE_NEGATIVE_TTL', '10')),
+        },
+        'voc': {
+            'timeout': int(os.getenv('VOC_TIMEOUT', '10')),
+            'retries': int(os.getenv('VOC_RETRIES', '4')),
+            'backoff': float(os.getenv('VOC_BACKOFF', '0.5')),
+            'token_ttl': int(os.getenv('VOC_TOKEN_TTL', '600')),
+        },
         'oj_env': os.getenv('OJ_ENV', 'development'),
         'oj_key': os.getenv('OJ_KEY', '5aLqJFte6G7IsuDNTOhjO8ICcKme62sRs0tX2XHQyzs='),
         'hash_max_views': os.getenv('HASH_VIEWS', 1000),
+        'bulk': {
+            'batch': int(os.getenv('BULK_BATCH', '500')),
+        },
+        'jobs': {
+            'concurrency': int(os.getenv('JOBS_CONCURRENCY', '4')),
+            'batch': int(os.getenv('JOBS_BATCH', '10')),
+            'poll_interval': float(os.getenv('JOBS_POLL_INTERVAL', '2')),
+            'max_attempts': int(os.getenv('JOBS_MAX_ATTEMPTS', '8')),
+            'backoff': float(os.getenv('JOBS_BACKOFF', '30')),
+            'lock_timeout': int(os.getenv('JOBS_LOCK_TIMEOUT', '900')),
+        },
+        'collections': {
+            'page_size': int(os.getenv('COLLECTION_PAGE_SIZE', '100')),
+            'max_page_size': int(os.getenv('COLLECTION_MAX_PAGE_SIZE', '1000')),
+        },
+        'http': {
+            'max_age': int(os.getenv('HTTP_MAX_AGE', '3600')),
+            'compress_min_size': int(os.getenv('HTTP_COMPRESS_MIN_SIZE', '1024')),
+        },
+        'labels': {
+            'refresh_interval': int(os.getenv('LABELS_REFRESH_INTERVAL', '600')),
+        },
+        'nav': {
+            'refresh_interval': int(os.getenv('NAV_REFRESH_INTERVAL', '300')),
+        },
+        'search': {
+            'page_size': int(os.getenv('SEARCH_PAGE_SIZE', '20')),
+            'max_page_size': int(os.getenv('SEARCH_MAX_PAGE_SIZE', '100')),
+        },
+        'views': {
+            'flush_interval': int(os.getenv('VIEWS_FLUSH_INTERVAL', '10')),
+        },
+        'render': {
+            'concurrency': int(os.getenv('RENDER_CONCURRENCY', '2')),
+            'queue': int(os.getenv('RENDER_QUEUE', '16')),
+            'timeout': int(os.getenv('RENDER_TIMEOUT', '60')),
+            'latex': os.getenv('LATEX_ENGINE', 'pandoc'),
+        },
+        'profile': {
+            'path': os.getenv('PROFILE_DIR', '/tmp/oj_profiles'),
+            'interval': float(os.getenv('PROFILE_INTERVAL', '0.005')),
+            'sample_rate': float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+            'keep': int(os.getenv('PROFILE_KEEP', '200')),
+        },
+        'pdf_store': {
+            'path': os.getenv('PDF_STORE', '/tmp/oj_pdf_store'),
+        },
     }
 
     def merge(self, cfg):
@@ -80,3 +141,15 @@ class ConfigClass:
 
 
 config = ConfigClass()
+
+
+def load(config_file=None):
+    """
+    Merge the default and the given config files into the config
+    """
+    if config_file:
+        t_config = toml.load(['config_default.toml', config_file])
+    else:
+        t_config = toml.load('config_default.toml')
+
+    config.merge(t_config)
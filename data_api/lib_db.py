@@ -0,0 +1,56 @@
+# Shared queries
+# Statements used by several routes or commands.
+
+
+async def upsert_labels(db, labels, category='user_defined'):
+    """
+    Keep labels in database for reuse, in a single statement
+    """
+    if not labels:
+        return
+    sql = """
+    INSERT INTO labels (label, category)
+    SELECT DISTINCT label, $2 FROM unnest($1::text[]) AS label
+    ON CONFLICT (label) DO NOTHING
+    """
+    await db.execute(sql, list(labels), category)
+
+
+async def write_links(db, id_internal, links, replace=True):
+    """
+    Store document links, only touching the ones that changed
+    """
+    new = {doc.link: (doc.kind, doc.label) for doc in links}
+    old = {}
+    if replace:
+        rows = await db.fetch("""
+        SELECT target_identifier, target_type, target_label
+        FROM ecli_links
+        WHERE id_internal = $1
+        """, id_internal)
+        old = {r['target_identifier']: (r['target_type'], r['target_label']) for r in rows}
+
+    gone = [link for link in old if link not in new]
+    if gone:
+        await db.execute("""
+        DELETE FROM ecli_links
+        WHERE id_internal = $1
+        AND target_identifier = ANY($2::text[])
+        """, id_internal, gone)
+
+    changed = [
+        (id_internal, kind, link, label)
+        for link, (kind, label) in new.items()
+        if old.get(link) != (kind, label)
+    ]
+    if changed:
+        await db.executemany("""
+        INSERT INTO ecli_links (
+            id_internal,
+            target_type,
+            target_identifier,
+            target_label
+        ) VALUES ($1, $2, $3, $4)
+        ON CONFLICT (id_internal, target_identifier) DO UPDATE
+        SET target_type = EXCLUDED.target_type, target_label = EXCLUDED.target_label
+        """, changed)
@@ -0,0 +1,69 @@
+import json
+
+from .deps import oj_db
+
+# Bulk export
+# Public documents are read through a server side cursor and written as
+# newline delimited json, one document per line, so memory use does not
+# depend on the size of the export.
+
+
+def export_query(court=None, year=None, since=None):
+    filters = []
+    args = []
+    for sql, value in (
+            ('court = ${}', court),
+            ('year = ${}', year),
+            ('date_updated >= ${}', since)):
+        if value is not None:
+            args.append(value)
+            filters.append(sql.format(len(args)))
+
+    sql = f"""
+    SELECT
+        d.ecli,
+        d.country,
+        d.court,
+        d.year,
+        d.identifier,
+        d.lang,
+        d.appeal,
+        d.text,
+        d.meta->'labels' AS labels,
+        d.date_created,
+        d.date_updated,
+        l.links
+    FROM ecli_document d
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'kind', target_type,
+            'link', target_identifier,
+            'label', target_label
+        )) AS links
+        FROM ecli_links
+        WHERE id_internal = d.id_internal
+    ) l ON TRUE
+    WHERE d.status = 'public'
+    {''.join(f' AND {f}' for f in filters)}
+    ORDER BY d.id_internal
+    """
+    return sql, args
+
+
+def export_line(row):
+    doc = dict(row)
+    doc['labels'] = doc['labels'] or []
+    doc['links'] = doc['links'] or []
+    return json.dumps(doc, default=lambda v: v.isoformat(), ensure_ascii=False) + '\n'
+
+
+async def export(court=None, year=None, since=None, prefetch=200):
+    """
+    Yield public documents as ndjson lines
+    """
+    sql, args = export_query(court, year, since)
+    async with oj_db() as db:
+        # Cursors only live within a transaction
+        async with db.transaction(readonly=True, isolation='repeatable_read'):
+            async for row in db.cursor(sql, *args, prefetch=prefetch):
+                yield export_line(row)
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import zlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .lib_cfg import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# HTTP caching
+# Document routes send a strong ETag (a hash of everything that goes into
+# the response) and Last-Modified, and answer conditional requests with a
+# 304 before rendering anything.
+# Large bodies are sent compressed: document texts and pages as variants
+# compressed once and stored (see lib_store), other responses on the fly.
+
+# Bump when templates or converters change the produced output
+RENDER_VERSION = '1'
+
+
+def make_etag(*parts):
+    h = hashlib.sha256()
+    for part in (RENDER_VERSION,) + parts:
+        h.update(str(part).encode())
+        h.update(b'\0')
+    return f'"{h.hexdigest()[:32]}"'
+
+
+def cache_headers(etag, res, public=True):
+    """
+    Validators and cache policy of a document response
+    """
+    headers = {'ETag': etag}
+    modified = res['date_updated'] or res['date_created']
+    if modified is not None:
+        headers['Last-Modified'] = format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+    if public:
+        headers['Cache-Control'] = f"public, max-age={config.key(['http', 'max_age'])}"
+    else:
+        headers['Cache-Control'] = 'private, no-cache'
+    return headers
+
+
+def is_fresh(request, headers):
+    """
+    True when the client copy matches, per RFC 7232 (If-None-Match wins)
+    """
+    none_match = request.headers.get('if-none-match')
+    if none_match is not None:
+        # Compressed variants have their own tag, the document is the same
+        tags = [t.strip().replace('W/', '', 1).replace('-br"', '"').replace('-gzip"', '"')
+                for t in none_match.split(',')]
+        return '*' in tags or headers['ETag'] in tags
+
+    since = request.headers.get('if-modified-since')
+    if since is None or 'Last-Modified' not in headers:
+        return False
+    try:
+        return parsedate_to_datetime(headers['Last-Modified']) <= parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+
+
+# ################################################################ COMPRESSION
+def accepted_encoding(accept):
+    """
+    Preferred content coding among the supported ones, None for identity
+    """
+    weights = {}
+    for item in accept.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+
+    supported = ['br', 'gzip'] if brotli else ['gzip']
+    best = None
+    for coding in supported:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def compress(data, encoding, stored=False):
+    """
+    Compress a whole body, harder when the result is stored
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if stored else 5)
+    return gzip.compress(data, compresslevel=9 if stored else 6)
+
+
+def variant_headers(headers, encoding):
+    tag = headers['ETag']
+    return {
+        **headers,
+        'ETag': f'{tag[:-1]}-{encoding}"',
+        'Content-Encoding': encoding,
+        'Vary': 'Accept-Encoding',
+    }
+
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript')
+
+
+class CompressionMiddleware:
+    """
+    Compress responses on the fly, unless already encoded or too small
+    """
+    def __init__(self, app, minimum_size=1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, send, encoding, minimum_size):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.passthrough = False
+        self.compressor = None
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            headers = Headers(raw=message['headers'])
+            self.start = message
+            self.passthrough = (
+                'content-encoding' in headers
+                or message['status'] in (204, 304)
+                or not headers.get('content-type', '').startswith(COMPRESSIBLE)
+            )
+            if self.passthrough:
+                await self._send(message)
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more = message.get('more_body', False)
+        if self.compressor is None:
+            if not more and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send(self.start)
+                await self._send(message)
+                return
+            headers = MutableHeaders(raw=self.start['headers'])
+            del headers['content-length']
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+            if self.encoding == 'br':
+                self.compressor = brotli.Compressor(quality=5)
+            else:
+                self.compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+            await self._send(self.start)
+
+        if self.encoding == 'br':
+            data = self.compressor.process(body)
+            data += self.compressor.finish() if not more else self.compressor.flush()
+        else:
+            data = self.compressor.compress(body)
+            data += self.compressor.flush() if not more else self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        await self._send({'type': 'http.response.body', 'body': data, 'more_body': more})
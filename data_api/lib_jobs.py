@@ -0,0 +1,196 @@
+import asyncio
+import random
+import time
+
+from . import deps, lib_metrics
+from .deps import logger, oj_db
+from .lib_cfg import config
+
+# Job queue
+# Work that must survive restarts and stay out of the API process (ark
+# minting, vocabulary links) is stored in the jobs table, in the same
+# transaction as the document it is about, and run by the `worker` command.
+# Workers claim jobs with FOR UPDATE SKIP LOCKED, so several of them can run
+# side by side. Failed jobs are retried with exponential backoff, then kept
+# as dead until requeued. Jobs left running by a stopped worker are claimed
+# again once their lock times out. Done jobs are deleted.
+HANDLERS = {}
+STATS = {'done': 0, 'retried': 0, 'dead': 0}
+
+BACKLOG = lib_metrics.gauge(
+    'jobs',
+    'Jobs in the queue, by kind and status',
+    ('kind', 'status'))
+BACKLOG_AGE = lib_metrics.gauge(
+    'jobs_queued_oldest_seconds',
+    'Time the oldest queued job has been due, by kind',
+    ('kind',))
+# The backlog is counted again after this many seconds, not on every scrape
+BACKLOG_TTL = 5
+_BACKLOG_READ = {'at': None}
+
+
+def handler(kind):
+    """
+    Register the coroutine running jobs of `kind`, called with the payload items
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+async def enqueue(db, kind, payload):
+    return await db.fetchval("""
+    INSERT INTO jobs (kind, payload, max_attempts) VALUES ($1, $2, $3)
+    RETURNING id
+    """, kind, payload, config.key(['jobs', 'max_attempts']))
+
+
+async def enqueue_many(db, kind, payloads):
+    if not payloads:
+        return
+    max_attempts = config.key(['jobs', 'max_attempts'])
+    await db.executemany("""
+    INSERT INTO jobs (kind, payload, max_attempts) VALUES ($1, $2, $3)
+    """, [(kind, payload, max_attempts) for payload in payloads])
+
+
+async def claim(db, limit):
+    return await db.fetch("""
+    UPDATE jobs j
+    SET status = 'running', attempts = j.attempts + 1, locked_at = NOW()
+    FROM (
+        SELECT id FROM jobs
+        WHERE (status = 'queued' AND run_at <= NOW())
+        OR (status = 'running' AND locked_at < NOW() - $2 * INTERVAL '1 second')
+        ORDER BY run_at, id
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ) c
+    WHERE j.id = c.id
+    RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts
+    """, limit, config.key(['jobs', 'lock_timeout']))
+
+
+def backoff(attempts):
+    """
+    Delay before the next run of a job that failed `attempts` times
+    """
+    delay = config.key(['jobs', 'backoff']) * 2 ** (attempts - 1)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def finish(db, job):
+    await db.execute("DELETE FROM jobs WHERE id = $1", job['id'])
+    STATS['done'] += 1
+
+
+async def fail(db, job, error):
+    if job['attempts'] >= job['max_attempts']:
+        status, delay = 'dead', 0
+        STATS['dead'] += 1
+        logger.error('Job %s (%s) is dead after %s attempts: %s', job['id'], job['kind'], job['attempts'], error)
+    else:
+        status, delay = 'queued', backoff(job['attempts'])
+        STATS['retried'] += 1
+        logger.warning('Job %s (%s) failed, retry in %.0fs: %s', job['id'], job['kind'], delay, error)
+    await db.execute("""
+    UPDATE jobs
+    SET status = $2, run_at = NOW() + $3 * INTERVAL '1 second', last_error = $4, locked_at = NULL
+    WHERE id = $1
+    """, job['id'], status, delay, error)
+
+
+async def run(job):
+    try:
+        await HANDLERS[job['kind']](**job['payload'])
+    except Exception as e:
+        logger.exception(e)
+        async with oj_db() as db:
+            await fail(db, job, f'{type(e).__name__}: {e}')
+    else:
+        async with oj_db() as db:
+            await finish(db, job)
+
+
+async def work(concurrency=None, batch=None, once=False):
+    """
+    Claim and run jobs, at most `concurrency` at a time
+    With `once`, return when no job is left to run
+    """
+    concurrency = concurrency or config.key(['jobs', 'concurrency'])
+    batch = batch or config.key(['jobs', 'batch'])
+    poll = config.key(['jobs', 'poll_interval'])
+    running = set()
+    while True:
+        jobs = []
+        if len(running) < concurrency:
+            async with oj_db() as db:
+                jobs = await claim(db, min(batch, concurrency - len(running)))
+            running |= {asyncio.ensure_future(run(job)) for job in jobs}
+
+        if not running:
+            if once:
+                return
+            await asyncio.sleep(poll)
+        elif not jobs or len(running) >= concurrency:
+            _, running = await asyncio.wait(running, timeout=poll, return_when=asyncio.FIRST_COMPLETED)
+
+
+@lib_metrics.collector
+async def jobs_metrics():
+    if not deps.DB_POOL:
+        return
+    now = time.monotonic()
+    if _BACKLOG_READ['at'] is not None and now - _BACKLOG_READ['at'] < BACKLOG_TTL:
+        return
+    _BACKLOG_READ['at'] = now
+    async with oj_db() as db:
+        rows = await db.fetch("""
+        SELECT kind, status, COUNT(*) AS count, EXTRACT(EPOCH FROM NOW() - MIN(run_at)) AS age
+        FROM jobs
+        GROUP BY kind, status
+        """)
+    BACKLOG.reset()
+    BACKLOG_AGE.reset()
+    for row in rows:
+        BACKLOG.set(row['count'], row['kind'], row['status'])
+        if row['status'] == 'queued':
+            BACKLOG_AGE.set(max(float(row['age']), 0), row['kind'])
+
+
+async def requeue(db, kind=None):
+    """
+    Give dead jobs a new round of attempts
+    """
+    res = await db.fetch("""
+    UPDATE jobs
+    SET status = 'queued', attempts = 0, run_at = NOW()
+    WHERE status = 'dead'
+    AND ($1::text IS NULL OR kind = $1)
+    RETURNING id
+    """, kind)
+    return len(res)
+
+
+async def status(db):
+    rows = await db.fetch("""
+    SELECT kind, status, COUNT(*) AS count, MIN(run_at) AS oldest
+    FROM jobs
+    GROUP BY kind, status
+    """)
+    dead = await db.fetch("""
+    SELECT id, kind, payload, attempts, last_error, date_created
+    FROM jobs
+    WHERE status = 'dead'
+    ORDER BY id DESC
+    LIMIT 20
+    """)
+    kinds = {}
+    for row in rows:
+        kinds.setdefault(row['kind'], {})[row['status']] = {'count': row['count'], 'oldest': row['oldest']}
+    return {
+        'kinds': kinds,
+        'dead': [dict(row) for row in dead],
+    }
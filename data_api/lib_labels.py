@@ -0,0 +1,103 @@
+import asyncio
+import heapq
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+from .deps import logger, oj_db
+from .lib_cfg import config
+
+# Label autocomplete index
+# Labels sorted by their normalized form (case and accent insensitive), so
+# the labels starting with a prefix are a contiguous slice found by
+# bisection. Matches are ranked by the number of documents using them.
+# Built at startup, updated when documents are written and rebuilt
+# periodically.
+KEYS = []
+LABELS = []
+USAGE = {}
+# Results by (prefix, limit), short prefixes match many labels
+_RESULTS = {}
+_REFRESHER = None
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def add(labels, used=True):
+    """
+    Add labels to the index, counting a use of each when `used`
+    """
+    _RESULTS.clear()
+    for label in set(labels):
+        if label not in USAGE:
+            key = normalize(label)
+            pos = bisect_right(KEYS, key)
+            KEYS.insert(pos, key)
+            LABELS.insert(pos, label)
+            USAGE[label] = 0
+        if used:
+            USAGE[label] += 1
+
+
+def search(begin, limit=20):
+    key = normalize(begin)
+    if (key, limit) not in _RESULTS:
+        start = bisect_left(KEYS, key)
+        end = bisect_left(KEYS, key + '\U0010ffff', start)
+        if len(_RESULTS) > 10000:
+            _RESULTS.clear()
+        _RESULTS[(key, limit)] = heapq.nsmallest(
+            limit,
+            LABELS[start:end],
+            key=lambda label: (-USAGE[label], label)
+        )
+    return _RESULTS[(key, limit)]
+
+
+async def build():
+    global KEYS, LABELS, USAGE  # pylint:disable=global-statement
+    sql = """
+    SELECT l.label, COALESCE(u.count, 0) AS count
+    FROM labels l
+    LEFT JOIN (
+        SELECT label, COUNT(*) AS count
+        FROM ecli_document, jsonb_array_elements_text(meta->'labels') AS label
+        WHERE jsonb_typeof(meta->'labels') = 'array'
+        GROUP BY label
+    ) u USING (label)
+    WHERE l.label IS NOT NULL
+    """
+    async with oj_db() as db:
+        rows = await db.fetch(sql)
+
+    entries = sorted((normalize(r['label']), r['label']) for r in rows)
+    KEYS = [key for key, _ in entries]
+    LABELS = [label for _, label in entries]
+    USAGE = {r['label']: r['count'] for r in rows}
+    _RESULTS.clear()
+    logger.debug('Label index built, %s labels', len(LABELS))
+
+
+async def refresh_loop():
+    while True:
+        await asyncio.sleep(config.key(['labels', 'refresh_interval']))
+        try:
+            await build()
+        except Exception as e:
+            logger.warning('Label index refresh failed')
+            logger.exception(e)
+
+
+def start():
+    global _REFRESHER  # pylint:disable=global-statement
+    if _REFRESHER is None:
+        _REFRESHER = asyncio.ensure_future(refresh_loop())
+
+
+def stop():
+    global _REFRESHER  # pylint:disable=global-statement
+    if _REFRESHER is not None:
+        _REFRESHER.cancel()
+        _REFRESHER = None
@@ -1,17 +1,29 @@
+import asyncio
 from collections import namedtuple
 from datetime import datetime
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from smtplib import SMTP
+from smtplib import SMTP, SMTPException, SMTPServerDisconnected
 
+from .auth import get_user_by_key
 from .deps import jinjaEnv, logger, oj_db
 from .lib_cfg import config
-from .lib_parse import latex2pdf, md2latex
+from .lib_jobs import enqueue, handler
+from .lib_store import pdf_get
 
 Tpl = namedtuple('Tpl', ['file', 'subject', 'variables', 'attach_pdf'])
 OJ_ENV = config.key('oj_env')
 
+# Notifications
+# Mails are queued as jobs, in the transaction of the change they are about,
+# and sent by the job worker: attachments are rendered there, and every
+# message goes through one authenticated SMTP session, opened again when
+# the server closed it. Recipients given by user key are looked up there
+# too, off the write path. Failed messages are retried as any job.
+_SMTP = None
+_SMTP_LOCK = None
+
 TEMPLATE_CONFIG = {
     # User created new document
     'create_doc': Tpl(
@@ -20,6 +32,13 @@ TEMPLATE_CONFIG = {
         ['username', 'doc_hash', 'doc_domain'],
         True
     ),
+    # User submitted a batch of documents
+    'bulk_create_doc': Tpl(
+        'mail_doc_bulk.html',
+        'Notif: Nouveaux documents / Nieuwe documenten',
+        ['username', 'documents', 'errors', 'doc_domain'],
+        False
+    ),
     'publish_doc': Tpl(
         'mail_doc_publish.html',
         'Notif: Document publié / Document gepubliceerd',
@@ -29,25 +48,51 @@ TEMPLATE_CONFIG = {
 }
 
 
-async def notify(user, templateName, data):
-    try:
-        tp = TEMPLATE_CONFIG[templateName]
-        template = jinjaEnv.get_template(tp.file)
-        body = template.render({
-            **data,
-            'username': user.username,
-            'subject': tp.subject,
-            'doc_domain': config.key('oj_doc_domain'),
-        })
-        subject = tp.subject if OJ_ENV == 'prod' else f"[{OJ_ENV}] {tp.subject}"
+async def notify(db, user, templateName, data):
+    """
+    Queue a notification mail, sent by the job worker
+    """
+    if templateName not in TEMPLATE_CONFIG:
+        raise KeyError(templateName)
+    await enqueue(db, 'mail', {
+        'email': user.email,
+        'username': user.username,
+        'template': templateName,
+        'data': data,
+    })
 
-        attachments = await get_attachments('ecli', {'dochash': data['doc_hash']}) if tp.attach_pdf else []
 
-        send_mail(user.email, subject, body, attachments)
-        logger.info("notification mail \'%s\' sent", subject)
-    except Exception as e:
-        logger.warning("Failed to send notification type %s to %s", templateName, user.username)
-        logger.exception(e)
+async def notify_key(db, user_key, templateName, data):
+    """
+    Queue a notification mail to the user of `user_key`, looked up by the job worker
+    """
+    if templateName not in TEMPLATE_CONFIG:
+        raise KeyError(templateName)
+    await enqueue(db, 'mail', {
+        'user_key': user_key,
+        'template': templateName,
+        'data': data,
+    })
+
+
+@handler('mail')
+async def send_notification(template, data, email=None, username=None, user_key=None):
+    if user_key is not None:
+        user = await get_user_by_key(user_key)
+        email, username = user.email, user.username
+    tp = TEMPLATE_CONFIG[template]
+    body = jinjaEnv.get_template(tp.file).render({
+        **data,
+        'username': username,
+        'subject': tp.subject,
+        'doc_domain': config.key('oj_doc_domain'),
+    })
+    subject = tp.subject if OJ_ENV == 'prod' else f"[{OJ_ENV}] {tp.subject}"
+
+    attachments = await get_attachments('ecli', {'dochash': data['doc_hash']}) if tp.attach_pdf else []
+
+    await send_mail(email, subject, body, attachments)
+    logger.info("notification mail \'%s\' sent", subject)
 
 
 async def get_attachments(kind, data):
@@ -63,11 +108,15 @@ async def get_attachments(kind, data):
 
     async with oj_db() as db:
         res = await db.fetchrow(sql, dochash)
+    if res is None:
+        return []
 
-    latex = md2latex({
+    path = await pdf_get({
         'body': res['text'],
         'title': res['ecli'],
     })
+    with open(path, mode='rb') as f:
+        raw = f.read()
     now = datetime.now()
     fname = "{court}_{year}_OJ_v{date}.pdf".format(
         court=res['court'],
@@ -76,7 +125,7 @@ async def get_attachments(kind, data):
     )
 
     part = MIMEApplication(
-        latex2pdf(latex),
+        raw,
         Name=fname
     )
     part['Content-Disposition'] = f'attachment; filename="{fname}"'
@@ -87,8 +136,10 @@ async def get_attachments(kind, data):
     ]
 
 
-def send_mail(mTo, mSubject, mBody, mAttach):
-    mFrom = config.key(['smtp', 'user'])
+async def send_mail(mTo, mSubject, mBody, mAttach):
+    global _SMTP_LOCK  # pylint:disable=global-statement
+    if _SMTP_LOCK is None:
+        _SMTP_LOCK = asyncio.Lock()
 
     message = MIMEMultipart()
     message['Subject'] = mSubject
@@ -101,13 +152,39 @@ def send_mail(mTo, mSubject, mBody, mAttach):
 
     msgBody = message.as_string()
 
-    try:
-        server = SMTP(host=config.key(['smtp', 'host']), port=config.key(['smtp', 'port']), timeout=5)
-        # Server is now internal, TLS not used anymore
-        # server.starttls()
-        server.login(mFrom, config.key(['smtp', 'password']))
-        server.sendmail(mFrom, mTo, msgBody)
-        server.quit()
-    except Exception as e:
-        logger.critical("Failed to send a message")
-        logger.exception(e)
+    # One message at a time on the session, smtplib blocks
+    async with _SMTP_LOCK:
+        await asyncio.get_running_loop().run_in_executor(None, deliver, mTo, msgBody)
+
+
+def deliver(mTo, msgBody):
+    global _SMTP  # pylint:disable=global-statement
+    mFrom = config.key(['smtp', 'user'])
+    for retry in (False, True):
+        if _SMTP is None:
+            server = SMTP(
+                host=config.key(['smtp', 'host']),
+                port=config.key(['smtp', 'port']),
+                timeout=config.key(['smtp', 'timeout']))
+            # Server is now internal, TLS not used anymore
+            # server.starttls()
+            server.login(mFrom, config.key(['smtp', 'password']))
+            _SMTP = server
+        try:
+            _SMTP.sendmail(mFrom, mTo, msgBody)
+            return
+        except (SMTPServerDisconnected, ConnectionError):
+            # Session closed by the server since the last message
+            _SMTP = None
+            if retry:
+                raise
+
+
+def close_smtp():
+    global _SMTP  # pylint:disable=global-statement
+    if _SMTP is not None:
+        try:
+            _SMTP.quit()
+        except (SMTPException, OSError):
+            pass
+        _SMTP = None
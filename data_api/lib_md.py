@@ -0,0 +1,401 @@
+import re
+
+# In-process markdown to latex conversion
+# Covers the markdown subset found in court decisions (paragraphs, flat lists,
+# emphasis, headings and page markers) and reproduces the output of
+# `pandoc -f markdown -t latex --wrap=preserve` once it has gone through the
+# clean up passes of lib_parse.md2latex.
+# Anything outside of this subset raises Unsupported, so that the caller can
+# fall back on pandoc.
+
+HEADINGS = {
+    1: 'section',
+    2: 'subsection',
+    3: 'subsubsection',
+    4: 'paragraph',
+    5: 'subparagraph',
+}
+
+# Pandoc's default abbreviation list: the following space becomes unbreakable
+ABBREVIATIONS = (
+    'aet. aetat. al. Apr. Aug. bk. Bros. c. Capt. cf. ch. chap. chs. Co. col. Corp. '
+    'cp. d. Dec. Dr. e.g. ed. eds. esp. f. fasc. Feb. ff. fig. fl. fol. fols. Fr. '
+    'Gen. Gov. Hon. i.e. ill. Inc. incl. Jan. Jr. Jul. Jun. Ltd. M.A. M.D. Mar. Mr. '
+    'Mrs. Ms. n. n.b. nn. No. Nov. Oct. p. Ph.D. pp. Pres. Prof. pt. q.v. Rep. Rev. '
+    's.v. s.vv. saec. sec. Sen. Sep. Sept. Sgt. Sr. St. univ. viz. vol. vs.'
+).split()
+
+ESCAPES = {
+    '{': r'\{',
+    '}': r'\}',
+    '$': r'\$',
+    '%': r'\%',
+    '&': r'\&',
+    '#': r'\#',
+    '_': r'\_',
+    '~': r'\textasciitilde{}',
+    '^': r'\^{}',
+    '\\': r'\textbackslash{}',
+    '<': r'\textless{}',
+    '>': r'\textgreater{}',
+    '|': r'\textbar{}',
+    '[': '{[}',
+    ']': '{]}',
+    '\u00a0': '~',
+    '\u2018': '`',
+    '\u2019': "'",
+    '\u201c': '``',
+    '\u201d': "''",
+    '\u2013': '--',
+    '\u2014': '---',
+    '\u2026': r'\ldots{}',
+}
+
+# Placeholders for characters resolved before latex escaping
+# (a line break made of trailing spaces acts as a space, an escaped one does not)
+OPEN_QUOTE = '\ue001'
+CLOSE_QUOTE = '\ue002'
+ELLIPSIS = '\ue003'
+LINE_BREAK = '\ue004'
+ESCAPED_BREAK = '\ue005'
+ESCAPED = 0xf0000
+
+SPACES = (' ', '\u00a0', LINE_BREAK)
+
+PLACEHOLDERS = {
+    OPEN_QUOTE: '``',
+    CLOSE_QUOTE: "''",
+    ELLIPSIS: r'\ldots{}',
+    LINE_BREAK: '\\\\',
+    ESCAPED_BREAK: '\\\\',
+}
+
+RE_HEADING = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t]*$')
+RE_BULLET = re.compile(r'^ {0,3}([-*+])( {1,4})(\S.*)$')
+RE_ORDERED = re.compile(r'^ {0,3}(\()?(\d{1,9})([.)])( {1,4})(\S.*)$')
+# Pandoc wants two spaces after a capital letter and a period (initials do
+# not start lists), one is enough after longer roman numerals ("II. En droit")
+RE_FANCY = re.compile(
+    r'^ {0,3}\(?([a-z]|[ivxlcdm]+|#)[.)]( |$)|'
+    r'^ {0,3}\(?([A-Z]|[IVXLCDM]+)\)( |$)|'
+    r'^ {0,3}\(?[IVXLCDM]{2,}\.( |$)|'
+    r'^ {0,3}\(?[A-Z]\.(  | *$)'
+)
+RE_EMPTY_ITEM = re.compile(r'^ {0,3}([-*+]|\(?\d{1,9}[.)]) *$')
+RE_RULE = re.compile(r'^ {0,3}[-=_*+ ]+$')
+RE_BLOCK = re.compile(r'^ {0,3}(>|\||\+[-=]|```|~|:|<|%|\[[^\]]*\]:)')
+RE_INLINE = re.compile(
+    r'`|\]\(|\]\[|\]\{|\]:|!\[|\[\^|\[@|\(@|\^\[|\{#|'
+    r'<[A-Za-z/!?]|&#|&[A-Za-z]+;|'
+    r'\^[^\s^]+\^|~[^\s~]+~|'
+    r'\\[A-Za-z]'
+)
+RE_ABBREVIATION = re.compile(
+    r'(?<![\w.])(%s) +(?!@)' % '|'.join(re.escape(a) for a in ABBREVIATIONS)
+)
+RE_CONTROL_WORD = re.compile(r'(\\(?:textasciitilde|textbackslash|textquotesingle|textless|textgreater|textbar|ldots))\{\}(\S?)')
+
+
+class Unsupported(ValueError):
+    pass
+
+
+def md2latex(text):
+    """
+    Convert markdown text to a latex body
+    """
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    blocks = []
+    block = []
+    for line in lines:
+        if line.strip() == '':
+            if block:
+                blocks.append(block)
+                block = []
+            continue
+        if line.lstrip(' ').startswith('\t'):
+            # Tabs stop at the next multiple of four: a code block for pandoc
+            raise Unsupported('Indented with tab')
+        if not block and RE_HEADING.match(line):
+            # Headings need no blank line after them
+            blocks.append([line])
+            continue
+        block.append(line.replace('\t', ' '))
+    if block:
+        blocks.append(block)
+
+    if RE_INLINE.search(text) or text.count('$') > 1:
+        raise Unsupported('Inline markup')
+
+    output = []
+    previous = None
+    for block in blocks:
+        kind, items = _block(block, previous)
+        if kind.startswith('list') and previous and previous[0] == kind:
+            # Blank lines between items make a loose list
+            previous[1].extend(items)
+            continue
+        previous = [kind, items]
+        output.append(previous)
+
+    return '\n\n'.join(_render(kind, items) for kind, items in output)
+
+
+def _block(lines, previous):
+    first = lines[0]
+
+    if previous and previous[0].startswith('list') and first.startswith(' '):
+        raise Unsupported('List item continuation')
+
+    for i, line in enumerate(lines):
+        if RE_BLOCK.match(line):
+            raise Unsupported('Block markup')
+        if RE_RULE.match(line) and (i or len(line.strip()) > 1):
+            raise Unsupported('Rule, table or setext heading')
+        if i and RE_HEADING.match(line) and (RE_BULLET.match(first) or RE_ORDERED.match(first)):
+            raise Unsupported('Heading in list')
+
+    if len(first) - len(first.lstrip(' ')) > 3:
+        raise Unsupported('Code block')
+
+    heading = RE_HEADING.match(first)
+    if heading:
+        if len(heading.group(1)) > 5 or heading.group(2).endswith('#'):
+            raise Unsupported('Heading')
+        return 'heading', [(len(heading.group(1)), heading.group(2))]
+    if RE_EMPTY_ITEM.match(first) or first.lstrip(' ').startswith('#'):
+        raise Unsupported('Block markup')
+
+    bullet = RE_BULLET.match(first)
+    ordered = RE_ORDERED.match(first)
+    if bullet:
+        return _list(lines, RE_BULLET, 'list*', lambda m: (m.group(1), m.group(3)))
+    if ordered:
+        if ordered.group(1) and ordered.group(3) != ')':
+            raise Unsupported('List marker')
+        style = f'list{ordered.group(1) or ""}{ordered.group(3)}'
+        marker = re.compile(r'^ {0,3}%s(\d{1,9})%s( {1,4})(\S.*)$' % (
+            re.escape(ordered.group(1) or ''),
+            re.escape(ordered.group(3))
+        ))
+        return _list(lines, marker, style, lambda m: (int(m.group(1)), m.group(3)))
+    if RE_FANCY.match(first):
+        raise Unsupported('List marker')
+
+    return 'para', [(0, '\n'.join(lines))]
+
+
+def _list(lines, marker, style, parse):
+    items = []
+    indent = len(lines[0]) - len(lines[0].lstrip(' '))
+    for line in lines:
+        match = marker.match(line)
+        if match and len(line) - len(line.lstrip(' ')) != indent:
+            raise Unsupported('Nested list')
+        if match:
+            label, content = parse(match)
+            if RE_HEADING.match(content) or RE_BLOCK.match(content) or RE_RULE.match(content) or _marker(content):
+                raise Unsupported('Nested block')
+            items.append((label, content))
+            continue
+        if _marker(line):
+            raise Unsupported('Nested or mixed list')
+        label, content = items[-1]
+        items[-1] = (label, f'{content}\n{line}')
+    # Items followed by another one go on on the next line
+    items = [(label, content, i < len(items) - 1) for i, (label, content) in enumerate(items)]
+    return style, items
+
+
+def _marker(line):
+    return RE_BULLET.match(line) or RE_ORDERED.match(line) or RE_FANCY.match(line) or RE_EMPTY_ITEM.match(line)
+
+
+def _render(kind, items):
+    if kind == 'para':
+        return _inline(items[0][1])
+
+    if kind == 'heading':
+        level, content = items[0]
+        title = _inline(content)
+        if '\\' in title or '~' in title:
+            raise Unsupported('Heading markup')
+        return f'\\{HEADINGS[level]}{{{title}}}'
+
+    body = []
+    for _, content, more in items:
+        text = _inline(content, more).replace('\n', '\n  ')
+        body.append(f'\t\\item {text}')
+
+    if kind == 'list*':
+        return '\\begin{itemize}\n%s\n\\end{itemize}' % '\n'.join(body)
+
+    start = items[0][0]
+    label = {
+        '.': r'\arabic{enumi}.',
+        ')': r'\arabic{enumi})',
+        '()': r'(\arabic{enumi})',
+    }[kind[4:]]
+    head = [f'\\def\\labelenumi{{{label}}}']
+    if start != 1:
+        head.append(f'\\setcounter{{enumi}}{{{start - 1}}}')
+    return '\\begin{enumerate}\n%s\n%s\n\\end{enumerate}' % ('\n'.join(head), '\n'.join(body))
+
+
+def _inline(text, more=False):
+    """
+    Convert paragraph text, `more` tells if the source goes on on the next line
+    """
+    lines = text.split('\n')
+    out = []
+    for i, line in enumerate(lines):
+        followed = more or i < len(lines) - 1
+        if followed and line.endswith('  '):
+            line = line.rstrip(' ') + LINE_BREAK
+        stripped = RE_ABBREVIATION.sub('\\1\u00a0', line).strip(' ')
+        backslashes = len(stripped) - len(stripped.rstrip('\\'))
+        if backslashes % 2:
+            stripped = stripped[:-1].rstrip(' ') + ESCAPED_BREAK
+        out.append(re.sub(r' {2,}', ' ', stripped))
+    text = '\n'.join(out)
+
+    if re.search(r'(^|\n)[%s%s]' % (LINE_BREAK, ESCAPED_BREAK), text):
+        raise Unsupported('Line break without content')
+
+    text = re.sub(r'\\(.)', _escaped, text, flags=re.S)
+    text = text.replace('...', ELLIPSIS)
+    text = _quotes(text)
+    if re.search(r'%s[%s%s]' % (OPEN_QUOTE, LINE_BREAK, ESCAPED_BREAK), text):
+        raise Unsupported('Line break in quote')
+
+    latex = _emphasis(text, 0)
+    return RE_CONTROL_WORD.sub(_control_word, latex)
+
+
+def _escaped(match):
+    char = match.group(1)
+    if char == ' ':
+        return '\u00a0'
+    if char.isascii() and not char.isalnum() and char != '\n':
+        return chr(ESCAPED + ord(char))
+    return chr(ESCAPED + ord('\\')) + char
+
+
+def _quotes(text):
+    if re.search(r"(^|[\s(\[{])'\S", text):
+        raise Unsupported('Single quotes')
+    out = []
+    for i, char in enumerate(text):
+        if char != '"':
+            out.append(char)
+            continue
+        prev = text[i - 1] if i > 0 else ' '
+        nxt = text[i + 1] if i + 1 < len(text) else ' '
+        if nxt.isspace() or nxt == LINE_BREAK:
+            out.append(CLOSE_QUOTE)
+        elif prev.isspace() or prev in '([{':
+            out.append(OPEN_QUOTE)
+        elif prev.isalnum():
+            out.append(CLOSE_QUOTE)
+        else:
+            raise Unsupported('Ambiguous quote')
+    return ''.join(out)
+
+
+def _delimiters(text):
+    """
+    Find emphasis delimiter runs, with their ability to open and close
+    """
+    runs = []
+    for match in re.finditer(r'\*+|_+', text):
+        start, end = match.span()
+        prev = text[start - 1] if start > 0 else ' '
+        nxt = text[end] if end < len(text) else ' '
+        char = match.group()[0]
+        if nxt in ('\n', ESCAPED_BREAK):
+            raise Unsupported('Emphasis at line end')
+        can_open = nxt not in SPACES
+        can_close = prev not in SPACES and prev != '\n'
+        if char == '_':
+            can_open = can_open and not _word(prev)
+            can_close = can_close and not _word(nxt)
+        runs.append((start, end, char, can_open, can_close))
+    return runs
+
+
+def _word(char):
+    return char.isalnum() or char == '_'
+
+
+def _emphasis(text, depth):
+    runs = _delimiters(text)
+    out = []
+    pos = 0
+    i = 0
+    while i < len(runs):
+        start, end, char, can_open, _ = runs[i]
+        length = end - start
+        if start < pos or not can_open:
+            i += 1
+            continue
+        if length > 3:
+            raise Unsupported('Emphasis')
+        closer = None
+        nested = []
+        for j in range(i + 1, len(runs)):
+            c_start, c_end, c_char, c_open, c_close = runs[j]
+            if c_char != char:
+                continue
+            c_length = c_end - c_start
+            if c_close and nested and nested[-1] == c_length:
+                nested.pop()
+            elif c_close and not nested:
+                if c_length != length:
+                    raise Unsupported('Overlapping emphasis')
+                closer = j
+                break
+            elif c_open:
+                nested.append(c_length)
+        if closer is None:
+            if char == '*' or depth:
+                raise Unsupported('Unmatched emphasis')
+            i += 1
+            continue
+        c_start, c_end = runs[closer][0], runs[closer][1]
+        inner = _emphasis(text[end:c_start], depth + 1)
+        if length == 1:
+            inner = f'\\emph{{{inner}}}'
+        elif length == 2:
+            inner = f'\\textbf{{{inner}}}'
+        else:
+            inner = f'\\textbf{{\\emph{{{inner}}}}}'
+        out.append(_escape(text[pos:start]))
+        out.append(inner)
+        pos = c_end
+        i = closer + 1
+    out.append(_escape(text[pos:]))
+    return ''.join(out)
+
+
+def _escape(text):
+    out = []
+    for char in text:
+        if char in PLACEHOLDERS:
+            out.append(PLACEHOLDERS[char])
+        elif ord(char) >= ESCAPED:
+            char = chr(ord(char) - ESCAPED)
+            out.append(r'\textquotesingle{}' if char == "'" else ESCAPES.get(char, char))
+        else:
+            out.append(ESCAPES.get(char, char))
+    return ''.join(out)
+
+
+def _control_word(match):
+    word, nxt = match.groups()
+    if not nxt:
+        return f'{word}{{}}'
+    if nxt.isalpha():
+        return f'{word} {nxt}'
+    if nxt == '\\':
+        return f'{word}{{}}{nxt}'
+    return f'{word}{nxt}'
@@ -0,0 +1,203 @@
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Metrics registry
+# Counters, gauges and histograms kept in plain dicts keyed by label values,
+# exposed at /metrics in the Prometheus text format. Recording is a dict
+# lookup and an addition (a bisection for histograms), so it stays on in
+# production. Values that are cheaper to read than to track (pool size,
+# queue lengths) are set by collectors, run when metrics are scraped.
+REGISTRY = {}
+COLLECTORS = []
+# Histogram observations of the current request, when it is profiled
+TRACE = contextvars.ContextVar('metrics_trace', default=None)
+
+# Seconds, from a cached page to a full pdf render
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for n, v in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def samples(self):
+        for values, value in sorted(self.values.items()):
+            yield self.name, _labels(self.labels, values), value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for name, labels, value in self.samples():
+            yield f'{name}{labels} {value}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def reset(self):
+        self.values.clear()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # Bucket counts, then sum
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+        trace = TRACE.get()
+        if trace is not None:
+            trace.append((self.name, labels, value))
+
+    def count(self, *labels):
+        series = self.values.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        names = self.labels + ('le',)
+        for values, series in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                total += count
+                yield f'{self.name}_bucket', _labels(names, values + (bound,)), total
+            yield f'{self.name}_sum', _labels(self.labels, values), series[-1]
+            yield f'{self.name}_count', _labels(self.labels, values), total
+
+
+def _register(metric):
+    if metric.name in REGISTRY:
+        raise ValueError(f'Metric {metric.name} already registered')
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+def counter(name, doc, labels=()):
+    return _register(Counter(name, doc, labels))
+
+
+def gauge(name, doc, labels=()):
+    return _register(Gauge(name, doc, labels))
+
+
+def histogram(name, doc, labels=(), buckets=BUCKETS):
+    return _register(Histogram(name, doc, labels, buckets))
+
+
+def collector(func):
+    """
+    Register a coroutine updating gauges before each scrape
+    """
+    COLLECTORS.append(func)
+    return func
+
+
+async def expose():
+    for func in COLLECTORS:
+        try:
+            await func()
+        except Exception as e:
+            logger.warning('Metrics collector %s failed', func.__name__)
+            logger.exception(e)
+    lines = [line for name in sorted(REGISTRY) for line in REGISTRY[name].expose()]
+    return '\n'.join(lines) + '\n'
+
+
+# ################################################################# UPSTREAM
+UPSTREAM = histogram(
+    'upstream_request_duration_seconds',
+    'Calls to other services (auth, ark, vocabulary), by endpoint',
+    ('service', 'endpoint'))
+UPSTREAM_ERRORS = counter(
+    'upstream_errors_total',
+    'Failed calls to other services, by endpoint',
+    ('service', 'endpoint'))
+
+
+# ###################################################################### HTTP
+REQUESTS = histogram(
+    'http_request_duration_seconds',
+    'Time to answer a request, by route',
+    ('method', 'route'))
+RESPONSES = counter(
+    'http_responses_total',
+    'Responses sent, by route and status',
+    ('method', 'route', 'status'))
+
+
+def route_name(scope):
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    endpoint = scope.get('endpoint')
+    if endpoint is not None:
+        # Mounted apps (static files) are labelled by their mount path
+        return getattr(endpoint, '__name__', None) or scope.get('root_path') or 'unknown'
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Time requests, labelled by route template (not by path, which is unbounded)
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = route_name(scope)
+            REQUESTS.observe(time.perf_counter() - start, scope['method'], route)
+            RESPONSES.inc(scope['method'], route, status)
@@ -1,11 +1,14 @@
+import base64
+import binascii
 import calendar
+import json
 import math
 import os
 from datetime import datetime
 
 import pytz
 
-COUNTER = 0
+from . import auth, lib_metrics, lib_sql, lib_store, lib_views, lib_voc
 
 
 def check_envs(env_list):
@@ -28,56 +31,26 @@ def status_get(start_time, version):
         'online_since': str(start_time),
         'online_for_seconds': delta_s,
         'api_version': version,
-        'api_counter': COUNTER,
+        'api_counter': sum(lib_metrics.RESPONSES.values.values()),
+        'pdf_store': lib_store.stats(),
+        'auth_cache': auth.user_cache().stats(),
+        'voc': lib_voc.stats(),
+        'views': lib_views.stats(),
+        'statements': lib_sql.stats(),
     }
 
 
-async def listCourts(db, country):
-    sql = """
-    SELECT DISTINCT(court) AS courts
-    FROM ecli_document
-    WHERE status = 'public'
-    AND country = $1
+def cursor_encode(*values):
     """
-
-    rows = await db.fetch(sql, country)
-
-    if not rows:
-        raise RuntimeError("No results")
-
-    return [x['courts'] for x in rows]
-
-
-async def listYears(db, country, court):
-    sql = """
-    SELECT DISTINCT(year) AS years
-    FROM ecli_document
-    WHERE status = 'public'
-    AND country = $1
-    AND court = $2
-    """
-
-    rows = await db.fetch(sql, country, court)
-
-    if not rows:
-        raise RuntimeError("No results")
-
-    return [x['years'] for x in rows]
-
-
-async def listDocuments(db, country, court, year):
-    sql = """
-    SELECT identifier AS documents
-    FROM ecli_document
-    WHERE status = 'public'
-    AND country = $1
-    AND court = $2
-    AND year = $3
+    Opaque pagination cursor from the sort key of the last row of a page
     """
+    raw = json.dumps(values, default=lambda v: v.isoformat())
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
 
-    rows = await db.fetch(sql, country, court, year)
-
-    if not rows:
-        raise RuntimeError("No results")
 
-    return [x['documents'] for x in rows]
+def cursor_decode(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
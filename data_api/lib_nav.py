@@ -0,0 +1,102 @@
+import asyncio
+
+from .deps import logger, oj_db
+from .lib_cfg import config
+
+# Navigation tree
+# Public documents, as country -> court -> year -> identifier -> count.
+# Built at startup, kept up to date when a document enters or leaves the
+# public status, and rebuilt periodically so changes made through other
+# processes are picked up too.
+TREE = {}
+_REFRESHER = None
+
+
+def add(country, court, year, identifier, count=1):
+    years = TREE.setdefault(country, {}).setdefault(court, {})
+    documents = years.setdefault(year, {})
+    documents[identifier] = documents.get(identifier, 0) + count
+
+
+def remove(country, court, year, identifier):
+    path = [(TREE, country)]
+    try:
+        courts = TREE[country]
+        path.append((courts, court))
+        years = courts[court]
+        path.append((years, year))
+        documents = years[year]
+    except KeyError:
+        return
+    if documents.get(identifier, 0) > 1:
+        documents[identifier] -= 1
+        return
+    documents.pop(identifier, None)
+    # Prune empty branches
+    for node, key in reversed(path):
+        if node[key]:
+            break
+        del node[key]
+
+
+async def build():
+    global TREE  # pylint:disable=global-statement
+    sql = """
+    SELECT country, court, year, identifier, COUNT(*) AS count
+    FROM ecli_document
+    WHERE status = 'public'
+    GROUP BY country, court, year, identifier
+    """
+    async with oj_db() as db:
+        rows = await db.fetch(sql)
+
+    TREE = {}
+    for row in rows:
+        add(row['country'], row['court'], row['year'], row['identifier'], row['count'])
+    logger.debug('Navigation tree built, %s documents', len(rows))
+
+
+def count(node):
+    if isinstance(node, int):
+        return node
+    return sum(count(child) for child in node.values())
+
+
+def children(path, counts=False):
+    """
+    Sorted keys of the tree node at path
+    """
+    node = TREE
+    for key in path:
+        node = node.get(key, {})
+
+    if not node:
+        raise RuntimeError("No results")
+
+    keys = sorted(node.keys())
+    if counts:
+        return [{'name': key, 'count': count(node[key])} for key in keys]
+    return keys
+
+
+async def refresh_loop():
+    while True:
+        await asyncio.sleep(config.key(['nav', 'refresh_interval']))
+        try:
+            await build()
+        except Exception as e:
+            logger.warning('Navigation tree refresh failed')
+            logger.exception(e)
+
+
+def start():
+    global _REFRESHER  # pylint:disable=global-statement
+    if _REFRESHER is None:
+        _REFRESHER = asyncio.ensure_future(refresh_loop())
+
+
+def stop():
+    global _REFRESHER  # pylint:disable=global-statement
+    if _REFRESHER is not None:
+        _REFRESHER.cancel()
+        _REFRESHER = None
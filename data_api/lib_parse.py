@@ -1,21 +1,31 @@
+import itertools
 import os
 import re
 import shutil
-import subprocess
 import tempfile
-from subprocess import PIPE, STDOUT, Popen
+import threading
+from functools import lru_cache
 
 from markdown2 import Markdown
 
+from . import lib_md
 from .deps import logger
+from .lib_cfg import config
+from .lib_render import RenderError, call, run
 
-# FIXME: Remove global variable
-ITER = 0
-MDOWNER = Markdown()
+# Markdown instances keep conversion state, and derive() runs in the render
+# worker threads: one instance per thread
+_LOCAL = threading.local()
+
+
+def markdowner():
+    if not hasattr(_LOCAL, 'markdown'):
+        _LOCAL.markdown = Markdown()
+    return _LOCAL.markdown
 
 
 def txt2html(text):
-    html_text = MDOWNER.convert(
+    html_text = markdowner().convert(
         text.replace('_', '\\_')
     )
     html_text = convert(html_text)
@@ -27,23 +37,52 @@ def convert(text):
     return text
 
 
-def repl(match):
-    global ITER
-    group = match.group(1)
-    out = f'<a name="p{ITER}"></a><div class="page_bar"><a href="#p{ITER}">{group}</a></div>'
-    ITER = ITER + 1
-    return out
+def page_breaks(text):
+    page = itertools.count(1)
 
+    def repl(match):
+        num = next(page)
+        group = match.group(1)
+        return f'<a name="p{num}"></a><div class="page_bar"><a href="#p{num}">{group}</a></div>'
 
-def page_breaks(text):
-    global ITER
     # text = re.sub(r"---(.*?)---", r'<div class="page_bar">\1</div>', text)
-    ITER = 1
     text = re.sub(r"-{4,}", '---', text)
     text = re.sub(r"---(.+?)---", repl, text)
     return text
 
 
+def page_index(text):
+    """
+    List page markers, with their html anchor and offset in the text
+    """
+    return [{
+        'anchor': f'p{num}',
+        'label': match.group(1),
+        'offset': match.start(),
+    } for num, match in enumerate(re.finditer(r"-{3,}([^-].*?)-{3,}", text), 1)]
+
+
+def text_stats(text):
+    return {
+        'chars': len(text),
+        'words': len(text.split()),
+        'paragraphs': len([p for p in re.split(r'\n\s*\n', text) if p.strip()]),
+    }
+
+
+def derive(text):
+    """
+    Artifacts computed once when a document is written
+    """
+    pages = page_index(text)
+    return {
+        'html': txt2html(text),
+        'pages': pages,
+        'stats': {**text_stats(text), 'pages': len(pages)},
+    }
+
+
+@lru_cache(maxsize=None)
 def getLatexTemplate(name):
     lines = []
     path = '%s/../templates' % os.path.dirname(__file__)
@@ -53,17 +92,16 @@ def getLatexTemplate(name):
     return ''.join(lines)
 
 
-def md2latex(data, template='default_doc'):
-    # See http://www.practicallyefficient.com/2016/12/04/pandoc-and-python.html
-    p = Popen(['pandoc', '-f', 'markdown', '-t', 'latex', '--wrap=preserve'], stdout=PIPE, stdin=PIPE, stderr=STDOUT)
-    latex_raw = p.communicate(input=str.encode(data.get('body', '')))[0]
-    latex = latex_raw.decode()
-    # remove \tightlist
-    latex = re.sub(r'\\tightlist\n', r'', latex)
-    # join \item with its text on a single line; also put tabs in front of \item
-    latex = re.sub(r'\\item\n\s+', r'\t\\item ', latex)
-    # remove all LaTeX labels
-    latex = re.sub(r'\\label.*', r'', latex)
+async def md2latex(data, template='default_doc'):
+    body = data.get('body', '')
+    latex = None
+    if config.key(['render', 'latex']) == 'native':
+        try:
+            latex = await call(lib_md.md2latex, body)
+        except lib_md.Unsupported as e:
+            logger.debug('Native latex conversion not possible (%s), using pandoc', e)
+    if latex is None:
+        latex = await pandoc2latex(body)
 
     # add page breaks
     latex = re.sub(r"-{4,}", '---', latex)
@@ -77,24 +115,38 @@ def md2latex(data, template='default_doc'):
     }
 
 
-def latex2pdf(latex):
-    logger.debug('Starting latex 2 pdf, file size %s', len(latex))
-    temp = tempfile.mkdtemp()
-    wdir = os.getcwd()
-    os.chdir(temp)
-
-    f = open('file.tex', 'w')
-    f.write(latex)
-    f.close()
-
-    proc = Popen(['pdflatex', '-interaction=batchmode', 'file.tex'])
-    proc.communicate()
+async def pandoc2latex(text):
+    # See http://www.practicallyefficient.com/2016/12/04/pandoc-and-python.html
+    _, latex_raw = await run(
+        ['pandoc', '-f', 'markdown', '-t', 'latex', '--wrap=preserve'],
+        data=str.encode(text)
+    )
+    latex = latex_raw.decode()
+    # remove \tightlist
+    latex = re.sub(r'\\tightlist\n', r'', latex)
+    # join \item with its text on a single line; also put tabs in front of \item
+    latex = re.sub(r'\\item\n\s+', r'\t\\item ', latex)
+    # remove all LaTeX labels
+    latex = re.sub(r'\\label\{[^}]*\}', r'', latex)
+    return latex
 
-    rawFile = None
-    with open('file.pdf', mode='rb') as f:
-        rawFile = f.read()
 
-    shutil.rmtree(temp)
-    os.chdir(wdir)
+async def latex2pdf(latex):
+    logger.debug('Starting latex 2 pdf, file size %s', len(latex))
+    # Every job gets its own working directory
+    temp = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(temp, 'file.tex'), 'w', encoding='utf8') as f:
+            f.write(latex)
+
+        await run(['pdflatex', '-interaction=batchmode', 'file.tex'], cwd=temp)
+
+        rawFile = None
+        with open(os.path.join(temp, 'file.pdf'), mode='rb') as f:
+            rawFile = f.read()
+    except FileNotFoundError:
+        raise RenderError('pdflatex produced no output')
+    finally:
+        shutil.rmtree(temp)
 
     return rawFile
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from starlette.datastructures import Headers, QueryParams
+
+from . import lib_metrics
+from .auth import get_current_active_user_opt, get_current_user
+from .deps import logger
+from .lib_cfg import config
+
+# Request profiling
+# A profiled request runs with a sampler thread recording stacks at a fixed
+# interval, as collapsed stacks for flamegraph tools. On the event loop only
+# the request's own task is recorded: samples taken while the loop runs other
+# requests or waits are counted as `<other tasks>` and `<idle>`. Worker
+# threads (renders, sync dependencies) are recorded whole and may include
+# work done for concurrent requests. Awaited work (database, pandoc,
+# services) shows up as the loop waiting, so the timings recorded by
+# lib_metrics during the request are stored alongside, stage by stage.
+# Admins ask for it with `?profile=1` or an `X-Profile: 1` header, a
+# fraction of all requests can be profiled too (`PROFILE_SAMPLE_RATE`).
+# Profiles are written to the profile directory and read at /profiles/{id}.
+ACTIVE = 0
+
+
+class Sampler:
+    """
+    Sample the stacks of all threads, only those of `task` on its event loop
+    """
+    def __init__(self, interval, task=None):
+        self.interval = interval
+        self.task = task
+        self.stacks = Counter()
+        self.samples = 0
+        # Created on the loop thread
+        self._loop_thread = threading.get_ident() if task is not None else None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():  # pylint:disable=protected-access
+                if ident == own:
+                    continue
+                if ident == self._loop_thread:
+                    current = asyncio.current_task(self.task.get_loop())
+                    if current is not self.task:
+                        label = '<idle>' if current is None else '<other tasks>'
+                        self.stacks[f'{names.get(ident, str(ident))};{label}'] += 1
+                        continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def profile_path(profile_id, ext):
+    return os.path.join(config.key(['profile', 'path']), f'{profile_id}.{ext}')
+
+
+def save(profile_id, meta, sampler):
+    directory = config.key(['profile', 'path'])
+    os.makedirs(directory, exist_ok=True)
+    with open(profile_path(profile_id, 'collapsed'), 'w', encoding='utf8') as f:
+        f.write(sampler.collapsed())
+    with open(profile_path(profile_id, 'json'), 'w', encoding='utf8') as f:
+        json.dump(meta, f)
+
+    # Keep the most recent ones
+    files = sorted(
+        (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')),
+        key=os.path.getmtime,
+    )
+    for old in files[:-config.key(['profile', 'keep'])]:
+        for ext in ('json', 'collapsed'):
+            try:
+                os.unlink(old[:-4] + ext)
+            except FileNotFoundError:
+                pass
+
+
+def load(profile_id):
+    """
+    Stored profile, None if unknown
+    """
+    try:
+        profile_id = str(uuid.UUID(profile_id))
+        with open(profile_path(profile_id, 'json'), encoding='utf8') as f:
+            meta = json.load(f)
+        with open(profile_path(profile_id, 'collapsed'), encoding='utf8') as f:
+            meta['collapsed'] = f.read()
+    except (ValueError, FileNotFoundError):
+        return None
+    return meta
+
+
+async def is_admin(headers):
+    scheme, _, token = headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    try:
+        user = await get_current_active_user_opt(await get_current_user(token))
+    except Exception:
+        return False
+    return bool(user and user.admin)
+
+
+class ProfileMiddleware:
+    """
+    Profile requests asked for by admins, and a sample of the others
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def wanted(self, scope):
+        headers = Headers(scope=scope)
+        asked = headers.get('x-profile') == '1' or QueryParams(scope['query_string']).get('profile') == '1'
+        if asked:
+            return await is_admin(headers)
+        rate = config.key(['profile', 'sample_rate'])
+        # Sampled profiles do not overlap
+        return rate > 0 and ACTIVE == 0 and random.random() < rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not await self.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        global ACTIVE  # pylint:disable=global-statement
+        profile_id = str(uuid.uuid4())
+
+        async def send_id(message):
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': [*message['headers'], (b'x-profile-id', profile_id.encode())]}
+            await send(message)
+
+        sampler = Sampler(config.key(['profile', 'interval']), asyncio.current_task())
+        stages = []
+        token = lib_metrics.TRACE.set(stages)
+        ACTIVE += 1
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_id)
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - start
+            ACTIVE -= 1
+            lib_metrics.TRACE.reset(token)
+            meta = {
+                'id': profile_id,
+                'method': scope['method'],
+                'path': scope['path'],
+                'route': lib_metrics.route_name(scope),
+                'date': time.time(),
+                'duration': duration,
+                'interval': sampler.interval,
+                'samples': sampler.samples,
+                'stages': [
+                    {'metric': name, 'labels': list(labels), 'seconds': seconds}
+                    for name, labels, seconds in stages
+                ],
+            }
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, save, profile_id, meta, sampler)
+                logger.info('Request %s %s profiled as %s', scope['method'], scope['path'], profile_id)
+            except OSError as e:
+                logger.warning('Failed to store profile %s', profile_id)
+                logger.exception(e)
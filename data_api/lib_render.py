@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from asyncio.subprocess import PIPE, STDOUT
+from contextlib import asynccontextmanager
+
+from . import lib_metrics
+from .deps import logger
+from .lib_cfg import config
+
+# Render executor
+# pandoc and pdflatex run as asyncio subprocesses, so the event loop keeps
+# serving requests while a document compiles. The number of running jobs is
+# bounded, as is the number of jobs allowed to wait for a slot.
+PENDING = 0
+_SLOTS = None
+
+DURATION = lib_metrics.histogram(
+    'render_duration_seconds',
+    'Render time (pandoc, pdflatex, in-process converters), once started',
+    ('tool',))
+WAIT = lib_metrics.histogram(
+    'render_wait_seconds',
+    'Time waiting for a render slot')
+QUEUE = lib_metrics.gauge(
+    'render_pending',
+    'Renders running or waiting for a slot')
+
+
+@lib_metrics.collector
+async def render_metrics():
+    QUEUE.set(PENDING)
+
+
+class RenderError(RuntimeError):
+    pass
+
+
+class RenderBusy(RenderError):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+def _slots():
+    global _SLOTS  # pylint:disable=global-statement
+    if _SLOTS is None:
+        _SLOTS = asyncio.Semaphore(config.key(['render', 'concurrency']))
+    return _SLOTS
+
+
+@asynccontextmanager
+async def slot():
+    global PENDING  # pylint:disable=global-statement
+    if PENDING >= config.key(['render', 'queue']):
+        raise RenderBusy('Render queue is full')
+    PENDING += 1
+    start = time.perf_counter()
+    try:
+        async with _slots():
+            WAIT.observe(time.perf_counter() - start)
+            yield
+    finally:
+        PENDING -= 1
+
+
+async def run(cmd, data=None, cwd=None):
+    """
+    Run a render command, return its exit code and output
+    """
+    async with slot():
+        start = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=STDOUT,
+            cwd=cwd,
+        )
+        try:
+            out, _ = await asyncio.wait_for(
+                proc.communicate(input=data),
+                timeout=config.key(['render', 'timeout'])
+            )
+        except asyncio.TimeoutError:
+            logger.warning('Render command %s timed out', cmd[0])
+            proc.kill()
+            await proc.wait()
+            raise RenderTimeout(f'{cmd[0]} timed out')
+        finally:
+            DURATION.observe(time.perf_counter() - start, os.path.basename(cmd[0]))
+
+    return proc.returncode, out
+
+
+async def call(func, *args):
+    """
+    Run an in-process render function in a worker thread
+    """
+    async with slot():
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+        finally:
+            DURATION.observe(time.perf_counter() - start, func.__name__)
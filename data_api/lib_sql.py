@@ -0,0 +1,241 @@
+import json
+import time
+
+import asyncpg
+
+from . import lib_metrics
+
+# Statement registry
+# The statements used by the request handlers, prepared once on every pooled
+# connection (see `init_connection`) instead of being parsed and planned per
+# request. Connections created elsewhere (or test doubles) get the same SQL
+# inline. json and jsonb values are encoded from and decoded to python
+# objects by the connection codecs, enum values come back as text.
+
+DOCUMENT_FIELDS = """
+    id_internal,
+    identifier,
+    ecli,
+    text,
+    views_hash,
+    status,
+    date_created,
+    date_updated
+"""
+
+# Document page: the row, its labels and its links in a single round trip.
+# Labels and links come back as arrays, decoded by asyncpg.
+PAGE_SQL = """
+SELECT
+    d.id_internal,
+    d.ecli,
+    d.html,
+    CASE WHEN d.html IS NULL THEN d.text END AS text,
+    d.appeal,
+    ARRAY(
+        SELECT jsonb_array_elements_text(d.meta->'labels')
+        WHERE jsonb_typeof(d.meta->'labels') = 'array'
+    ) AS labels,
+    d.hash,
+    d.views_hash,
+    d.status,
+    d.date_created,
+    d.date_updated,
+    l.links
+FROM ecli_document d
+LEFT JOIN LATERAL (
+    SELECT array_agg(ARRAY[target_type::text, target_identifier, target_label]) AS links
+    FROM ecli_links
+    WHERE id_internal = d.id_internal
+) l ON TRUE
+WHERE {}
+"""
+
+COLLECTION_SQL = """
+SELECT id_internal as id, date_created, ecli, status, appeal, {meta}lang, date_updated
+FROM ecli_document
+WHERE status = $1
+{after}
+ORDER BY date_created ASC, id_internal ASC
+LIMIT $2
+"""
+COLLECTION_AFTER = 'AND (date_created, id_internal) > ($3, $4)'
+
+STATEMENTS = {
+    # Formats (txt, tex, pdf)
+    'format_by_hash': f"SELECT {DOCUMENT_FIELDS} FROM ecli_document WHERE hash = $1",
+    'format_by_ecli': f"SELECT {DOCUMENT_FIELDS} FROM ecli_document WHERE ecli = $1 AND status = 'public'",
+
+    # Html pages
+    'page_by_hash': PAGE_SQL.format('d.hash = $1'),
+    'page_by_ecli': PAGE_SQL.format("d.ecli = $1 AND d.status = 'public'"),
+
+    # Collections, first and next pages, slim ones without meta (the heavy column)
+    'collection': COLLECTION_SQL.format(meta='meta, ', after=''),
+    'collection_after': COLLECTION_SQL.format(meta='meta, ', after=COLLECTION_AFTER),
+    'collection_slim': COLLECTION_SQL.format(meta='', after=''),
+    'collection_slim_after': COLLECTION_SQL.format(meta='', after=COLLECTION_AFTER),
+
+    # Documents
+    'document_insert': """
+    INSERT INTO ecli_document (
+        ecli,
+        country,
+        court,
+        year,
+        identifier,
+        text,
+        meta,
+        ukey,
+        lang,
+        appeal,
+        hash,
+        html,
+        pages,
+        stats
+    ) VALUES ( $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+    RETURNING id_internal
+    """,
+    'document_read': """
+    SELECT
+        id_internal as id,
+        ecli,
+        country,
+        court,
+        year,
+        identifier,
+        text,
+        meta->'labels' as labels,
+        flags,
+        lang,
+        appeal,
+        status,
+        hash,
+        date_created,
+        date_updated,
+        ukey,
+        views_hash,
+        views_public,
+        pages,
+        stats
+    FROM ecli_document
+    WHERE id_internal = $1
+    """,
+    'document_links': """
+    SELECT
+        target_type as kind,
+        target_identifier as link,
+        target_label as label
+    FROM ecli_links
+    WHERE id_internal = $1
+    """,
+    'document_lock': """
+    SELECT status, ecli, text, country, court, year, identifier, hash
+    FROM ecli_document
+    WHERE id_internal = $1
+    FOR UPDATE
+    """,
+    'document_update': """
+    UPDATE ecli_document
+    SET
+        ecli = $2,
+        country = $3,
+        court = $4,
+        year = $5,
+        identifier = $6,
+        text = $7,
+        meta = $8,
+        lang = $9,
+        appeal = $10,
+        status = $11,
+        date_updated = $12,
+        html = $13,
+        pages = $14,
+        stats = $15
+    WHERE id_internal = $1
+    """,
+    'document_ark_state': "SELECT hash, ark FROM ecli_document WHERE id_internal = $1",
+    'document_ukey': "SELECT ukey FROM ecli_document WHERE id_internal = $1",
+    'document_ark': "UPDATE ecli_document SET ark = $1 WHERE id_internal = $2",
+}
+
+DURATION = lib_metrics.histogram(
+    'db_statement_duration_seconds',
+    'Registered statements run time, by statement',
+    ('statement',))
+
+
+class Connection(asyncpg.Connection):
+    """
+    Pooled connection, with its prepared statements
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = {}
+
+
+def jsonb_encode(value):
+    return b'\x01' + json.dumps(value).encode()
+
+
+def jsonb_decode(data):
+    return json.loads(data[1:])
+
+
+async def init_connection(conn):
+    # Binary codecs, so they also apply to copy_records_to_table
+    await conn.set_type_codec(
+        'jsonb', encoder=jsonb_encode, decoder=jsonb_decode, schema='pg_catalog', format='binary')
+    await conn.set_type_codec(
+        'json', encoder=lambda v: json.dumps(v).encode(), decoder=json.loads, schema='pg_catalog', format='binary')
+    if isinstance(conn, Connection):
+        for name, sql in STATEMENTS.items():
+            conn.statements[name] = await conn.prepare(sql)
+
+
+async def create_pool(**kwargs):
+    return await asyncpg.create_pool(**kwargs, init=init_connection, connection_class=Connection)
+
+
+async def run(db, method, name, *args):
+    """
+    Run a registered statement, `method` being fetch, fetchrow, fetchval or execute
+    """
+    start = time.perf_counter()
+    try:
+        statement = getattr(db, 'statements', {}).get(name)
+        if statement is None:
+            return await getattr(db, method)(STATEMENTS[name], *args)
+        if method == 'execute':
+            method = 'fetch'
+        try:
+            return await getattr(statement, method)(*args)
+        except asyncpg.InvalidCachedStatementError:
+            # The schema changed under the prepared statement
+            db.statements[name] = await db.prepare(STATEMENTS[name])
+            return await getattr(db.statements[name], method)(*args)
+    finally:
+        DURATION.observe(time.perf_counter() - start, name)
+
+
+async def fetch(db, name, *args):
+    return await run(db, 'fetch', name, *args)
+
+
+async def fetchrow(db, name, *args):
+    return await run(db, 'fetchrow', name, *args)
+
+
+async def fetchval(db, name, *args):
+    return await run(db, 'fetchval', name, *args)
+
+
+async def execute(db, name, *args):
+    return await run(db, 'execute', name, *args)
+
+
+def stats():
+    return {
+        name: {'calls': sum(series[:-1]), 'avg_ms': round(series[-1] / sum(series[:-1]) * 1000, 3)}
+        for (name,), series in DURATION.values.items()
+    }
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from starlette.responses import FileResponse
+
+from .deps import logger
+from .lib_cfg import config
+from .lib_http import accepted_encoding, compress, variant_headers
+from .lib_parse import getLatexTemplate, latex2pdf, md2latex
+
+# Rendered PDF store
+# Files are addressed by a hash of everything that goes into the rendering
+# (text, title and latex template), so an unchanged document is never
+# compiled twice.
+STATS = {
+    'hits': 0,
+    'misses': 0,
+    'variant_hits': 0,
+    'variant_misses': 0,
+}
+# Renders in progress, concurrent requests for the same pdf wait on the same job
+_RENDERING = {}
+
+
+def pdf_key(data, template='default_doc'):
+    h = hashlib.sha256()
+    parts = (
+        data.get('body', ''),
+        data.get('title', ''),
+        getLatexTemplate(template),
+        config.key(['render', 'latex']),
+    )
+    for part in parts:
+        h.update(part.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def pdf_path(key):
+    return os.path.join(config.key(['pdf_store', 'path']), key[:2], f'{key}.pdf')
+
+
+async def pdf_get(data, template='default_doc'):
+    """
+    Return the path of the rendered pdf, rendering it on a miss
+    """
+    path = pdf_path(pdf_key(data, template))
+    if os.path.exists(path):
+        STATS['hits'] += 1
+        return path
+
+    STATS['misses'] += 1
+    if path not in _RENDERING:
+        _RENDERING[path] = asyncio.ensure_future(_render(path, data, template))
+        _RENDERING[path].add_done_callback(lambda _: _RENDERING.pop(path, None))
+    return await asyncio.shield(_RENDERING[path])
+
+
+async def _render(path, data, template):
+    raw = await latex2pdf(await md2latex(data, template))
+    _write(path, raw)
+    logger.debug('Stored pdf %s', path)
+    return path
+
+
+def _write(path, raw):
+    # Write to a temporary file first, concurrent readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(raw)
+    os.replace(tmp, path)
+
+
+def pdf_drop(data, template='default_doc'):
+    """
+    Remove a stored pdf, if any
+    """
+    path = pdf_path(pdf_key(data, template))
+    try:
+        os.remove(path)
+        logger.debug('Dropped pdf %s', path)
+    except FileNotFoundError:
+        pass
+
+
+# Compressed variants
+# Response bodies compressed once per version of a document, addressed by
+# the response ETag and the content coding. Variants of a document are
+# dropped when it is updated.
+ENCODINGS = ('gzip', 'br')
+
+
+def variant_path(etag, encoding):
+    key = hashlib.sha256(f'{etag}\0{encoding}'.encode()).hexdigest()
+    return os.path.join(config.key(['pdf_store', 'path']), key[:2], f'{key}.{encoding}')
+
+
+def variant_find(etag, encoding):
+    """
+    Path of the stored variant, None if there is none yet
+    """
+    path = variant_path(etag, encoding)
+    if os.path.exists(path):
+        STATS['variant_hits'] += 1
+        return path
+    return None
+
+
+async def variant_put(etag, encoding, body):
+    STATS['variant_misses'] += 1
+    path = variant_path(etag, encoding)
+    raw = await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding, True)
+    _write(path, raw)
+    return path
+
+
+def variant_drop(*etags):
+    """
+    Remove the stored variants of responses, if any
+    """
+    for etag in etags:
+        for encoding in ENCODINGS:
+            try:
+                os.remove(variant_path(etag, encoding))
+            except FileNotFoundError:
+                pass
+
+
+def variant_cached(request, headers, media_type):
+    """
+    Stored variant of a response, if the client accepts one
+    """
+    encoding = accepted_encoding(request.headers.get('accept-encoding', ''))
+    path = variant_find(headers['ETag'], encoding) if encoding else None
+    if path is None:
+        return None
+    return FileResponse(path, media_type=media_type, headers=variant_headers(headers, encoding))
+
+
+async def variant_send(request, response, headers):
+    """
+    Send a compressed variant of a large response, storing it for the next requests
+    """
+    response.headers['Vary'] = 'Accept-Encoding'
+    encoding = accepted_encoding(request.headers.get('accept-encoding', ''))
+    if encoding is None or len(response.body) < config.key(['http', 'compress_min_size']):
+        return response
+    path = variant_find(headers['ETag'], encoding) or await variant_put(headers['ETag'], encoding, response.body)
+    return FileResponse(
+        path,
+        media_type=response.headers['content-type'],
+        headers=variant_headers(headers, encoding)
+    )
+
+
+def stats():
+    return dict(STATS)
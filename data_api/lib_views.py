@@ -0,0 +1,91 @@
+import asyncio
+
+from . import lib_metrics
+from .deps import logger, oj_db
+from .lib_cfg import config
+
+# Write-behind view counters
+# Page views are counted in memory and added to the database in one
+# statement per counter column every few seconds, instead of updating the
+# document row on every view.
+COLUMNS = ('views_hash', 'views_public')
+PENDING = {column: {} for column in COLUMNS}
+STATS = {
+    'flushed': 0,
+}
+_FLUSHER = None
+
+BACKLOG = lib_metrics.gauge(
+    'views_pending',
+    'Page views counted in memory, not yet written to the database')
+
+
+def hit(column, id_internal, count=1):
+    counts = PENDING[column]
+    counts[id_internal] = counts.get(id_internal, 0) + count
+
+
+def pending(column, id_internal):
+    """
+    Views of a document not yet written to the database
+    """
+    return PENDING[column].get(id_internal, 0)
+
+
+def stats():
+    return {
+        'pending': sum(sum(counts.values()) for counts in PENDING.values()),
+        'flushed': STATS['flushed'],
+    }
+
+
+@lib_metrics.collector
+async def views_metrics():
+    BACKLOG.set(stats()['pending'])
+
+
+async def flush():
+    for column in COLUMNS:
+        counts = PENDING[column]
+        if not counts:
+            continue
+        PENDING[column] = {}
+        sql = f"""
+        UPDATE ecli_document AS d
+        SET {column} = d.{column} + v.count
+        FROM unnest($1::int[], $2::int[]) AS v(id_internal, count)
+        WHERE d.id_internal = v.id_internal
+        """
+        try:
+            async with oj_db() as db:
+                await db.execute(sql, list(counts.keys()), list(counts.values()))
+        except Exception:
+            # Keep the views for the next flush
+            for id_internal, count in counts.items():
+                hit(column, id_internal, count)
+            raise
+        STATS['flushed'] += sum(counts.values())
+
+
+async def flush_loop():
+    while True:
+        await asyncio.sleep(config.key(['views', 'flush_interval']))
+        try:
+            await flush()
+        except Exception as e:
+            logger.warning('View counters flush failed')
+            logger.exception(e)
+
+
+def start():
+    global _FLUSHER  # pylint:disable=global-statement
+    if _FLUSHER is None:
+        _FLUSHER = asyncio.ensure_future(flush_loop())
+
+
+async def stop():
+    global _FLUSHER  # pylint:disable=global-statement
+    if _FLUSHER is not None:
+        _FLUSHER.cancel()
+        _FLUSHER = None
+    await flush()
@@ -1,13 +1,124 @@
-import logging
-import httpx
+import asyncio
 import json
+import logging
+import random
 import time
+
+import httpx
+
 from .lib_cfg import config
+from .lib_metrics import UPSTREAM, UPSTREAM_ERRORS
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.getLevelName('DEBUG'))
 logger.addHandler(logging.StreamHandler())
 
+# ARK & vocabulary services client
+# A single pooled client serves every call, failed calls are retried with
+# exponential backoff and jitter, and the auth service access token is kept
+# until it expires. Calls, errors and cumulated latency are counted per
+# endpoint.
+_CLIENT = None
+_TOKEN = {
+    'value': None,
+    'expires': 0,
+}
+_TOKEN_LOCK = None
+STATS = {}
+
+
+def get_client():
+    global _CLIENT  # pylint:disable=global-statement
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(timeout=config.key(['voc', 'timeout']))
+    return _CLIENT
+
+
+async def close_client():
+    global _CLIENT  # pylint:disable=global-statement
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+def stats():
+    return {name: dict(counts) for name, counts in STATS.items()}
+
+
+def backoff(attempt):
+    """
+    Delay before retry number `attempt` (starting at 0)
+    """
+    delay = config.key(['voc', 'backoff']) * 2 ** attempt
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def count(endpoint, seconds, error=False):
+    counts = STATS.setdefault(endpoint, {'calls': 0, 'errors': 0, 'seconds': 0.0})
+    counts['calls'] += 1
+    counts['seconds'] += seconds
+    service = 'ark' if endpoint.startswith('ark') else 'voc'
+    UPSTREAM.observe(seconds, service, endpoint)
+    if error:
+        counts['errors'] += 1
+        UPSTREAM_ERRORS.inc(service, endpoint)
+
+
+async def call(endpoint, method, url, **kwargs):
+    """
+    Send a request, retrying on network and server errors
+    """
+    retries = config.key(['voc', 'retries'])
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            r = await get_client().request(method, url, **kwargs)
+            r.raise_for_status()
+        except httpx.HTTPError as e:
+            count(endpoint, time.perf_counter() - start, error=True)
+            status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            if attempt >= retries or (status and status < 500 and status != 429):
+                raise
+            logger.warning('%s query failed (%s), retrying', endpoint, e)
+            await asyncio.sleep(backoff(attempt))
+            attempt += 1
+        else:
+            count(endpoint, time.perf_counter() - start)
+            return r
+
+
+async def get_token(refresh=False):
+    """
+    Access token for the vocabulary service, fetched once until it expires
+    """
+    global _TOKEN_LOCK  # pylint:disable=global-statement
+    if _TOKEN_LOCK is None:
+        _TOKEN_LOCK = asyncio.Lock()
+
+    async with _TOKEN_LOCK:
+        if refresh or not _TOKEN['value'] or _TOKEN['expires'] <= time.monotonic():
+            r = await call(
+                'token',
+                'POST',
+                f'{ config.key(["oj", "api", "auth"]) }/token',
+                data={
+                    'username': config.key(['oj', 'user']),
+                    'password': config.key(['oj', 'pass']),
+                }
+            )
+            data = r.json()
+            ttl = data.get('expires_in', config.key(['voc', 'token_ttl']))
+            # Renew a bit early rather than get a token refused mid-flight
+            _TOKEN['value'] = data.get('access_token')
+            _TOKEN['expires'] = time.monotonic() + ttl * 0.9
+        return _TOKEN['value']
+
+
+def drop_token():
+    _TOKEN['value'] = None
+    _TOKEN['expires'] = 0
+
 
 async def getArkId(uri: str):
     logger.debug('Query new ark for %s', uri)
@@ -26,27 +137,20 @@ async def getArkId(uri: str):
         'maintenance_commitment': {},
     }
 
-    i = 0
-    while True:
-        try:
-            async with httpx.AsyncClient() as client:
-                r = await client.post(
-                    f'{config.key(["ark", "url"])}/mint',
-                    headers=headers,
-                    content=json.dumps(mint_payload)
-                )
-                r.raise_for_status()
-                data = r.json()
-            break
-        except Exception as e:
-            i += 1
-            if i > 3:
-                logger.critical("Abandonning ark mint query, can't work it out")
-                break
-            logger.exception(e)
-            time.sleep(1)
-
-    return data.get('ark')
+    try:
+        r = await call(
+            'ark_mint',
+            'POST',
+            f'{config.key(["ark", "url"])}/mint',
+            headers=headers,
+            content=json.dumps(mint_payload)
+        )
+    except httpx.HTTPError as e:
+        logger.exception(e)
+        logger.critical("Abandonning ark mint query, can't work it out")
+        return None
+
+    return r.json().get('ark')
 
 
 async def setArkUrl(ark: str, uri: str):
@@ -64,74 +168,64 @@ async def setArkUrl(ark: str, uri: str):
         'maintenance_commitment': {},
     }
 
-    i = 0
-    while True:
-        try:
-            async with httpx.AsyncClient() as client:
-                r = await client.put(
-                    f'{config.key(["ark", "url"])}/update',
-                    headers=headers,
-                    content=json.dumps(update_payload)
-                )
-                r.raise_for_status()
-            break
-        except Exception as e:
-            i += 1
-            if i > 3:
-                logger.critical("Abandonning ark update query, can't work it out")
-                break
-            logger.exception(e)
-            time.sleep(1)
+    try:
+        await call(
+            'ark_update',
+            'PUT',
+            f'{config.key(["ark", "url"])}/update',
+            headers=headers,
+            content=json.dumps(update_payload)
+        )
+    except httpx.HTTPError as e:
+        logger.exception(e)
+        logger.critical("Abandonning ark update query, can't work it out")
 
     return True
 
 
 async def setLinks(docArk: str, termArks: list):
     logger.debug('Set Doc voc terms to %s', termArks)
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            f'{ config.key(["oj", "api", "auth"]) }/token',
-            data={
-                'username': config.key(['oj', 'user']),
-                'password': config.key(['oj', 'pass']),
-            }
-        )
-        r.raise_for_status()
-        data = r.json()
     # Define links between docs and term arks
-
-    headers = {
-        'Authorization': f'Bearer { data.get("access_token") }',
-        'Content-Type': 'application/json'
-    }
-
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            f'{ config.key(["oj", "api", "voc"]) }/link',
-            headers=headers,
-            content=json.dumps({
-                'item_iri': docArk,
-                'terms': termArks,
-                'collection': config.key(['oj', 'collection']),
-            })
-        )
-        r.raise_for_status()
+    payload = json.dumps({
+        'item_iri': docArk,
+        'terms': termArks,
+        'collection': config.key(['oj', 'collection']),
+    })
+
+    for refresh in (False, True):
+        headers = {
+            'Authorization': f'Bearer { await get_token(refresh) }',
+            'Content-Type': 'application/json'
+        }
+        try:
+            await call(
+                'voc_link_set',
+                'POST',
+                f'{ config.key(["oj", "api", "voc"]) }/link',
+                headers=headers,
+                content=payload
+            )
+            return
+        except httpx.HTTPStatusError as e:
+            # Token revoked or expired early: get a new one, once
+            if e.response.status_code != 401 or refresh:
+                raise
+            drop_token()
 
 
 async def getLinks(docArk: str):
     logger.debug('Get doc voc terms for %s', docArk)
     # Get voc terms associated with doc arks
-    async with httpx.AsyncClient() as client:
-        r = await client.get(
-            f'{ config.key(["oj", "api", "voc"]) }/link',
-            params={
-                'iri': docArk,
-                'collection': config.key(['oj', 'collection'])
-            }
-        )
-        r.raise_for_status()
-        print(r)
-        data = r.json()
-        print(data)
+    r = await call(
+        'voc_link_get',
+        'GET',
+        f'{ config.key(["oj", "api", "voc"]) }/link',
+        params={
+            'iri': docArk,
+            'collection': config.key(['oj', 'collection'])
+        }
+    )
+    data = r.json()
+    logger.debug('Voc terms: %s', data)
 
     return data.get('data', [])
@@ -9,19 +9,30 @@ import pytz
 import toml
 import uvicorn
 from fastapi import Depends, FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import Json
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 
 import data_api.deps as deps
+import data_api.lib_labels as lib_labels
 import data_api.lib_misc as lm
-from data_api.models import ListTypes  # ListModel,
-
-from .deps import get_db, logger, templates
-from .lib_cfg import config
-from .routers import collections, documents, formats, users
+import data_api.lib_nav as lib_nav
+import data_api.lib_sql as lib_sql
+import data_api.lib_views as lib_views
+import data_api.lib_voc as lib_voc
+from data_api.models import ListTypes, User  # ListModel,
+
+from .auth import close_client, credentials_exception, get_current_active_user
+from .deps import logger, templates
+from .lib_cfg import config, load
+from .lib_http import CompressionMiddleware
+from .lib_metrics import MetricsMiddleware, expose
+from .lib_profile import ProfileMiddleware
+from .lib_profile import load as profile_load
+from .lib_render import RenderBusy, RenderTimeout
+from .routers import collections, documents, formats, jobs, search, users
 
 # ################################################### SETUP AND ARGUMENT PARSING
 # ##############################################################################
@@ -66,6 +77,8 @@ app.include_router(users.router)
 app.include_router(collections.router)
 app.include_router(documents.router)
 app.include_router(formats.router)
+app.include_router(search.router)
+app.include_router(jobs.router)
 
 # Server config
 app.add_middleware(
@@ -74,7 +87,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Collection pages give their next cursor in headers
+    expose_headers=["X-Next-Cursor", "Link"],
+)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=config.key(['http', 'compress_min_size']),
 )
+app.add_middleware(ProfileMiddleware)
+# Outermost, so compression and profiling time are measured too
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(RenderBusy)
+async def render_busy_handler(request: Request, exc: RenderBusy):
+    return JSONResponse(
+        status_code=503,
+        content={'detail': 'Render queue is full, try again later'},
+        headers={'Retry-After': '10'},
+    )
+
+
+@app.exception_handler(RenderTimeout)
+async def render_timeout_handler(request: Request, exc: RenderTimeout):
+    return JSONResponse(status_code=504, content={'detail': 'Document rendering timed out'})
 
 
 @app.on_event("startup")
@@ -82,13 +118,30 @@ async def startup_event():
     if os.getenv('NO_ASYNCPG', 'false') == 'false':
         try:
             cfg = config.key('postgresql')
-            deps.DB_POOL = await asyncpg.create_pool(**cfg)
+            deps.DB_POOL = await lib_sql.create_pool(**cfg)
         except asyncpg.InvalidPasswordError:
             if config.key('log_level') != 'debug':
                 logger.critical("No database found")
                 raise
             logger.warning("No Database Found !!!! But we're in debug mode, proceeding anyway")
             deps.DB_POOL = False
+    if deps.DB_POOL:
+        lib_views.start()
+        await lib_nav.build()
+        lib_nav.start()
+        await lib_labels.build()
+        lib_labels.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if deps.DB_POOL:
+        lib_nav.stop()
+        lib_labels.stop()
+        await lib_views.stop()
+    await close_client()
+    await lib_voc.close_client()
+
 # ############################################################### SERVER ROUTES
 # #############################################################################
 
@@ -98,11 +151,40 @@ def root():
     return lm.status_get(START_TIME, VERSION)
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics
+    """
+    return PlainTextResponse(await expose(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.get("/profiles/{profile_id}", tags=["profiling"])
+async def profile(profile_id: str, format: str = 'json', current_user: User = Depends(get_current_active_user)):
+    """
+    Profile of a request (id from its `X-Profile-Id` header): duration, timed
+    stages and collapsed stacks, or only the stacks with `format=collapsed`
+    (for flamegraph.pl, speedscope, ...)
+
+    Admin user access required
+    """
+    if not current_user.admin:
+        raise credentials_exception
+    data = profile_load(profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == 'collapsed':
+        return PlainTextResponse(data['collapsed'])
+    return data
+
+
 @app.get("/list", tags=["access"])
-async def getList(request: Request, db=Depends(get_db), level: ListTypes = 'country', data: Json = {}):
+async def getList(request: Request, level: ListTypes = 'country', data: Json = {}, counts: bool = False):
     """
     List available data according to query
     Note from PJ: WHY ?? Why did I do this ?? This is madness !!!
+    Answered from the in-memory navigation tree, `counts` adds the number
+    of public documents under each entry.
     """
     if level not in ListTypes._member_names_:
         raise HTTPException(status_code=400, detail="Bad Request")
@@ -112,13 +194,13 @@ async def getList(request: Request, db=Depends(get_db), level: ListTypes = 'coun
             response = 'BE'
 
         if level == ListTypes.court:
-            response = await lm.listCourts(db, data['country'])
+            response = lib_nav.children([data['country']], counts)
 
         if level == ListTypes.year:
-            response = await lm.listYears(db, data['country'], data['court'])
+            response = lib_nav.children([data['country'], data['court']], counts)
 
         if level == ListTypes.document:
-            response = await lm.listDocuments(db, data['country'], data['court'], data['year'])
+            response = lib_nav.children([data['country'], data['court'], int(data['year'])], counts)
 
         if not isinstance(response, list):
             return [response]
@@ -126,6 +208,8 @@ async def getList(request: Request, db=Depends(get_db), level: ListTypes = 'coun
 
     except KeyError:
         raise HTTPException(status_code=417, detail="Missing data")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Bad Request")
     except RuntimeError:
         raise HTTPException(status_code=404, detail="Not Found")
 
@@ -153,13 +237,7 @@ def main():
     parser.add_argument('--debug', dest='debug', action='store_true', default=False, help='Debug mode')
     args = parser.parse_args()
 
-    # XXX: Lambda is a hack : toml expects a callable
-    if args.config:
-        t_config = toml.load(['config_default.toml', args.config])
-    else:
-        t_config = toml.load('config_default.toml')
-
-    config.merge(t_config)
+    load(args.config)
 
     if args.debug:
         logger.setLevel(logging.getLevelName('DEBUG'))
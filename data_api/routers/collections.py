@@ -1,4 +1,9 @@
+from datetime import datetime
+from urllib.parse import urlencode
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from starlette.requests import Request
 from ..models import (
     User,
 )
@@ -11,6 +16,9 @@ from ..deps import (
     get_db,
     logger,
 )
+from .. import lib_sql
+from ..lib_cfg import config
+from ..lib_misc import cursor_decode, cursor_encode
 
 router = APIRouter()
 bad_request = HTTPException(
@@ -29,50 +37,53 @@ class Collections:
     DELETED = 'deleted'
 
     @staticmethod
-    async def review(user, db):
+    async def review(user, db, page):
         if not user.admin:
             raise credentials_exception
-        record = await Collections._by_status(Collections.NEW, db)
+        record = await Collections._by_status(Collections.NEW, db, page)
         return record
 
     @staticmethod
-    async def public(user, db):
+    async def public(user, db, page):
         if not user.admin:
             raise credentials_exception
-        record = await Collections._by_status(Collections.PUBLIC, db)
+        record = await Collections._by_status(Collections.PUBLIC, db, page)
         return record
 
     @staticmethod
-    async def hidden(user, db):
+    async def hidden(user, db, page):
         if not user.admin:
             raise credentials_exception
-        record = await Collections._by_status(Collections.HIDDEN, db)
+        record = await Collections._by_status(Collections.HIDDEN, db, page)
         return record
 
     @staticmethod
-    async def flagged(user, db):
+    async def flagged(user, db, page):
         if not user.admin:
             raise credentials_exception
-        record = await Collections._by_status(Collections.FLAGGED, db)
+        record = await Collections._by_status(Collections.FLAGGED, db, page)
         return record
 
     @staticmethod
-    async def deleted(user, db):
+    async def deleted(user, db, page):
         if not user.admin:
             raise credentials_exception
-        record = await Collections._by_status(Collections.DELETED, db)
+        record = await Collections._by_status(Collections.DELETED, db, page)
         return record
 
+    # Selectable fields, id and date_created are always returned (they make the cursor)
+    FIELDS = ('ecli', 'status', 'appeal', 'meta', 'lang', 'date_updated')
+
     @staticmethod
-    async def _by_status(state, db):
-        sql = """
-        SELECT id_internal as id, ecli, status, appeal, meta, lang, date_created, date_updated
-        FROM ecli_document
-        WHERE status = $1
-        ORDER BY date_created ASC
-        """
-        res = await db.fetch(sql, state)
-        return [dict(r) for r in res]
+    async def _by_status(state, db, page):
+        # meta is only read when it is returned
+        name = 'collection' if page['fields'] is None or 'meta' in page['fields'] else 'collection_slim'
+        if page['after'] is None:
+            res = await lib_sql.fetch(db, name, state, page['limit'])
+        else:
+            res = await lib_sql.fetch(db, f'{name}_after', state, page['limit'], page['after'], page['after_id'])
+        keys = ['id', 'date_created', *(page['fields'] or Collections.FIELDS)]
+        return [{k: r[k] for k in keys} for r in res]
 
 
 # ##################################### ROUTES
@@ -85,6 +96,11 @@ async def read_collections(current_user: User = Depends(get_current_active_user_
 @router.get("/c/{collection}", tags=["collections"])
 async def read_collection(
         collection: str,
+        request: Request,
+        response: Response,
+        cursor: str = None,
+        limit: int = None,
+        fields: str = None,
         current_user: User = Depends(get_current_active_user_opt),
         db=Depends(get_db)):
     """
@@ -95,15 +111,49 @@ async def read_collection(
     /c/admin -> list everything
     /c/review -> latests documents awaiting review
     ...
+
+    Results are paginated : when more documents are available, the `X-Next-Cursor`
+    and `Link` headers give the `cursor` to query the next page with.
+    `fields` restricts the returned fields (comma separated).
     """
     logger.info('User %s queried collection %s', current_user, collection)
     try:
         call = getattr(Collections, collection)
+        if collection.startswith('_') or not callable(call):
+            raise AttributeError(collection)
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Collection does not exist"
         )
-    data = await call(current_user, db)
+
+    page = {
+        'after': None,
+        'after_id': None,
+        'limit': min(limit or config.key(['collections', 'page_size']), config.key(['collections', 'max_page_size'])),
+        'fields': None,
+    }
+    if page['limit'] < 1:
+        raise bad_request
+    if cursor:
+        try:
+            after, after_id = cursor_decode(cursor)
+            page['after'] = datetime.fromisoformat(after)
+            page['after_id'] = int(after_id)
+        except (ValueError, TypeError):
+            raise bad_request
+    if fields:
+        page['fields'] = [f for f in fields.split(',') if f]
+        if any(f not in Collections.FIELDS for f in page['fields']):
+            raise bad_request
+
+    data = await call(current_user, db, page)
+
+    if len(data) == page['limit']:
+        last = data[-1]
+        next_cursor = cursor_encode(last['date_created'], last['id'])
+        query = urlencode({**request.query_params, 'cursor': next_cursor})
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.url.path}?{query}>; rel="next"'
     return data
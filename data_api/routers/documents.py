@@ -1,6 +1,5 @@
-import json
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from starlette.requests import Request
 from datetime import datetime
 from data_api.lib_cfg import config
@@ -23,33 +22,46 @@ from ..deps import (
     doc_hash,
     templates,
 )
-from ..lib_mail import notify
+from ..lib_mail import notify, notify_key
 from ..lib_cfg import config
 from data_api.lib_parse import (
-    txt2html
+    derive,
+    txt2html,
 )
+from data_api.lib_bulk import ingest_lines, split_lines
+from data_api.lib_db import upsert_labels, write_links
+from data_api.lib_http import cache_headers, is_fresh, make_etag
+from data_api.lib_store import pdf_drop, variant_cached, variant_drop, variant_send
+import data_api.lib_jobs as lib_jobs
+import data_api.lib_labels as lib_labels
+import data_api.lib_nav as lib_nav
+import data_api.lib_sql as lib_sql
+import data_api.lib_views as lib_views
 import data_api.lib_voc as OJVoc
 router = APIRouter()
 
 
-# ### BACKGROUND TASKS
+# ### JOBS & BACKGROUND TASKS
 # ####################
+@lib_jobs.handler('ark')
 async def getArkAndStoreVoc(id_internal: int, terms: list):
-    # If job is too cumbersone, see
-    # https://fastapi.tiangolo.com/tutorial/background-tasks/#caveat
+    # Run by the job worker, retried until the ark is stored and linked
     async with oj_db() as db:
-        docHash = await db.fetchval(
-            "SELECT hash FROM ecli_document WHERE id_internal = $1",
-            id_internal
-        )
-        docUrl = f"{config.key('oj_doc_domain')}/d/pdf/{docHash}"
+        doc = await lib_sql.fetchrow(db, 'document_ark_state', id_internal)
+    if doc is None:
+        logger.warning('Document %s is gone, no ark to set', id_internal)
+        return
+
+    arkId = doc['ark']
+    if arkId is None:
+        docUrl = f"{config.key('oj_doc_domain')}/d/pdf/{doc['hash']}"
         arkId = await OJVoc.getArkId(docUrl)
-        await db.execute(
-            "UPDATE ecli_document SET ark=$1 where id_internal= $2",
-            arkId,
-            id_internal
-        )
-    await OJVoc.setLinks(arkId, terms)
+        if arkId is None:
+            raise RuntimeError('Ark minting failed')
+        async with oj_db() as db:
+            await lib_sql.execute(db, 'document_ark', arkId, id_internal)
+    if terms:
+        await OJVoc.setLinks(arkId, terms)
 
     logger.info('Document %s ark set to %s, %s terms associated',
         id_internal,
@@ -57,13 +69,17 @@ async def getArkAndStoreVoc(id_internal: int, terms: list):
         len(terms))
 
 
+async def notifyBulk(db, user: User, created: list, errors: list):
+    documents = [{k: doc[k] for k in ('line', 'ecli', 'hash')} for doc in created]
+    await notify(db, user, 'bulk_create_doc', {'documents': documents, 'errors': errors})
+
+
 # ############### CRUD
 # ####################
 @router.post("/create", tags=["crud"])
 async def create(
         query: SubmitModel,
         request: Request,
-        background_tasks: BackgroundTasks,
         current_user: User = Depends(get_current_active_user_opt),
         db=Depends(get_db)):
 
@@ -89,72 +105,78 @@ async def create(
 
     docHash = doc_hash(ecli)
 
-    sql = """
-    INSERT INTO ecli_document (
-        ecli,
-        country,
-        court,
-        year,
-        identifier,
-        text,
-        meta,
-        ukey,
-        lang,
-        appeal,
-        hash
-    ) VALUES ( $1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-    RETURNING id_internal;
-    """
-
-    docId = await db.fetchval(
-        sql,
-        ecli,
-        query.country,
-        query.court,
-        query.year,
-        query.identifier,
-        query.text,
-        json.dumps(meta),
-        userRecord.email,
-        query.lang,
-        query.appeal,
-        docHash,
-    )
-
-    # Keep labels in database for reuse
-    for label in query.labels:
-        check = await db.fetchrow("SELECT 'one' FROM labels WHERE label = $1", label)
-        if not check:
-            logger.debug("New label : %s", label)
-            await db.execute("INSERT INTO labels (label, category) VALUES ($1, 'user_defined')", label)
-
-    # Store doclinks
-    for doc in query.doc_links:
-        sql = """
-            INSERT INTO ecli_links (
-                id_internal,
-                target_type,
-                target_identifier,
-                target_label
-            ) VALUES ($1, $2, $3, $4);
-        """
-
-        await db.execute(
-            sql,
-            docId,
-            doc.kind,
-            doc.link,
-            doc.label,
+    derived = derive(query.text)
+    async with db.transaction():
+        docId = await lib_sql.fetchval(
+            db,
+            'document_insert',
+            ecli,
+            query.country,
+            query.court,
+            query.year,
+            query.identifier,
+            query.text,
+            meta,
+            userRecord.email,
+            query.lang,
+            query.appeal,
+            docHash,
+            derived['html'],
+            derived['pages'],
+            derived['stats'],
         )
 
-    # Run ark ID & link definition through a background task
-    background_tasks.add_task(getArkAndStoreVoc, docId, query.terms)
+        # Keep labels in database for reuse
+        await upsert_labels(db, query.labels)
+
+        # Store doclinks
+        await write_links(db, docId, query.doc_links, replace=False)
+
+        # Ark ID & link definition are run by the job worker
+        await lib_jobs.enqueue(db, 'ark', {'id_internal': docId, 'terms': query.terms})
+
+        # Sent by the job worker too
+        await notify(db, userRecord, 'create_doc', {'doc_hash': docHash})
+
+    lib_labels.add(query.labels)
 
-    await notify(userRecord, 'create_doc', {'doc_hash': docHash})
     logger.debug('Wrote ecli %s ( hash %s ) to database', ecli, docHash)
     return {'result': "ok", 'hash': docHash}
 
 
+@router.post("/bulk", tags=["crud"])
+async def bulk(
+        request: Request,
+        user_key: str = None,
+        current_user: User = Depends(get_current_active_user_opt),
+        db=Depends(get_db)):
+    """
+    Bulk submission endpoint
+    The body is newline delimited json, one document (as in `/create`) per line.
+    Lines are validated and stored by batches, every invalid line is reported
+    with its line number and does not stop the submission.
+    """
+    if current_user:
+        userRecord = current_user
+    elif user_key:
+        userRecord = await get_user_by_key(user_key)
+    else:
+        raise HTTPException(status_code=401, detail="bad user key")
+
+    created, errors = await ingest_lines(db, split_lines(request.stream()), userRecord)
+    logger.info("User %s bulk submitted %s documents, %s errors", userRecord.username, len(created), len(errors))
+
+    # Ark IDs and link definitions are queued with the documents
+    if created:
+        await notifyBulk(db, userRecord, created, errors)
+
+    return {
+        'result': "ok",
+        'created': [{k: doc[k] for k in ('line', 'ecli', 'hash')} for doc in created],
+        'errors': errors,
+    }
+
+
 @router.get("/d/read/{document_id}", tags=["crud"])
 async def read(
         document_id: int,
@@ -169,32 +191,7 @@ async def read(
     if not current_user.admin:
         raise credentials_exception
 
-    sql = """
-    SELECT
-        id_internal as id,
-        ecli,
-        country,
-        court,
-        year,
-        identifier,
-        text,
-        meta->'labels' as labels,
-        flags,
-        date_created,
-        lang,
-        appeal,
-        status,
-        hash,
-        date_created,
-        date_updated,
-        ukey,
-        views_hash,
-        views_public
-    FROM ecli_document
-    WHERE id_internal = $1
-    """
-
-    doc_raw = await db.fetchrow(sql, document_id)
+    doc_raw = await lib_sql.fetchrow(db, 'document_read', document_id)
 
     if '@' in doc_raw['ukey']:
         user = await get_user_by_email(doc_raw['ukey'])
@@ -218,7 +215,7 @@ async def read(
         'year': doc_raw['year'],
         'identifier': doc_raw['identifier'],
         'text': doc_raw['text'],
-        'labels': [] if doc_raw['labels'] is None else json.loads(doc_raw['labels']),
+        'labels': doc_raw['labels'] or [],
         'flags': doc_raw['flags'],
         'lang': doc_raw['lang'],
         'appeal': doc_raw['appeal'],
@@ -230,17 +227,11 @@ async def read(
         'username': user.username,
         'vhash': doc_raw['views_hash'],
         'vpublic': doc_raw['views_public'],
+        'pages': doc_raw['pages'] or [],
+        'stats': doc_raw['stats'] or {},
     }
 
-    sql = """
-    SELECT
-        target_type as kind,
-        target_identifier as link,
-        target_label as label
-    FROM ecli_links
-    WHERE id_internal = $1
-    """
-    links_raw = await db.fetch(sql, document_id)
+    links_raw = await lib_sql.fetch(db, 'document_links', document_id)
     links = [dict(x) for x in links_raw]
 
     doc_data['links'] = links
@@ -267,79 +258,69 @@ async def update(
     meta = query.meta if query.meta is not None else {}
     meta['labels'] = query.labels
 
-    old_status = await db.fetchval(
-        "SELECT status FROM ecli_document WHERE id_internal = $1",
-        document_id)
-
-    sql = """
-    UPDATE ecli_document
-    SET
-        ecli = $2,
-        country = $3,
-        court = $4,
-        year = $5,
-        identifier = $6,
-        text = $7,
-        meta = $8,
-        lang = $9,
-        appeal = $10,
-        status = $11,
-        date_updated = $12
-    WHERE id_internal = $1
-    """
+    derived = derive(query.text)
+    async with db.transaction():
+        old = await lib_sql.fetchrow(db, 'document_lock', document_id)
+        if old is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        old_status = old['status']
+
+        # Stored variants of the current page and text, outdated once updated
+        page = await lib_sql.fetchrow(db, 'page_by_hash', old['hash'])
+        page = (page['html'] or page['text'], page['labels'], page['links'], page['appeal'], page['hash'])
+        stale = (
+            make_etag('html', *page),
+            make_etag('html-hash', *page),
+            make_etag('txt', old['text']),
+        )
 
-    await db.execute(
-        sql,
-        document_id,
-        ecli,
-        query.country,
-        query.court,
-        query.year,
-        query.identifier,
-        query.text,
-        json.dumps(meta),
-        query.lang,
-        query.appeal,
-        query.status,
-        datetime.now()
-    )
-
-    # Keep labels in database for reuse
-    for label in query.labels:
-        check = await db.fetchrow("SELECT 'one' FROM labels WHERE label = $1", label)
-        if not check:
-            logger.debug("New label : %s", label)
-            await db.execute("INSERT INTO labels (label, category) VALUES ($1, 'user_defined')", label)
-
-    # Store doclinks
-    logger.debug("Removing doclinks for %s", document_id)
-    await db.execute("DELETE FROM ecli_links WHERE id_internal = $1", document_id)
-    logger.debug("Reinserting doclinks for %s", document_id)
-
-    for doc in query.doc_links:
-        sql = """
-            INSERT INTO ecli_links (
-                id_internal,
-                target_type,
-                target_identifier,
-                target_label
-            ) VALUES ($1, $2, $3, $4);
-        """
-
-        await db.execute(
-            sql,
+        await lib_sql.execute(
+            db,
+            'document_update',
             document_id,
-            doc.kind,
-            doc.link,
-            doc.label,
+            ecli,
+            query.country,
+            query.court,
+            query.year,
+            query.identifier,
+            query.text,
+            meta,
+            query.lang,
+            query.appeal,
+            query.status,
+            datetime.now(),
+            derived['html'],
+            derived['pages'],
+            derived['stats'],
         )
 
-    if old_status != query.status and query.status == 'public':
-        ukey = await db.fetchval(
-            "SELECT ukey FROM ecli_document WHERE id_internal = $1",
-            document_id)
-        user = await get_user_by_key(ukey)
-        await notify(user, 'publish_doc', {'ecli': ecli})
+        # Keep labels in database for reuse
+        await upsert_labels(db, query.labels)
+
+        # Store doclinks
+        await write_links(db, document_id, query.doc_links)
+
+        # Queued with the status change, sent by the job worker
+        if old_status != query.status and query.status == 'public':
+            ukey = await lib_sql.fetchval(db, 'document_ukey', document_id)
+            await notify_key(db, ukey, 'publish_doc', {'ecli': ecli})
+
+    lib_labels.add(query.labels, used=False)
+
+    # Keep the navigation tree in sync
+    if old_status == 'public':
+        lib_nav.remove(old['country'], old['court'], old['year'], old['identifier'])
+    if query.status == 'public':
+        lib_nav.add(query.country, query.court, query.year, query.identifier)
+
+    variant_drop(*stale)
+
+    # Rendered pdf is outdated
+    if old['text'] != query.text or old['ecli'] != ecli:
+        pdf_drop({
+            'body': old['text'],
+            'title': old['ecli'],
+        })
 
     # logger.debug('Wrote ecli %s ( hash %s ) to database', ecli, docHash)
     return {'result': "ok"}
@@ -347,6 +328,20 @@ async def update(
 
 # ############# ACCESS
 # ####################
+def page_links(links):
+    """
+    Split aggregated (type, identifier, label) links for the templates
+    """
+    ecli_links = []
+    eli_links = []
+    for target_type, identifier, label in links or []:
+        if target_type == 'ecli':
+            ecli_links.append({'name': label, 'id': identifier})
+        elif target_type == 'eli':
+            eli_links.append({'name': label, 'link': identifier})
+    return ecli_links, eli_links
+
+
 @router.get("/hash/{dochash}", response_class=HTMLResponse, tags=["access"])
 async def view_html_hash(
         request: Request,
@@ -366,19 +361,13 @@ async def view_html_hash(
 
     if t != '':
         try:
-            user = token_get_user(t)
+            user = await token_get_user(t)
             is_admin = user.admin
         except Exception as e:
             logger.warning("User hash Token error")
             logger.exception(e)
 
-    sql = """
-    SELECT id_internal, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE hash = $1
-    """
-
-    res = await db.fetchrow(sql, dochash)
+    res = await lib_sql.fetchrow(db, 'page_by_hash', dochash)
 
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -391,102 +380,80 @@ async def view_html_hash(
             raise HTTPException(status_code=404, detail="Document not found")
         if res['status'] not in ('new', 'hidden'):
             raise HTTPException(status_code=423, detail="Content is locked")
-        if res['views_hash'] > config.key('hash_max_views'):
+        views_hash = res['views_hash'] + lib_views.pending('views_hash', res['id_internal'])
+        if views_hash > config.key('hash_max_views'):
             raise HTTPException(status_code=423, detail="Content is locked")
-        await db.execute("UPDATE ecli_document SET views_hash = views_hash + 1 WHERE hash = $1", dochash)
+        lib_views.hit('views_hash', res['id_internal'])
     else:
         logger.info("Admin View enabled for %s", dochash)
 
-    html_text = txt2html(res['text'])
+    # Not the /html/{ecli} page: its links point to the hash routes
+    etag = make_etag('html-hash', res['html'] or res['text'], res['labels'], res['links'], res['appeal'], dochash)
+    headers = cache_headers(etag, res, public=False)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+    cached = variant_cached(request, headers, 'text/html; charset=utf-8')
+    if cached:
+        return cached
 
-    sql_links = """
-    SELECT target_type, target_identifier, target_label
-    FROM ecli_links
-    WHERE id_internal = $1
-    """
-
-    res2 = await db.fetch(sql_links, res['id_internal'])
-    ecli_links = []
-    eli_links = []
-    for row in res2:
-        if row['target_type'] == 'ecli':
-            ecli_links.append({'name': row['target_label'], 'id': row['target_identifier']})
-        elif row['target_type'] == 'eli':
-            eli_links.append({'name': row['target_label'], 'link': row['target_identifier']})
+    # Documents written before derived artifacts were stored have no html yet
+    html_text = res['html'] if res['html'] is not None else txt2html(res['text'])
+    ecli_links, eli_links = page_links(res['links'])
 
-    return templates.TemplateResponse('share.html', {
+    response = templates.TemplateResponse('share.html', {
         'request': request,
         'ecli': res['ecli'],
         'text': html_text,
-        'labels': json.loads(res['labels']) if res['labels'] else [],
+        'labels': res['labels'],
         'appeal': res['appeal'],
         'elis': eli_links,
         'eclis': ecli_links,
         'hash': dochash,
         'ishash': True,
-    })
+    }, headers=headers)
+    return await variant_send(request, response, headers)
 
 
 @router.get("/html/{ecli}", response_class=HTMLResponse, tags=["access"])
 async def view_html_ecli(request: Request, ecli, db=Depends(get_db)):
     # FIXME: add text output on request ACCEPT
-    sql = """
-    SELECT id_internal, ecli, text, appeal, meta->'labels' AS labels, hash
-    FROM ecli_document
-    WHERE ecli = $1
-    AND status = 'public'
-    """
-
-    res = await db.fetchrow(sql, ecli)
+    res = await lib_sql.fetchrow(db, 'page_by_ecli', ecli)
 
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    html_text = txt2html(res['text'])
-
-    sql_links = """
-    SELECT target_type, target_identifier, target_label
-    FROM ecli_links
-    WHERE id_internal = $1
-    """
+    lib_views.hit('views_public', res['id_internal'])
 
-    res2 = await db.fetch(sql_links, res['id_internal'])
-    ecli_links = []
-    eli_links = []
-    for row in res2:
-        if row['target_type'] == 'ecli':
-            ecli_links.append({'name': row['target_label'], 'id': row['target_identifier']})
-        elif row['target_type'] == 'eli':
-            eli_links.append({'name': row['target_label'], 'link': row['target_identifier']})
+    etag = make_etag('html', res['html'] or res['text'], res['labels'], res['links'], res['appeal'], res['hash'])
+    headers = cache_headers(etag, res, public=True)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+    cached = variant_cached(request, headers, 'text/html; charset=utf-8')
+    if cached:
+        return cached
 
-    await db.execute("UPDATE ecli_document SET views_public = views_public + 1 WHERE ecli = $1", ecli)
+    # Documents written before derived artifacts were stored have no html yet
+    html_text = res['html'] if res['html'] is not None else txt2html(res['text'])
+    ecli_links, eli_links = page_links(res['links'])
 
-    return templates.TemplateResponse('share.html', {
+    response = templates.TemplateResponse('share.html', {
         'request': request,
         'ecli': res['ecli'],
         'text': html_text,
-        'labels': json.loads(res['labels']) if res['labels'] else [],
+        'labels': res['labels'],
         'appeal': res['appeal'],
         'elis': eli_links,
         'eclis': ecli_links,
         'hash': res['hash'],
         'ishash': False,
-    })
+    }, headers=headers)
+    return await variant_send(request, response, headers)
 
 
 @router.get("/labels/{begin}", tags=["crud"])
-async def labels(begin, db=Depends(get_db)):
-    """
-    Return matching labels (only search from beginning of string)
+async def labels(begin, limit: int = 20):
     """
-    sql = """
-    SELECT label FROM labels WHERE LOWER(label) LIKE $1 || '%'
+    Return matching labels (only search from beginning of string, case and
+    accents are ignored), most used first
     """
-
-    res = await db.fetch(sql, begin.lower())
-
-    output = []
-    for row in res:
-        output.append(row['label'])
-
-    return output
+    return lib_labels.search(begin, min(max(limit, 1), 100))
@@ -1,6 +1,7 @@
 import re
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, Response
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, Response, FileResponse, StreamingResponse
 from data_api.lib_cfg import config
 from ..deps import (
     get_db,
@@ -11,8 +12,12 @@ from ..deps import (
 from starlette.requests import Request
 from data_api.lib_parse import (
     md2latex,
-    latex2pdf,
 )
+from data_api.lib_export import export
+from data_api.lib_http import cache_headers, is_fresh, make_etag
+from data_api.lib_store import pdf_get, pdf_key, variant_send
+import data_api.lib_sql as lib_sql
+import data_api.lib_views as lib_views
 from ..auth import (
     token_get_user,
 )
@@ -20,12 +25,12 @@ from ..auth import (
 router = APIRouter()
 
 
-async def check_access(t, status, db, dochash, views_hash):
+async def check_access(t, status, id_internal, views_hash):
     is_admin = False
 
     if t != '':
         try:
-            user = token_get_user(t)
+            user = await token_get_user(t)
             is_admin = user.admin
         except Exception as e:
             logger.warning("User hash Token error")
@@ -38,10 +43,10 @@ async def check_access(t, status, db, dochash, views_hash):
             raise HTTPException(status_code=404, detail="Document not found")
         elif status not in ('new', 'hidden'):
             raise HTTPException(status_code=423, detail="Content is locked")
-        elif views_hash > config.key('hash_max_views'):
+        elif views_hash + lib_views.pending('views_hash', id_internal) > config.key('hash_max_views'):
             raise HTTPException(status_code=423, detail="Content is locked")
         else:
-            await db.execute("UPDATE ecli_document SET views_hash = views_hash + 1 WHERE hash = $1", dochash)
+            lib_views.hit('views_hash', id_internal)
 
 # ############## ROUTE
 # ####################
@@ -57,27 +62,26 @@ async def view_pdf_hash(
     Temporary hash-based access to pdf version of a document
     """
 
-    sql = """
-    SELECT id_internal, identifier, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE hash = $1
-    """
-
-    res = await db.fetchrow(sql, dochash)
+    res = await lib_sql.fetchrow(db, 'format_by_hash', dochash)
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
     else:
-        await check_access(t, res['status'], db, dochash, res['views_hash'])
+        await check_access(t, res['status'], res['id_internal'], res['views_hash'])
 
-    latex = md2latex({
+    data = {
         'body': res['text'],
         'title': res['ecli'],
-    })
+    }
+    headers = cache_headers(make_etag('pdf', pdf_key(data)), res, public=False)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    path = await pdf_get(data)
     fname = re.sub(r'[\W_]+', '-', res['identifier'])
-    return Response(
-        content=latex2pdf(latex),
+    return FileResponse(
+        path,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename=\"{fname}.pdf\""}
+        headers={**headers, "Content-Disposition": f"inline; filename=\"{fname}.pdf\""}
     )
 
 
@@ -91,26 +95,24 @@ async def view_pdf_hash(
     Access to the pdf version of a document
     """
 
-    sql = """
-    SELECT id_internal, identifier, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE ecli = $1
-    AND status = 'public'
-    """
-
-    res = await db.fetchrow(sql, ecli)
+    res = await lib_sql.fetchrow(db, 'format_by_ecli', ecli)
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    latex = md2latex({
+    data = {
         'body': res['text'],
         'title': res['ecli'],
-    })
+    }
+    headers = cache_headers(make_etag('pdf', pdf_key(data)), res, public=True)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    path = await pdf_get(data)
     fname = re.sub(r'[\W_]+', '-', res['identifier'])
-    return Response(
-        content=latex2pdf(latex),
+    return FileResponse(
+        path,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename=\"{fname}.pdf\""}
+        headers={**headers, "Content-Disposition": f"inline; filename=\"{fname}.pdf\""}
     )
 
 
@@ -121,19 +123,17 @@ async def view_pdf_hash(
         db=Depends(get_db),
         t: str = ''):
 
-    sql = """
-    SELECT id_internal, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE hash = $1
-    """
-
-    res = await db.fetchrow(sql, dochash)
+    res = await lib_sql.fetchrow(db, 'format_by_hash', dochash)
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
     else:
-        await check_access(t, res['status'], db, dochash, res['views_hash'])
+        await check_access(t, res['status'], res['id_internal'], res['views_hash'])
+
+    headers = cache_headers(make_etag('txt', res['text']), res, public=False)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
 
-    return res['text']
+    return await variant_send(request, PlainTextResponse(res['text'], headers=headers), headers)
 
 
 @router.get("/txt/{ecli}", response_class=PlainTextResponse, tags=["access"])
@@ -143,18 +143,15 @@ async def view_pdf_hash(
         db=Depends(get_db),
         t: str = ''):
 
-    sql = """
-    SELECT id_internal, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE ecli = $1
-    AND status = 'public'
-    """
-
-    res = await db.fetchrow(sql, ecli)
+    res = await lib_sql.fetchrow(db, 'format_by_ecli', ecli)
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    return res['text']
+    headers = cache_headers(make_etag('txt', res['text']), res, public=True)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    return await variant_send(request, PlainTextResponse(res['text'], headers=headers), headers)
 
 
 @router.get("/d/tex/{dochash}", response_class=PlainTextResponse, tags=["access"])
@@ -164,22 +161,21 @@ async def view_pdf_hash(
         db=Depends(get_db),
         t: str = ''):
 
-    sql = """
-    SELECT id_internal, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE hash = $1
-    """
-
-    res = await db.fetchrow(sql, dochash)
+    res = await lib_sql.fetchrow(db, 'format_by_hash', dochash)
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
     else:
-        await check_access(t, res['status'], db, dochash, res['views_hash'])
+        await check_access(t, res['status'], res['id_internal'], res['views_hash'])
 
-    return md2latex({
+    data = {
         'body': res['text'],
         'title': res['ecli'],
-    })
+    }
+    headers = cache_headers(make_etag('tex', pdf_key(data)), res, public=False)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    return PlainTextResponse(await md2latex(data), headers=headers)
 
 
 @router.get("/tex/{ecli}", response_class=PlainTextResponse, tags=["access"])
@@ -189,18 +185,31 @@ async def view_pdf_hash(
         db=Depends(get_db),
         t: str = ''):
 
-    sql = """
-    SELECT id_internal, ecli, text, appeal, meta->'labels' AS labels, views_hash, status
-    FROM ecli_document
-    WHERE ecli = $1
-    AND status = 'public'
-    """
-
-    res = await db.fetchrow(sql, ecli)
+    res = await lib_sql.fetchrow(db, 'format_by_ecli', ecli)
     if not res:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    return md2latex({
+    data = {
         'body': res['text'],
         'title': res['ecli'],
-    })
+    }
+    headers = cache_headers(make_etag('tex', pdf_key(data)), res, public=True)
+    if is_fresh(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    return PlainTextResponse(await md2latex(data), headers=headers)
+
+
+@router.get("/export", tags=["access"])
+async def export_public(
+        court: str = None,
+        year: int = None,
+        since: datetime = None):
+    """
+    Every public document, as newline delimited json
+    Use `since` (on last update date) for incremental syncs
+    """
+    return StreamingResponse(
+        export(court=court, year=year, since=since),
+        media_type='application/x-ndjson',
+    )
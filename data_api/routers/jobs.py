@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends
+from ..models import (
+    User,
+)
+from ..auth import (
+    get_current_active_user,
+    credentials_exception,
+)
+from ..deps import (
+    get_db,
+)
+from .. import lib_jobs
+
+router = APIRouter()
+
+
+@router.get("/jobs", tags=["jobs"])
+async def jobs_status(
+        current_user: User = Depends(get_current_active_user),
+        db=Depends(get_db)):
+    """
+    Job queue status: jobs per kind and status (with the oldest run date),
+    and the latest dead jobs, run again with `worker --requeue-dead`
+
+    Admin user access required
+    """
+    if not current_user.admin:
+        raise credentials_exception
+    return await lib_jobs.status(db)
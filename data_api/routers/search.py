@@ -0,0 +1,118 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..deps import (
+    get_db,
+)
+from ..lib_cfg import config
+from ..lib_misc import cursor_decode, cursor_encode
+
+router = APIRouter()
+
+# The query language is unknown, so it is parsed with every configuration
+# a document may use and the resulting queries are OR-ed.
+SEARCH_QUERY = """
+websearch_to_tsquery('french', $1)
+|| websearch_to_tsquery('dutch', $1)
+|| websearch_to_tsquery('german', $1)
+|| websearch_to_tsquery('simple', $1)
+"""
+
+
+def search_sql(court=None, year=None, label=None, after=False):
+    """
+    Search query, parameters are the text query, the page size, the filters
+    and the rank and id of the last result of the previous page (if `after`)
+    """
+    filters = []
+    args = []
+    for sql, value in (
+            ('court = ${}', court),
+            ('year = ${}', year),
+            ("meta->'labels' ? ${}", label)):
+        if value is not None:
+            args.append(value)
+            filters.append(sql.format(len(args) + 2))
+
+    page_filter = ''
+    if after:
+        n = len(args) + 3
+        page_filter = f'WHERE rank < ${n} OR (rank = ${n} AND id_internal > ${n + 1})'
+
+    # Snippets are only computed for the returned page
+    sql = f"""
+    WITH hits AS (
+        SELECT
+            id_internal,
+            ts_rank(search, query, 1) AS rank,
+            query
+        FROM ecli_document, (SELECT {SEARCH_QUERY} AS query) AS q
+        WHERE search @@ query
+        AND status = 'public'
+        {''.join(f' AND {f}' for f in filters)}
+    ), page AS (
+        SELECT * FROM hits
+        {page_filter}
+        ORDER BY rank DESC, id_internal ASC
+        LIMIT $2
+    )
+    SELECT
+        d.id_internal,
+        d.ecli,
+        d.court,
+        d.year,
+        d.lang,
+        page.rank,
+        ts_headline(
+            ecli_regconfig(d.lang),
+            d.text,
+            page.query,
+            'MaxFragments=2, MaxWords=30, MinWords=10'
+        ) AS snippet
+    FROM page
+    JOIN ecli_document d USING (id_internal)
+    ORDER BY page.rank DESC, page.id_internal ASC
+    """
+    return sql, args
+
+
+@router.get("/search", tags=["access"])
+async def search(
+        q: str,
+        court: str = None,
+        year: int = None,
+        label: str = None,
+        cursor: str = None,
+        limit: int = None,
+        db=Depends(get_db)):
+    """
+    Full text search in public documents, best matches first
+    Every word must match, "quoted phrases", OR and -exclusion are supported.
+    When more results are available, `next` is the `cursor` of the next page.
+    """
+    limit = min(limit or config.key(['search', 'page_size']), config.key(['search', 'max_page_size']))
+    if not q.strip() or limit < 1:
+        raise HTTPException(status_code=400, detail="Bad Request")
+
+    after = []
+    if cursor:
+        try:
+            rank, after_id = cursor_decode(cursor)
+            after = [float(rank), int(after_id)]
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Bad Request")
+
+    sql, args = search_sql(court, year, label, after=bool(after))
+    rows = await db.fetch(sql, q, limit, *args, *after)
+
+    results = [{
+        'ecli': row['ecli'],
+        'court': row['court'],
+        'year': row['year'],
+        'lang': row['lang'],
+        'rank': row['rank'],
+        'snippet': row['snippet'],
+    } for row in rows]
+
+    return {
+        'results': results,
+        'next': cursor_encode(rows[-1]['rank'], rows[-1]['id_internal']) if len(rows) == limit else None,
+    }
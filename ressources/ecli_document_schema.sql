@@ -9,6 +9,15 @@ DROP INDEX IF EXISTS ecli_parts;
 DROP TABLE IF EXISTS ecli_document;
 DROP TABLE IF EXISTS ecli_links;
 
+CREATE OR REPLACE FUNCTION ecli_regconfig(lang TEXT) RETURNS regconfig AS $$
+    SELECT CASE UPPER(lang)
+        WHEN 'FR' THEN 'french'::regconfig
+        WHEN 'NL' THEN 'dutch'::regconfig
+        WHEN 'DE' THEN 'german'::regconfig
+        ELSE 'simple'::regconfig
+    END
+$$ LANGUAGE SQL IMMUTABLE;
+
 CREATE TYPE status_enum AS ENUM ('new', 'public', 'hidden', 'flagged', 'deleted', 'boosted');
 CREATE TYPE linktype_enum AS ENUM ('ecli', 'eli');
 CREATE TYPE appeal_enum AS ENUM ('yes', 'no', 'nodata');
@@ -29,6 +38,10 @@ CREATE TABLE "ecli_document" (
     views_public INT DEFAULT 0,
     ukey TEXT,
     lang VARCHAR(2),
+    html TEXT,
+    pages JSONB,
+    stats JSONB,
+    search tsvector GENERATED ALWAYS AS (to_tsvector(ecli_regconfig(lang), COALESCE(text, ''))) STORED,
     
     status status_enum DEFAULT 'new',
     date_created TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -46,5 +59,7 @@ ALTER TABLE ecli_links ADD PRIMARY KEY (id_internal, target_identifier);
 CREATE INDEX ecli_links_idx ON "ecli_links" (id_internal, target_identifier);
 CREATE INDEX ecli_parts ON "ecli_document" (country, court, year, identifier);
 CREATE INDEX ecli_ecli ON "ecli_document" (ecli);
+CREATE INDEX ecli_search ON "ecli_document" USING GIN (search);
 CREATE INDEX ecli_status ON "ecli_document" (status);
+CREATE INDEX ecli_status_created ON "ecli_document" (status, date_created, id_internal);
 CREATE UNIQUE INDEX ecli_document_ark ON "ecli_document" (ark);
@@ -0,0 +1,17 @@
+DROP INDEX IF EXISTS jobs_pending;
+DROP TABLE IF EXISTS jobs;
+
+CREATE TABLE "jobs" (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 8,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    locked_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    date_created TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+-- Claimable jobs, in order
+CREATE INDEX jobs_pending ON jobs (run_at, id) WHERE status IN ('queued', 'running');
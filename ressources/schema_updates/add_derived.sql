@@ -0,0 +1,7 @@
+-- Artifacts derived from the text when a document is written
+-- Existing documents are filled in with `poetry run backfill`
+ALTER TABLE ecli_document
+    ADD COLUMN html TEXT,
+    ADD COLUMN pages JSONB,
+    ADD COLUMN stats JSONB
+;
@@ -0,0 +1,21 @@
+-- Durable job queue (see jobs_schema.sql)
+CREATE TABLE "jobs" (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 8,
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    locked_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    date_created TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX jobs_pending ON jobs (run_at, id) WHERE status IN ('queued', 'running');
+
+-- Documents whose ark minting was lost (their vocabulary terms are unknown)
+INSERT INTO jobs (kind, payload)
+SELECT 'ark', jsonb_build_object('id_internal', id_internal, 'terms', '[]'::jsonb)
+FROM ecli_document
+WHERE ark IS NULL
+AND status != 'deleted';
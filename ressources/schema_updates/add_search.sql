@@ -0,0 +1,16 @@
+-- Full text search
+-- Text search configuration of a document language
+CREATE OR REPLACE FUNCTION ecli_regconfig(lang TEXT) RETURNS regconfig AS $$
+    SELECT CASE UPPER(lang)
+        WHEN 'FR' THEN 'french'::regconfig
+        WHEN 'NL' THEN 'dutch'::regconfig
+        WHEN 'DE' THEN 'german'::regconfig
+        ELSE 'simple'::regconfig
+    END
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Kept up to date by postgres on every insert / update (PostgreSQL 12+)
+ALTER TABLE ecli_document
+    ADD COLUMN search tsvector GENERATED ALWAYS AS (to_tsvector(ecli_regconfig(lang), COALESCE(text, ''))) STORED
+;
+CREATE INDEX ecli_search ON "ecli_document" USING GIN (search);
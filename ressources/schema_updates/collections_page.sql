@@ -0,0 +1,2 @@
+-- Collections are paginated on (date_created, id_internal) within a status
+CREATE INDEX ecli_status_created ON "ecli_document" (status, date_created, id_internal);
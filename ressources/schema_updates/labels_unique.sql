@@ -0,0 +1,16 @@
+-- One row per label, so labels can be upserted
+-- Merge duplicates first : curated labels win over user defined ones, then the oldest
+DELETE FROM labels
+WHERE id_internal IN (
+    SELECT id_internal FROM (
+        SELECT
+            id_internal,
+            ROW_NUMBER() OVER (
+                PARTITION BY label
+                ORDER BY category = 'user_defined', id_internal
+            ) AS rank
+        FROM labels
+    ) AS ranked
+    WHERE rank > 1
+);
+CREATE UNIQUE INDEX labels_label_idx ON labels (label);
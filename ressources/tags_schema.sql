@@ -5,6 +5,7 @@ DROP INDEX IF EXISTS trgm_tags_idx;
 DROP TABLE IF EXISTS tags;
 --
 DROP INDEX IF EXISTS trgm_labels_idx;
+DROP INDEX IF EXISTS labels_label_idx;
 DROP TABLE IF EXISTS labels;
 CREATE EXTENSION pg_trgm;
 
@@ -17,4 +18,5 @@ CREATE TABLE "labels" (
 );
 -- Use a pirate-worthy index type !
 CREATE INDEX trgm_labels_idx ON labels USING GIN (label gin_trgm_ops);
+CREATE UNIQUE INDEX labels_label_idx ON labels (label);
 INSERT INTO labels (label, category) VALUES ('COVID-19', 'pilot'), ('anatocisme', 'pilot'), ('2020', 'year');
@@ -0,0 +1,74 @@
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+
+class FakeDb:
+    """
+    Stand-in for a pooled connection: records the queries it gets and answers
+    `rows`, or what the handler given for the method (fetch=..., fetchval=...)
+    returns when called with the query and its arguments.
+    """
+    def __init__(self, rows=(), fail=None, **handlers):
+        self.rows = list(rows)
+        self.fail = fail
+        self.handlers = handlers
+        self.calls = []
+        self.sql = []
+        self.in_transaction = False
+
+    async def _run(self, method, sql, args, default):
+        if self.fail:
+            raise self.fail
+        self.calls.append((method, args))
+        self.sql.append(sql)
+        if method in self.handlers:
+            return self.handlers[method](sql, *args)
+        return default
+
+    async def fetch(self, sql, *args):
+        return await self._run('fetch', sql, args, self.rows)
+
+    async def fetchrow(self, sql, *args):
+        return await self._run('fetchrow', sql, args, self.rows[0] if self.rows else None)
+
+    async def fetchval(self, sql, *args):
+        return await self._run('fetchval', sql, args, None)
+
+    async def execute(self, sql, *args):
+        return await self._run('execute', sql, args, None)
+
+    async def executemany(self, sql, args):
+        if self.fail:
+            raise self.fail
+        self.calls.append(('executemany', args))
+        self.sql.append(sql)
+
+    async def prepare(self, sql):
+        return await self._run('prepare', sql, (), None)
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+
+    def queries(self, method, start=''):
+        """
+        Arguments of the `method` calls whose query starts with `start`
+        """
+        return [
+            args for sql, (name, args) in zip(self.sql, self.calls)
+            if name == method and sql.strip().startswith(start)
+        ]
+
+
+def patch_db(module, db):
+    """
+    Make `module.oj_db()` hand out `db`
+    """
+    @asynccontextmanager
+    async def oj_db():
+        yield db
+    return patch.object(module, 'oj_db', oj_db)
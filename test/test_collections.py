@@ -0,0 +1,51 @@
+from datetime import datetime
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+
+import data_api.lib_sql as OJSql
+import data_api.main as OJMain
+from data_api.routers.collections import Collections
+
+from .conftest import FakeDb
+
+ROW = {
+    'id': 1,
+    'date_created': datetime(2022, 1, 1),
+    'ecli': 'ECLI:BE:RSCE:2010:1',
+    'status': 'public',
+    'appeal': 'nodata',
+    'lang': 'FR',
+    'date_updated': None,
+}
+
+
+def page(fields=None, after=None):
+    return {'after': after, 'after_id': 1 if after else None, 'limit': 10, 'fields': fields}
+
+
+class TestCollectionsFunctions(IsolatedAsyncioTestCase):
+
+    async def testSlim(self):
+        db = FakeDb([ROW])
+        res = await Collections._by_status('public', db, page(['ecli', 'status']))
+        self.assertEqual(res, [{'id': 1, 'date_created': ROW['date_created'], 'ecli': ROW['ecli'], 'status': 'public'}])
+
+        await Collections._by_status('public', db, page(['ecli'], after=datetime(2022, 1, 1)))
+        self.assertEqual(db.sql, [OJSql.STATEMENTS['collection_slim'], OJSql.STATEMENTS['collection_slim_after']])
+        self.assertNotIn('meta', db.sql[0])
+
+    async def testMeta(self):
+        db = FakeDb([{**ROW, 'meta': {'labels': []}}])
+        res = await Collections._by_status('public', db, page())
+        self.assertEqual(res[0]['meta'], {'labels': []})
+        await Collections._by_status('public', db, page(['meta']))
+        self.assertEqual(db.sql, [OJSql.STATEMENTS['collection']] * 2)
+
+    async def testCursorExposed(self):
+        # Readable by the cross origin moderation ui
+        transport = httpx.ASGITransport(app=OJMain.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://api') as client:
+            res = await client.get('/unknown', headers={'Origin': 'http://ui.example.com'})
+        exposed = [h.strip() for h in res.headers['access-control-expose-headers'].split(',')]
+        self.assertEqual(exposed, ['X-Next-Cursor', 'Link'])
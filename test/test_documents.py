@@ -0,0 +1,96 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+import data_api.lib_nav as OJNav
+import data_api.lib_sql as OJSql
+import data_api.routers.documents as OJDocuments
+from data_api.models import UpdateModel, User
+
+from .conftest import FakeDb
+
+ADMIN = User(email='admin@example.com', username='admin', valid=True, admin=True)
+
+
+def document_db(status='new'):
+    rows = {
+        OJSql.STATEMENTS['document_lock']: {
+            'status': status,
+            'ecli': 'ECLI:BE:RSCE:2010:1',
+            'text': 'Ancien texte.',
+            'country': 'BE',
+            'court': 'RSCE',
+            'year': 2010,
+            'identifier': '1',
+            'hash': 'abc',
+        },
+        OJSql.STATEMENTS['page_by_hash']: {
+            'html': '<p>Ancien texte.</p>',
+            'text': None,
+            'labels': [],
+            'links': None,
+            'appeal': 'nodata',
+            'hash': 'abc',
+        },
+    }
+    return FakeDb(
+        fetchrow=lambda sql, *args: rows.get(sql),
+        fetchval=lambda sql, *args: 'author-key',
+    )
+
+
+def update_query(status):
+    return UpdateModel(**{
+        '_v': 1,
+        '_timestamp': 1239120938,
+        'country': 'BE',
+        'court': 'RSCE',
+        'year': 2010,
+        'identifier': '1',
+        'text': 'Nouveau texte.',
+        'lang': 'FR',
+        'appeal': 'nodata',
+        'status': status,
+        'doc_links': [],
+        'labels': [],
+    })
+
+
+class TestDocumentsUpdate(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.nav = patch.dict(OJNav.TREE, clear=True)
+        self.nav.start()
+
+    def tearDown(self):
+        self.nav.stop()
+
+    async def testPublishMail(self):
+        db = document_db()
+        queued = []
+
+        async def notify_key(db, user_key, template, data):
+            queued.append((user_key, template, db.in_transaction))
+
+        with patch.object(OJDocuments, 'notify_key', notify_key):
+            await OJDocuments.update(1, update_query('public'), ADMIN, db)
+            # No mail when the status does not change
+            await OJDocuments.update(1, update_query('new'), ADMIN, document_db())
+
+        # Queued in the transaction of the status change, the author is looked up by the worker
+        self.assertEqual(queued, [('author-key', 'publish_doc', True)])
+
+    async def testUnknown(self):
+        db = FakeDb()
+        with self.assertRaises(HTTPException) as ctx:
+            await OJDocuments.update(404, update_query('public'), ADMIN, db)
+        self.assertEqual(ctx.exception.status_code, 404)
+        self.assertEqual([name for name, _ in db.calls], ['fetchrow'])
+
+    async def testStaleVariants(self):
+        dropped = []
+        with patch.object(OJDocuments, 'variant_drop', lambda *etags: dropped.extend(etags)):
+            await OJDocuments.update(1, update_query('new'), ADMIN, document_db())
+        # The /html/{ecli} and /hash pages, and the text
+        self.assertEqual(len(set(dropped)), 3)
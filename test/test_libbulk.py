@@ -0,0 +1,43 @@
+import json
+from unittest import IsolatedAsyncioTestCase
+
+import data_api.lib_bulk as OJBulk
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+DOC = {
+    '_v': 1,
+    '_timestamp': 1239120938,
+    'country': 'BE',
+    'court': 'RSCE',
+    'year': 2010,
+    'identifier': '999.999',
+    'text': 'Lorem Ipsum ...',
+    'lang': 'NL',
+    'appeal': 'nodata',
+    'user_key': 'OIJAS-OIQWE',
+    'doc_links': [],
+    'labels': [],
+    'terms': [],
+}
+
+
+class TestLibBulkFunctions(IsolatedAsyncioTestCase):
+
+    async def testSplitLines(self):
+        lines = [line async for line in OJBulk.split_lines(stream(b'a\nb', b'c\n', b'\nd'))]
+        self.assertEqual(lines, [b'a', b'bc', b'', b'd'])
+
+    async def testReadRecords(self):
+        lines = stream(json.dumps(DOC), '', '{"country": "BE"}', 'not json', '[1]')
+        res = [r async for r in OJBulk.read_records(lines)]
+        self.assertEqual([r[0] for r in res], [1, 3, 4, 5])
+        self.assertEqual(res[0][1].identifier, '999.999')
+        self.assertIsNone(res[0][2])
+        for num, record, error in res[1:]:
+            self.assertIsNone(record)
+            self.assertTrue(error)
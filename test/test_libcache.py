@@ -0,0 +1,73 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from data_api.lib_cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLibCacheFunctions(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.calls = 0
+
+    async def load(self, value):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if value == 'bad':
+            raise KeyError(value)
+        if value == 'error':
+            raise RuntimeError(value)
+        return value.upper()
+
+    async def testTTL(self):
+        cache = TTLCache(ttl=10, clock=self.clock)
+        self.assertEqual(await cache.get('a', self.load, 'a'), 'A')
+        self.assertEqual(await cache.get('a', self.load, 'a'), 'A')
+        self.assertEqual(self.calls, 1)
+        self.clock.now = 11
+        await cache.get('a', self.load, 'a')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(cache.stats(), {'size': 1, 'hits': 1, 'misses': 2})
+
+    async def testLRU(self):
+        cache = TTLCache(maxsize=2, clock=self.clock)
+        await cache.get('a', self.load, 'a')
+        await cache.get('b', self.load, 'b')
+        await cache.get('a', self.load, 'a')
+        await cache.get('c', self.load, 'c')
+        self.assertEqual(len(cache), 2)
+        await cache.get('a', self.load, 'a')
+        self.assertEqual(self.calls, 3)
+        await cache.get('b', self.load, 'b')
+        self.assertEqual(self.calls, 4)
+
+    async def testNegative(self):
+        cache = TTLCache(ttl=10, negative_ttl=2, negative=(KeyError,), clock=self.clock)
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                await cache.get('bad', self.load, 'bad')
+        self.assertEqual(self.calls, 1)
+        self.clock.now = 3
+        with self.assertRaises(KeyError):
+            await cache.get('bad', self.load, 'bad')
+        self.assertEqual(self.calls, 2)
+
+        # Other errors are not cached
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                await cache.get('error', self.load, 'error')
+        self.assertEqual(self.calls, 4)
+
+    async def testSingleFlight(self):
+        cache = TTLCache(clock=self.clock)
+        res = await asyncio.gather(*[cache.get('a', self.load, 'a') for _ in range(5)])
+        self.assertEqual(res, ['A'] * 5)
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,42 @@
+from unittest import IsolatedAsyncioTestCase
+
+import data_api.lib_db as OJDb
+from data_api.models import DocLinkType
+
+from .conftest import FakeDb
+
+
+def link(identifier, label='x', kind='ecli'):
+    return DocLinkType(kind=kind, link=identifier, label=label)
+
+
+class TestLibDbFunctions(IsolatedAsyncioTestCase):
+
+    async def testUpsertLabels(self):
+        db = FakeDb()
+        await OJDb.upsert_labels(db, [])
+        self.assertEqual(db.calls, [])
+        await OJDb.upsert_labels(db, ['a', 'b', 'a'])
+        self.assertEqual(db.calls, [('execute', (['a', 'b', 'a'], 'user_defined'))])
+
+    async def testWriteLinksNew(self):
+        db = FakeDb()
+        await OJDb.write_links(db, 1, [link('a'), link('b')], replace=False)
+        self.assertEqual(db.calls, [('executemany', [(1, 'ecli', 'a', 'x'), (1, 'ecli', 'b', 'x')])])
+
+    async def testWriteLinksDiff(self):
+        db = FakeDb([
+            {'target_identifier': 'a', 'target_type': 'ecli', 'target_label': 'x'},
+            {'target_identifier': 'b', 'target_type': 'ecli', 'target_label': 'x'},
+            {'target_identifier': 'c', 'target_type': 'ecli', 'target_label': 'x'},
+        ])
+        await OJDb.write_links(db, 1, [link('a'), link('b', 'y'), link('d', kind='eli')])
+        self.assertEqual(db.calls[1:], [
+            ('execute', (1, ['c'])),
+            ('executemany', [(1, 'ecli', 'b', 'y'), (1, 'eli', 'd', 'x')]),
+        ])
+
+    async def testWriteLinksUnchanged(self):
+        db = FakeDb([{'target_identifier': 'a', 'target_type': 'ecli', 'target_label': 'x'}])
+        await OJDb.write_links(db, 1, [link('a')])
+        self.assertEqual(len(db.calls), 1)
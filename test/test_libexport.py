@@ -0,0 +1,36 @@
+import json
+from datetime import datetime
+from unittest import TestCase
+
+import data_api.lib_export as OJExport
+
+
+class TestLibExportFunctions(TestCase):
+
+    def testQuery(self):
+        sql, args = OJExport.export_query()
+        self.assertEqual(args, [])
+        self.assertNotIn('$1', sql)
+
+        since = datetime(2022, 1, 1)
+        sql, args = OJExport.export_query(year=2020, since=since)
+        self.assertEqual(args, [2020, since])
+        self.assertIn('year = $1', sql)
+        self.assertIn('date_updated >= $2', sql)
+
+    def testLine(self):
+        line = OJExport.export_line({
+            'ecli': 'ECLI:BE:RSCE:2010:1',
+            'text': 'Décision',
+            'labels': ['a'],
+            'links': None,
+            'date_updated': datetime(2022, 1, 1),
+        })
+        self.assertTrue(line.endswith('\n'))
+        self.assertEqual(json.loads(line), {
+            'ecli': 'ECLI:BE:RSCE:2010:1',
+            'text': 'Décision',
+            'labels': ['a'],
+            'links': [],
+            'date_updated': '2022-01-01T00:00:00',
+        })
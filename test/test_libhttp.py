@@ -0,0 +1,63 @@
+from datetime import datetime
+from unittest import TestCase
+
+import pytz
+from starlette.requests import Request
+
+import data_api.lib_http as OJHttp
+
+
+def request(**headers):
+    return Request({
+        'type': 'http',
+        'headers': [(k.replace('_', '-').encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+class TestLibHttpFunctions(TestCase):
+    DOC = {
+        'date_created': datetime(2021, 1, 1, 12, 0, 0, 500, tzinfo=pytz.utc),
+        'date_updated': None,
+    }
+
+    def testEtag(self):
+        self.assertEqual(OJHttp.make_etag('txt', 'abc'), OJHttp.make_etag('txt', 'abc'))
+        self.assertNotEqual(OJHttp.make_etag('txt', 'abc'), OJHttp.make_etag('tex', 'abc'))
+        self.assertTrue(OJHttp.make_etag('txt').startswith('"'))
+
+    def testHeaders(self):
+        headers = OJHttp.cache_headers('"x"', self.DOC)
+        self.assertEqual(headers['Last-Modified'], 'Fri, 01 Jan 2021 12:00:00 GMT')
+        self.assertTrue(headers['Cache-Control'].startswith('public'))
+        headers = OJHttp.cache_headers('"x"', self.DOC, public=False)
+        self.assertEqual(headers['Cache-Control'], 'private, no-cache')
+
+    def testFresh(self):
+        headers = OJHttp.cache_headers('"x"', self.DOC)
+        self.assertFalse(OJHttp.is_fresh(request(), headers))
+        self.assertTrue(OJHttp.is_fresh(request(if_none_match='"y", "x"'), headers))
+        self.assertFalse(OJHttp.is_fresh(request(if_none_match='"y"'), headers))
+        self.assertTrue(OJHttp.is_fresh(request(if_modified_since='Fri, 01 Jan 2021 12:00:00 GMT'), headers))
+        self.assertFalse(OJHttp.is_fresh(request(if_modified_since='Fri, 01 Jan 2021 11:59:59 GMT'), headers))
+        self.assertFalse(OJHttp.is_fresh(request(if_modified_since='garbage'), headers))
+        # If-None-Match takes precedence
+        self.assertFalse(OJHttp.is_fresh(request(
+            if_none_match='"y"',
+            if_modified_since='Fri, 01 Jan 2021 12:00:00 GMT'
+        ), headers))
+
+    def testVariantTag(self):
+        headers = OJHttp.cache_headers('"x"', self.DOC)
+        self.assertEqual(OJHttp.variant_headers(headers, 'gzip')['ETag'], '"x-gzip"')
+        self.assertTrue(OJHttp.is_fresh(request(if_none_match='"x-gzip"'), headers))
+        self.assertTrue(OJHttp.is_fresh(request(if_none_match='W/"x-br"'), headers))
+
+    def testAcceptedEncoding(self):
+        self.assertIsNone(OJHttp.accepted_encoding(''))
+        self.assertIsNone(OJHttp.accepted_encoding('identity'))
+        self.assertEqual(OJHttp.accepted_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(OJHttp.accepted_encoding('gzip;q=0'))
+        if OJHttp.brotli:
+            self.assertEqual(OJHttp.accepted_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(OJHttp.accepted_encoding('br;q=0.5, gzip'), 'gzip')
+            self.assertEqual(OJHttp.accepted_encoding('*'), 'br')
@@ -0,0 +1,65 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import data_api.lib_jobs as OJJobs
+
+from .conftest import FakeDb, patch_db
+
+
+def queue_db(jobs=()):
+    queue = list(jobs)
+
+    def claim(sql, limit, lock_timeout):
+        claimed = queue[:limit]
+        del queue[:limit]
+        return claimed
+    return FakeDb(fetch=claim)
+
+
+def job(id, kind='test', attempts=1, max_attempts=3, **payload):
+    return {'id': id, 'kind': kind, 'payload': payload, 'attempts': attempts, 'max_attempts': max_attempts}
+
+
+class TestLibJobsFunctions(IsolatedAsyncioTestCase):
+
+    def testBackoff(self):
+        base = OJJobs.config.key(['jobs', 'backoff'])
+        for attempts in (1, 2, 5):
+            delay = OJJobs.backoff(attempts)
+            self.assertGreaterEqual(delay, base * 2 ** (attempts - 1) / 2)
+            self.assertLessEqual(delay, base * 2 ** (attempts - 1))
+
+    async def testFail(self):
+        db = FakeDb()
+        await OJJobs.fail(db, job(1, attempts=1), 'boom')
+        await OJJobs.fail(db, job(2, attempts=3), 'boom')
+        updated = db.queries('execute', 'UPDATE')
+        self.assertEqual([u[1] for u in updated], ['queued', 'dead'])
+        self.assertGreater(updated[0][2], 0)
+        self.assertEqual(updated[1][2], 0)
+
+    async def testWork(self):
+        done = []
+
+        async def handler(n):
+            if n == 2:
+                raise ValueError('bad document')
+            done.append(n)
+
+        db = queue_db([job(i, n=i) for i in range(1, 6)] + [job(6, kind='unknown')])
+        with patch.dict(OJJobs.HANDLERS, {'test': handler}), patch_db(OJJobs, db):
+            await OJJobs.work(concurrency=2, batch=2, once=True)
+
+        self.assertEqual(sorted(done), [1, 3, 4, 5])
+        self.assertEqual(sorted(d[0] for d in db.queries('execute', 'DELETE')), [1, 3, 4, 5])
+        self.assertEqual(sorted(u[0] for u in db.queries('execute', 'UPDATE')), [2, 6])
+
+    async def testMetrics(self):
+        db = FakeDb([{'kind': 'ark', 'status': 'queued', 'count': 3, 'age': 12.5}])
+        with patch_db(OJJobs, db), patch.object(OJJobs.deps, 'DB_POOL', True), \
+                patch.dict(OJJobs._BACKLOG_READ, {'at': None}):
+            await OJJobs.jobs_metrics()
+            await OJJobs.jobs_metrics()
+        self.assertEqual(len(db.calls), 1)
+        self.assertEqual(OJJobs.BACKLOG.values[('ark', 'queued')], 3)
+        self.assertEqual(OJJobs.BACKLOG_AGE.values[('ark',)], 12.5)
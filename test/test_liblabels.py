@@ -0,0 +1,24 @@
+from unittest import TestCase
+
+import data_api.lib_labels as OJLabels
+
+
+class TestLibLabelsFunctions(TestCase):
+
+    def setUp(self):
+        OJLabels.KEYS = []
+        OJLabels.LABELS = []
+        OJLabels.USAGE = {}
+        OJLabels.add(['Éducation', 'école', 'Ecologie', 'arrêt'])
+        OJLabels.add(['Ecologie'])
+        OJLabels.add(['Economie'], used=False)
+
+    def testNormalize(self):
+        self.assertEqual(OJLabels.normalize('ÉcoLe Größe'), 'ecole grosse')
+
+    def testSearch(self):
+        self.assertEqual(OJLabels.search('ec'), ['Ecologie', 'école', 'Economie'])
+        self.assertEqual(OJLabels.search('É'), ['Ecologie', 'Éducation', 'école', 'Economie'])
+        self.assertEqual(OJLabels.search('ARRET'), ['arrêt'])
+        self.assertEqual(OJLabels.search('e', limit=1), ['Ecologie'])
+        self.assertEqual(OJLabels.search('z'), [])
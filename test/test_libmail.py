@@ -0,0 +1,85 @@
+from smtplib import SMTPServerDisconnected
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import data_api.lib_mail as OJMail
+from data_api.models import User
+
+from .conftest import FakeDb
+
+
+class FakeSMTP:
+    sessions = []
+
+    def __init__(self, host, port, timeout):
+        self.sent = []
+        self.closed = False
+        FakeSMTP.sessions.append(self)
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, mFrom, mTo, msg):
+        if self.closed:
+            raise SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(mTo)
+
+    def quit(self):
+        self.closed = True
+
+
+class TestLibMailFunctions(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        FakeSMTP.sessions = []
+        OJMail._SMTP = None
+
+    async def testNotify(self):
+        db = FakeDb()
+        user = User(email='a@example.com', username='a', valid=True, admin=False)
+        await OJMail.notify(db, user, 'publish_doc', {'ecli': 'ECLI:BE:X:2020:1'})
+        self.assertEqual([args[:2] for _, args in db.calls], [('mail', {
+            'email': 'a@example.com',
+            'username': 'a',
+            'template': 'publish_doc',
+            'data': {'ecli': 'ECLI:BE:X:2020:1'},
+        })])
+        with self.assertRaises(KeyError):
+            await OJMail.notify(db, user, 'unknown', {})
+
+    async def testNotifyKey(self):
+        db = FakeDb()
+        await OJMail.notify_key(db, 'author-key', 'publish_doc', {'ecli': 'ECLI:BE:X:2020:1'})
+        self.assertEqual([args[:2] for _, args in db.calls], [('mail', {
+            'user_key': 'author-key',
+            'template': 'publish_doc',
+            'data': {'ecli': 'ECLI:BE:X:2020:1'},
+        })])
+
+        sent = []
+
+        async def get_user_by_key(key):
+            return User(email=f'{key}@example.com', username=key, valid=True, admin=False)
+
+        async def send_mail(mTo, mSubject, mBody, mAttach):
+            sent.append((mTo, 'author-key' in mBody))
+
+        with patch.object(OJMail, 'get_user_by_key', get_user_by_key), \
+                patch.object(OJMail, 'send_mail', send_mail):
+            await OJMail.send_notification(**db.calls[0][1][1])
+        self.assertEqual(sent, [('author-key@example.com', True)])
+
+    async def testSessionReuse(self):
+        with patch.object(OJMail, 'SMTP', FakeSMTP):
+            await OJMail.send_mail('a@example.com', 'subject', '<p>body</p>', [])
+            await OJMail.send_mail('b@example.com', 'subject', '<p>body</p>', [])
+            self.assertEqual(len(FakeSMTP.sessions), 1)
+
+            # Closed by the server: reconnect once
+            FakeSMTP.sessions[0].closed = True
+            await OJMail.send_mail('c@example.com', 'subject', '<p>body</p>', [])
+            self.assertEqual(len(FakeSMTP.sessions), 2)
+            self.assertEqual(FakeSMTP.sessions[1].sent, ['c@example.com'])
+
+            OJMail.close_smtp()
+            self.assertIsNone(OJMail._SMTP)
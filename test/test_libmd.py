@@ -0,0 +1,99 @@
+import shutil
+from unittest import IsolatedAsyncioTestCase, TestCase, skipUnless
+
+import data_api.lib_md as OJMd
+from bench.corpus import decision
+from data_api.lib_parse import pandoc2latex
+
+# Expected output comes from pandoc 3, after the lib_parse clean up passes
+PARITY = [
+    ("Le tribunal, après en avoir délibéré,\nrend l'arrêt suivant.",
+     "Le tribunal, après en avoir délibéré,\nrend l'arrêt suivant."),
+    ('# Faits\n\nLa partie requérante expose ce qui suit.',
+     '\\section{Faits}\n\nLa partie requérante expose ce qui suit.'),
+    ('## En droit\nLe moyen est fondé.',
+     '\\subsection{En droit}\n\nLe moyen est fondé.'),
+    ("Il s'agit d'une *première* décision, **définitive** et __exécutoire__.",
+     "Il s'agit d'une \\emph{première} décision, \\textbf{définitive} et \\textbf{exécutoire}."),
+    ('- premier point\n- second point\n  qui continue',
+     '\\begin{itemize}\n\t\\item premier point\n\t\\item second point\n  qui continue\n\\end{itemize}'),
+    ('1. Le recours est recevable.\n2. Il est fondé.',
+     '\\begin{enumerate}\n\\def\\labelenumi{\\arabic{enumi}.}\n'
+     '\t\\item Le recours est recevable.\n\t\\item Il est fondé.\n\\end{enumerate}'),
+    ('5. Suite de la numérotation.\n6. Dernier point.',
+     '\\begin{enumerate}\n\\def\\labelenumi{\\arabic{enumi}.}\n\\setcounter{enumi}{4}\n'
+     '\t\\item Suite de la numérotation.\n\t\\item Dernier point.\n\\end{enumerate}'),
+    ('1. Premier.\n\n2. Second, séparé.',
+     '\\begin{enumerate}\n\\def\\labelenumi{\\arabic{enumi}.}\n'
+     '\t\\item Premier.\n\t\\item Second, séparé.\n\\end{enumerate}'),
+    ('(1) un\n(2) deux',
+     '\\begin{enumerate}\n\\def\\labelenumi{(\\arabic{enumi})}\n\t\\item un\n\t\\item deux\n\\end{enumerate}'),
+    ('Ligne avec saut  \nobligatoire et\\\nune autre.',
+     'Ligne avec saut\\\\\nobligatoire et\\\\\nune autre.'),
+    ("Taux de 50% & frais de 10 $ pour l'article #3 {x}.",
+     "Taux de 50\\% \\& frais de 10 \\$ pour l'article \\#3 \\{x\\}."),
+    ('Voir p. 12, cf. art. 5 et Cass. c. Belgique.',
+     'Voir p.~12, cf.~art. 5 et Cass. c.~Belgique.'),
+    ('Il a dit "non" puis … réfléchi... longuement.',
+     "Il a dit ``non'' puis \\ldots{} réfléchi\\ldots{} longuement."),
+    ('snake_case et x_y_z restent tels quels, _mais pas ceci_.',
+     'snake\\_case et x\\_y\\_z restent tels quels, \\emph{mais pas ceci}.'),
+    ('---1---\n\nTexte de la page deux.\n\n---2---',
+     '---1---\n\nTexte de la page deux.\n\n---2---'),
+    ('I. Introduction et B. Russell.',
+     'I. Introduction et B. Russell.'),
+    ('a < b > c | d [e] ~ f ^ g \\ h',
+     'a \\textless{} b \\textgreater{} c \\textbar{} d {[}e{]} \\textasciitilde{} f \\^{} g ~h'),
+]
+
+UNSUPPORTED = [
+    '> citation',
+    '| a | b |\n|---|---|\n| 1 | 2 |',
+    'Titre\n=====',
+    '- un\n  - deux',
+    '    code',
+    'un [lien](http://example.com)',
+    'du `code`',
+    'a. alpha',
+    'H~2~O',
+    '\\emph{latex}',
+    'II. En droit',
+    'III. Décision\n\nLe recours est rejeté.',
+    'IV. Par ces motifs',
+    'A.  alpha',
+    ' \tTexte',
+]
+
+
+class TestLibMdFunctions(TestCase):
+
+    def testParity(self):
+        for text, expected in PARITY:
+            with self.subTest(text=text):
+                self.assertEqual(OJMd.md2latex(text), expected)
+
+    def testUnsupported(self):
+        for text in UNSUPPORTED:
+            with self.subTest(text=text):
+                with self.assertRaises(OJMd.Unsupported):
+                    OJMd.md2latex(text)
+
+    def testDecision(self):
+        latex = OJMd.md2latex(decision(5000))
+        self.assertTrue(latex.startswith('\\section{Arrêt}'))
+        self.assertIn('---2---', latex)
+
+
+@skipUnless(shutil.which('pandoc'), 'pandoc not installed')
+class TestLibMdPandoc(IsolatedAsyncioTestCase):
+
+    async def testPandocParity(self):
+        for text, _ in PARITY:
+            with self.subTest(text=text):
+                self.assertEqual(OJMd.md2latex(text), (await pandoc2latex(text)).rstrip('\n'))
+
+    async def testPandocCorpus(self):
+        for seed in range(20):
+            text = decision(20000, seed)
+            with self.subTest(seed=seed):
+                self.assertEqual(OJMd.md2latex(text), (await pandoc2latex(text)).rstrip('\n'))
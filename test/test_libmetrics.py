@@ -0,0 +1,69 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import data_api.lib_metrics as OJMetrics
+
+
+class TestLibMetricsFunctions(IsolatedAsyncioTestCase):
+
+    def testHistogram(self):
+        h = OJMetrics.Histogram('test_seconds', 'Test', ('route',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            h.observe(value, '/a')
+        self.assertEqual(h.count('/a'), 4)
+        self.assertEqual(list(h.expose())[2:], [
+            'test_seconds_bucket{route="/a",le="0.1"} 2',
+            'test_seconds_bucket{route="/a",le="1"} 3',
+            'test_seconds_bucket{route="/a",le="+Inf"} 4',
+            'test_seconds_sum{route="/a"} 2.65',
+            'test_seconds_count{route="/a"} 4',
+        ])
+
+    def testLabels(self):
+        c = OJMetrics.Counter('test_total', 'Test', ('path',))
+        c.inc('a"b\\c')
+        c.inc('a"b\\c', amount=2)
+        self.assertEqual(c.get('a"b\\c'), 3)
+        self.assertEqual(list(c.expose())[2], 'test_total{path="a\\"b\\\\c"} 3')
+
+    def testRegister(self):
+        with self.assertRaises(ValueError):
+            OJMetrics.counter('http_responses_total', 'Again')
+
+    async def testExpose(self):
+        gauge = OJMetrics.Gauge('test_gauge', 'Test')
+
+        async def collect():
+            gauge.set(7)
+
+        async def broken():
+            raise ConnectionError('database gone')
+
+        with patch.object(OJMetrics, 'COLLECTORS', [broken, collect]), \
+                patch.dict(OJMetrics.REGISTRY, {'test_gauge': gauge}):
+            text = await OJMetrics.expose()
+        self.assertIn('\ntest_gauge 7\n', text)
+
+    async def testMiddleware(self):
+        async def app(scope, receive, send):
+            scope['endpoint'] = testMiddleware
+            await send({'type': 'http.response.start', 'status': 418, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def send(message):
+            pass
+
+        async def testMiddleware():
+            pass
+
+        await OJMetrics.MetricsMiddleware(app)({'type': 'http', 'method': 'GET'}, None, send)
+        self.assertEqual(OJMetrics.RESPONSES.get('GET', 'testMiddleware', 418), 1)
+        self.assertEqual(OJMetrics.REQUESTS.count('GET', 'testMiddleware'), 1)
+
+    def testRouteName(self):
+        class StaticFiles:
+            pass
+
+        self.assertEqual(OJMetrics.route_name({'endpoint': StaticFiles(), 'root_path': '/static'}), '/static')
+        self.assertEqual(OJMetrics.route_name({'endpoint': self.testRouteName}), 'testRouteName')
+        self.assertEqual(OJMetrics.route_name({}), 'unmatched')
@@ -0,0 +1,22 @@
+from datetime import datetime
+from unittest import TestCase
+
+import pytz
+
+import data_api.lib_misc as OJMisc
+
+
+class TestLibMiscFunctions(TestCase):
+
+    def testCursor(self):
+        date = datetime(2021, 3, 4, 5, 6, 7, 89, tzinfo=pytz.utc)
+        cursor = OJMisc.cursor_encode(date, 42)
+        self.assertNotIn('=', cursor)
+        after, after_id = OJMisc.cursor_decode(cursor)
+        self.assertEqual(datetime.fromisoformat(after), date)
+        self.assertEqual(after_id, 42)
+
+    def testBadCursor(self):
+        for cursor in ('%%', 'abc', 'bm90IGpzb24'):
+            with self.assertRaises(ValueError):
+                OJMisc.cursor_decode(cursor)
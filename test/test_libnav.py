@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+import data_api.lib_nav as OJNav
+
+
+class TestLibNavFunctions(TestCase):
+
+    def setUp(self):
+        OJNav.TREE = {}
+        OJNav.add('BE', 'RSCE', 2010, '1.1')
+        OJNav.add('BE', 'RSCE', 2010, '1.2')
+        OJNav.add('BE', 'RSCE', 2011, '2.1')
+        OJNav.add('BE', 'CASS', 2010, '3.1', 2)
+
+    def testChildren(self):
+        self.assertEqual(OJNav.children(['BE']), ['CASS', 'RSCE'])
+        self.assertEqual(OJNav.children(['BE', 'RSCE']), [2010, 2011])
+        self.assertEqual(OJNav.children(['BE', 'RSCE', 2010]), ['1.1', '1.2'])
+        self.assertEqual(OJNav.children(['BE'], counts=True), [
+            {'name': 'CASS', 'count': 2},
+            {'name': 'RSCE', 'count': 3},
+        ])
+        with self.assertRaises(RuntimeError):
+            OJNav.children(['FR'])
+
+    def testRemove(self):
+        OJNav.remove('BE', 'CASS', 2010, '3.1')
+        self.assertEqual(OJNav.children(['BE', 'CASS', 2010], counts=True), [{'name': '3.1', 'count': 1}])
+        OJNav.remove('BE', 'CASS', 2010, '3.1')
+        self.assertEqual(OJNav.children(['BE']), ['RSCE'])
+        OJNav.remove('BE', 'RSCE', 2011, '2.1')
+        self.assertEqual(OJNav.children(['BE', 'RSCE']), [2010])
+        # Unknown documents are ignored
+        OJNav.remove('FR', 'X', 1, 'y')
+        OJNav.remove('BE', 'RSCE', 2010, 'nope')
+        self.assertEqual(OJNav.children(['BE', 'RSCE', 2010]), ['1.1', '1.2'])
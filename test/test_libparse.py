@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+import data_api.lib_parse as OJParse
+
+
+class TestLibParseFunctions(TestCase):
+    TEXT = "Premier paragraphe\n\n---1---\n\nSecond paragraphe\n----2----\nfin"
+
+    def testPageBreaks(self):
+        # Numbering restarts with every document
+        for _ in range(2):
+            html = OJParse.page_breaks(self.TEXT)
+            self.assertIn('<a name="p1"></a>', html)
+            self.assertIn('<a href="#p2">2</a>', html)
+            self.assertNotIn('p3', html)
+
+    def testPageIndex(self):
+        pages = OJParse.page_index(self.TEXT)
+        self.assertEqual([p['anchor'] for p in pages], ['p1', 'p2'])
+        self.assertEqual([p['label'] for p in pages], ['1', '2'])
+        self.assertTrue(self.TEXT[pages[1]['offset']:].startswith('----2'))
+        self.assertEqual(OJParse.page_index('-------'), [])
+
+    def testDerive(self):
+        derived = OJParse.derive(self.TEXT)
+        self.assertIn('page_bar', derived['html'])
+        self.assertEqual(derived['stats']['pages'], 2)
+        self.assertEqual(derived['stats']['paragraphs'], 3)
+        self.assertEqual(derived['stats']['chars'], len(self.TEXT))
+
+    def testDeriveThreads(self):
+        texts = ['\n\n'.join(
+            f'## Section {num}\n\n{num}. Le **moyen** {doc} est *fondé*.\nSuite du paragraphe {num}.\n\n'
+            f'- point {num}\n- autre point\n\n---{num}---'
+            for num in range(1, 300)
+        ) for doc in range(8)]
+        serial = [OJParse.derive(text)['html'] for text in texts]
+        with ThreadPoolExecutor(8) as pool:
+            for _ in range(3):
+                self.assertEqual(list(pool.map(lambda t: OJParse.derive(t)['html'], texts)), serial)
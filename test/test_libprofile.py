@@ -0,0 +1,98 @@
+import asyncio
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import data_api.lib_metrics as OJMetrics
+import data_api.lib_profile as OJProfile
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def other_request():
+    busy_loop(0.05)
+
+
+class TestLibProfileFunctions(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cfg = patch.dict(OJProfile.config._config['profile'], {
+            'path': self.dir.name,
+            'interval': 0.001,
+            'sample_rate': 0,
+            'keep': 2,
+        })
+        self.cfg.start()
+
+    def tearDown(self):
+        self.cfg.stop()
+        self.dir.cleanup()
+
+    def testSampler(self):
+        sampler = OJProfile.Sampler(0.001)
+        sampler.start()
+        busy_loop(0.05)
+        sampler.stop()
+        self.assertGreater(sampler.samples, 0)
+        self.assertIn('test_libprofile.py:busy_loop', sampler.collapsed())
+
+    async def testSamplerTask(self):
+        sampler = OJProfile.Sampler(0.001, asyncio.current_task())
+        sampler.start()
+        await asyncio.ensure_future(other_request())
+        busy_loop(0.05)
+        sampler.stop()
+        collapsed = sampler.collapsed()
+        # Concurrent requests on the loop are not attributed to the profiled one
+        self.assertNotIn('other_request', collapsed)
+        self.assertIn('<other tasks>', collapsed)
+        self.assertIn('testSamplerTask;test_libprofile.py:busy_loop', collapsed)
+
+    async def call(self, headers=()):
+        histogram = OJMetrics.Histogram('test_stage_seconds', 'Test', ('stage',))
+        sent = []
+
+        async def app(scope, receive, send):
+            histogram.observe(0.25, 'render')
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'ok'})
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/pdf/x', 'query_string': b'', 'headers': list(headers)}
+        await OJProfile.ProfileMiddleware(app)(scope, None, send)
+        return dict(sent[0]['headers']).get(b'x-profile-id')
+
+    async def testSampled(self):
+        with patch.dict(OJProfile.config._config['profile'], {'sample_rate': 1}):
+            profile_id = await self.call()
+        profile = OJProfile.load(profile_id.decode())
+        self.assertEqual(profile['path'], '/pdf/x')
+        self.assertEqual(profile['stages'], [{'metric': 'test_stage_seconds', 'labels': ['render'], 'seconds': 0.25}])
+        self.assertIsNone(OJMetrics.TRACE.get())
+
+        # Only the latest are kept
+        for _ in range(2):
+            with patch.dict(OJProfile.config._config['profile'], {'sample_rate': 1}):
+                await self.call()
+        self.assertIsNone(OJProfile.load(profile_id.decode()))
+
+    async def testAdminOnly(self):
+        self.assertIsNone(await self.call([(b'x-profile', b'1')]))
+
+        async def admin(headers):
+            return True
+
+        with patch.object(OJProfile, 'is_admin', admin):
+            self.assertIsNotNone(await self.call([(b'x-profile', b'1')]))
+
+    def testLoad(self):
+        self.assertIsNone(OJProfile.load('../../etc/passwd'))
+        self.assertIsNone(OJProfile.load('2b5f4b4e-0e8c-4a55-9d57-1b0b4c6a1f00'))
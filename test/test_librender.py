@@ -0,0 +1,74 @@
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import data_api.lib_render as OJRender
+import data_api.main as OJMain
+
+
+class TestLibRenderFunctions(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cfg = patch.dict(OJRender.config._config['render'], {
+            'concurrency': 1,
+            'queue': 1,
+            'timeout': 0.2,
+        })
+        self.cfg.start()
+        OJRender._SLOTS = None
+        OJRender.PENDING = 0
+
+    def tearDown(self):
+        self.cfg.stop()
+        OJRender._SLOTS = None
+
+    async def testRun(self):
+        self.assertEqual(await OJRender.run(['cat'], data=b'texte'), (0, b'texte'))
+        self.assertEqual(OJRender.PENDING, 0)
+
+    async def testTimeout(self):
+        procs = []
+        spawn = asyncio.create_subprocess_exec
+
+        async def create_subprocess_exec(*args, **kwargs):
+            procs.append(await spawn(*args, **kwargs))
+            return procs[-1]
+
+        start = time.perf_counter()
+        with patch.object(OJRender.asyncio, 'create_subprocess_exec', create_subprocess_exec):
+            with self.assertRaises(OJRender.RenderTimeout):
+                await OJRender.run(['sleep', '5'])
+        self.assertLess(time.perf_counter() - start, 2)
+        # Killed, not left running
+        self.assertIsNotNone(procs[0].returncode)
+        self.assertEqual(OJRender.PENDING, 0)
+
+    async def testQueueFull(self):
+        running = asyncio.ensure_future(OJRender.run(['sleep', '0.1']))
+        await asyncio.sleep(0.02)
+        with self.assertRaises(OJRender.RenderBusy):
+            await OJRender.run(['true'])
+        self.assertEqual((await running)[0], 0)
+        self.assertEqual(OJRender.PENDING, 0)
+
+    async def testRelease(self):
+        with self.assertRaises(FileNotFoundError):
+            await OJRender.run(['/nonexistent/pandoc'])
+
+        def broken(text):
+            raise ValueError(text)
+
+        with self.assertRaises(ValueError):
+            await OJRender.call(broken, 'bad input')
+
+        # The only slot was given back both times
+        self.assertEqual(OJRender.PENDING, 0)
+        self.assertEqual(await asyncio.wait_for(OJRender.run(['true']), 1), (0, b''))
+
+    async def testHandlers(self):
+        res = await OJMain.render_busy_handler(None, OJRender.RenderBusy('Render queue is full'))
+        self.assertEqual(res.status_code, 503)
+        self.assertIn('retry-after', res.headers)
+        res = await OJMain.render_timeout_handler(None, OJRender.RenderTimeout('pdflatex timed out'))
+        self.assertEqual(res.status_code, 504)
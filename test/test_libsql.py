@@ -0,0 +1,58 @@
+from unittest import IsolatedAsyncioTestCase
+
+import asyncpg
+
+import data_api.lib_sql as OJSql
+
+from .conftest import FakeDb
+
+
+class FakeStatement:
+    def __init__(self, sql, stale=False):
+        self.sql = sql
+        self.stale = stale
+
+    async def fetchval(self, *args):
+        if self.stale:
+            raise asyncpg.InvalidCachedStatementError('cached plan must not change result type')
+        return ('prepared', self.sql, args)
+
+    async def fetch(self, *args):
+        return []
+
+
+def fake_db(prepared=False):
+    db = FakeDb(fetchval=lambda sql, *args: ('inline', sql, args), prepare=FakeStatement)
+    if prepared:
+        db.statements = {name: FakeStatement(sql) for name, sql in OJSql.STATEMENTS.items()}
+    return db
+
+
+class TestLibSqlFunctions(IsolatedAsyncioTestCase):
+
+    async def testInline(self):
+        res = await OJSql.fetchval(fake_db(), 'document_ukey', 1)
+        self.assertEqual(res, ('inline', OJSql.STATEMENTS['document_ukey'], (1,)))
+
+    async def testPrepared(self):
+        calls = OJSql.DURATION.count('document_ukey')
+        res = await OJSql.fetchval(fake_db(prepared=True), 'document_ukey', 1)
+        self.assertEqual(res, ('prepared', OJSql.STATEMENTS['document_ukey'], (1,)))
+        self.assertEqual(OJSql.stats()['document_ukey']['calls'], calls + 1)
+
+    async def testExecute(self):
+        # Prepared statements have no execute, writes go through fetch
+        self.assertEqual(await OJSql.execute(fake_db(prepared=True), 'document_ark', 'ark', 1), [])
+
+    async def testReprepare(self):
+        db = fake_db(prepared=True)
+        db.statements['document_ukey'].stale = True
+        res = await OJSql.fetchval(db, 'document_ukey', 1)
+        self.assertEqual(res[0], 'prepared')
+        self.assertEqual(db.sql, [OJSql.STATEMENTS['document_ukey']])
+
+    def testJsonbCodec(self):
+        value = {'labels': ['été', 'b'], 'n': 1}
+        data = OJSql.jsonb_encode(value)
+        self.assertEqual(data[0], 1)
+        self.assertEqual(OJSql.jsonb_decode(data), value)
@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+import data_api.lib_store as OJStore
+from data_api.lib_cfg import config
+
+
+def request(encoding):
+    return Request({
+        'type': 'http',
+        'headers': [(b'accept-encoding', encoding.encode())],
+    })
+
+
+class TestLibStorePdf(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.path = config.key(['pdf_store', 'path'])
+        self.tmp = tempfile.TemporaryDirectory()
+        config.set(['pdf_store', 'path'], self.tmp.name)
+        self.renders = []
+
+        async def md2latex(data, template):
+            return data['body']
+
+        async def latex2pdf(latex):
+            self.renders.append(latex)
+            await asyncio.sleep(0.01)
+            return f'%PDF {latex}'.encode()
+
+        self.stubs = [patch.object(OJStore, 'md2latex', md2latex), patch.object(OJStore, 'latex2pdf', latex2pdf)]
+        for stub in self.stubs:
+            stub.start()
+
+    def tearDown(self):
+        for stub in self.stubs:
+            stub.stop()
+        config.set(['pdf_store', 'path'], self.path)
+        self.tmp.cleanup()
+
+    def testKey(self):
+        data = {'body': 'Texte', 'title': 'ECLI:BE:RSCE:2010:1'}
+        self.assertEqual(OJStore.pdf_key(data), OJStore.pdf_key(dict(data)))
+        self.assertNotEqual(OJStore.pdf_key(data), OJStore.pdf_key({**data, 'body': 'Autre texte'}))
+        self.assertNotEqual(OJStore.pdf_key(data), OJStore.pdf_key({**data, 'title': 'ECLI:BE:RSCE:2010:2'}))
+        key = OJStore.pdf_key(data)
+        # The latex engine is part of the key
+        with patch.dict(config._config['render'], {'latex': 'other'}):
+            self.assertNotEqual(OJStore.pdf_key(data), key)
+
+    async def testHitMiss(self):
+        data = {'body': 'Texte', 'title': 'ECLI:BE:RSCE:2010:1'}
+        hits, misses = OJStore.STATS['hits'], OJStore.STATS['misses']
+        path = await OJStore.pdf_get(data)
+        self.assertEqual(await OJStore.pdf_get(data), path)
+        self.assertEqual(self.renders, ['Texte'])
+        self.assertEqual((OJStore.STATS['hits'] - hits, OJStore.STATS['misses'] - misses), (1, 1))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF Texte')
+
+    async def testShared(self):
+        data = {'body': 'Texte', 'title': 'ECLI:BE:RSCE:2010:1'}
+        first, second = await asyncio.gather(OJStore.pdf_get(data), OJStore.pdf_get(data))
+        self.assertEqual(first, second)
+        self.assertEqual(self.renders, ['Texte'])
+        self.assertEqual(OJStore._RENDERING, {})
+
+    async def testSharedCancel(self):
+        # A cancelled request does not cancel the render others wait for
+        data = {'body': 'Texte', 'title': 'ECLI:BE:RSCE:2010:1'}
+        first = asyncio.ensure_future(OJStore.pdf_get(data))
+        second = asyncio.ensure_future(OJStore.pdf_get(data))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertTrue(os.path.exists(await second))
+        self.assertEqual(len(self.renders), 1)
+
+    async def testDrop(self):
+        data = {'body': 'Texte', 'title': 'ECLI:BE:RSCE:2010:1'}
+        path = await OJStore.pdf_get(data)
+        OJStore.pdf_drop(data)
+        self.assertFalse(os.path.exists(path))
+        OJStore.pdf_drop(data)
+        await OJStore.pdf_get(data)
+        self.assertEqual(len(self.renders), 2)
+
+
+class TestLibStoreVariants(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.path = config.key(['pdf_store', 'path'])
+        self.tmp = tempfile.TemporaryDirectory()
+        config.set(['pdf_store', 'path'], self.tmp.name)
+
+    def tearDown(self):
+        config.set(['pdf_store', 'path'], self.path)
+        self.tmp.cleanup()
+
+    async def testVariant(self):
+        text = 'Lorem ipsum dolor sit amet. ' * 200
+        headers = {'ETag': '"abc"'}
+        self.assertIsNone(OJStore.variant_cached(request('gzip'), headers, 'text/plain'))
+
+        res = await OJStore.variant_send(request('gzip'), PlainTextResponse(text, headers=headers), headers)
+        self.assertEqual(res.headers['content-encoding'], 'gzip')
+        self.assertEqual(res.headers['etag'], '"abc-gzip"')
+        with open(res.path, 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(), text)
+
+        cached = OJStore.variant_cached(request('gzip'), headers, 'text/plain')
+        self.assertEqual(cached.path, res.path)
+
+    async def testDrop(self):
+        text = 'Lorem ipsum dolor sit amet. ' * 200
+        headers = {'ETag': '"abc"'}
+        other = {'ETag': '"def"'}
+        await OJStore.variant_send(request('gzip'), PlainTextResponse(text, headers=headers), headers)
+        await OJStore.variant_send(request('gzip'), PlainTextResponse(text, headers=other), other)
+
+        OJStore.variant_drop('"abc"', '"unknown"')
+        self.assertIsNone(OJStore.variant_cached(request('gzip'), headers, 'text/plain'))
+        self.assertIsNotNone(OJStore.variant_cached(request('gzip'), other, 'text/plain'))
+
+    async def testIdentity(self):
+        headers = {'ETag': '"abc"'}
+        response = PlainTextResponse('short', headers=headers)
+        self.assertIs(await OJStore.variant_send(request('gzip'), response, headers), response)
+        response = PlainTextResponse('long' * 1000, headers=headers)
+        self.assertIs(await OJStore.variant_send(request('identity'), response, headers), response)
+        self.assertEqual(response.headers['vary'], 'Accept-Encoding')
@@ -0,0 +1,40 @@
+from unittest import IsolatedAsyncioTestCase
+
+import data_api.lib_views as OJViews
+
+from .conftest import FakeDb, patch_db
+
+
+def flushed(db):
+    return [(sql.split()[5], dict(zip(*args))) for sql, (_, args) in zip(db.sql, db.calls)]
+
+
+class TestLibViewsFunctions(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        for column in OJViews.COLUMNS:
+            OJViews.PENDING[column] = {}
+
+    async def testFlush(self):
+        for _ in range(3):
+            OJViews.hit('views_public', 1)
+        OJViews.hit('views_public', 2)
+        OJViews.hit('views_hash', 2)
+        self.assertEqual(OJViews.pending('views_public', 1), 3)
+        self.assertEqual(OJViews.stats()['pending'], 5)
+
+        db = FakeDb()
+        with patch_db(OJViews, db):
+            await OJViews.flush()
+        self.assertEqual(flushed(db), [
+            ('views_hash', {2: 1}),
+            ('views_public', {1: 3, 2: 1}),
+        ])
+        self.assertEqual(OJViews.stats()['pending'], 0)
+
+    async def testFlushFailure(self):
+        OJViews.hit('views_public', 1)
+        with patch_db(OJViews, FakeDb(fail=ConnectionError('database gone'))):
+            with self.assertRaises(ConnectionError):
+                await OJViews.flush()
+        self.assertEqual(OJViews.pending('views_public', 1), 1)
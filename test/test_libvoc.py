@@ -2,6 +2,7 @@ from unittest import IsolatedAsyncioTestCase
 
 import data_api.lib_voc as OJVoc
 import httpx
+from data_api.lib_cfg import config
 
 
 class TestLibVocFunctions(IsolatedAsyncioTestCase):
@@ -42,3 +43,48 @@ class TestLibVocFunctions(IsolatedAsyncioTestCase):
         getList = await OJVoc.getLinks(docId)
 
         self.assertEqual(sorted(vocIds), sorted(getList))
+
+
+class TestLibVocClient(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.failures = 0
+        self.backoff = config.key(['voc', 'backoff'])
+        config.set(['voc', 'backoff'], 0)
+        self.ark_url = config.key(['ark', 'url'])
+        OJVoc.drop_token()
+        OJVoc.STATS.clear()
+        OJVoc._CLIENT = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    async def asyncTearDown(self):
+        config.set(['voc', 'backoff'], self.backoff)
+        config.set(['ark', 'url'], self.ark_url)
+        await OJVoc.close_client()
+
+    def handler(self, request):
+        self.requests.append(request.url.path)
+        if request.url.path == '/token':
+            return httpx.Response(200, json={'access_token': 'abc', 'expires_in': 600})
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(503)
+        if request.url.path == '/mint':
+            return httpx.Response(200, json={'ark': 'ark:/1/x'})
+        return httpx.Response(200, json={})
+
+    async def testTokenReuse(self):
+        for i in range(3):
+            await OJVoc.setLinks(f'ark:/1/{i}', [])
+        self.assertEqual(self.requests.count('/token'), 1)
+        self.assertEqual(OJVoc.stats()['voc_link_set']['calls'], 3)
+
+    async def testRetry(self):
+        config.set(['ark', 'url'], 'http://ark')
+        self.failures = 2
+        self.assertEqual(await OJVoc.getArkId('http://example.com/doc'), 'ark:/1/x')
+        self.assertEqual(OJVoc.stats()['ark_mint']['calls'], 3)
+        self.assertEqual(OJVoc.stats()['ark_mint']['errors'], 2)
+
+        self.failures = 10
+        self.assertIsNone(await OJVoc.getArkId('http://example.com/doc'))
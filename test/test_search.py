@@ -0,0 +1,17 @@
+from unittest import TestCase
+
+from data_api.routers.search import search_sql
+
+
+class TestSearchFunctions(TestCase):
+
+    def testParameters(self):
+        sql, args = search_sql()
+        self.assertEqual(args, [])
+        self.assertNotIn('$3', sql)
+
+        sql, args = search_sql(court='RSCE', label='covid', after=True)
+        self.assertEqual(args, ['RSCE', 'covid'])
+        self.assertIn('court = $3', sql)
+        self.assertIn("meta->'labels' ? $4", sql)
+        self.assertIn('rank < $5 OR (rank = $5 AND id_internal > $6)', sql)